@@ -5,8 +5,15 @@
 
 import sys
 import os
+import time
 sys.path.append(os.getcwd()) # I guess by default sys.path does not have cwd. not sure if this is the convention though...
-    
+
+# import times reported with --startup_profile, the modules themselves are imported later on demand
+_start = time.perf_counter()
+import tensorflow
+IMPORT_TIMES = {"tensorflow": time.perf_counter() - _start}
+_start = time.perf_counter()
+
 from . import modules, emulators
 
 from .common import (
@@ -21,9 +28,19 @@ from .common import (
     run_intializers,
     run_processes,
     run_finalizers,
+    Profiler,
+    profile,
+    Scheduler,
+    schedule,
+    save_checkpoint,
+    load_checkpoint,
+    register_optimizer,
     setup_igm_modules,
     setup_igm_params,
     add_logger,
     print_gpu_info,
+    print_startup_profile,
     download_unzip_and_store    
 )
+
+IMPORT_TIMES["igm"] = time.perf_counter() - _start
@@ -5,7 +5,7 @@ Copyright (C) 2021-2023 Guillaume Jouvet <guillaume.jouvet@unil.ch>
 Published under the GNU GPL (Version 3), check at the LICENSE file
 """
 
-import os, json
+import os, sys, json
 from json import JSONDecodeError
 import importlib
 import argparse
@@ -16,6 +16,12 @@ from typing import List, Any, Dict, Tuple
 from types import ModuleType
 import logging
 import warnings
+import time
+import csv
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
 import tensorflow as tf
 
@@ -129,6 +135,73 @@ def params_core() -> argparse.ArgumentParser:
         default="data",
         help="The name of the folder where are stored the data (default: %(default)s)",
     )
+    parser.add_argument(
+        "--checkpoint_freq",
+        type=float,
+        default=0,
+        help="Frequency (in years) at which the full state is checkpointed, 0 means never (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--checkpoint_file",
+        type=str,
+        default="checkpoint.npz",
+        help="Name of the checkpoint file (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--restart_from",
+        type=str,
+        default="",
+        help="Checkpoint file to restart the simulation from, no restart if empty (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--startup_profile",
+        action="store_true",
+        default=False,
+        help="Print the import time of IGM, TensorFlow and each module, and the heavy packages they pull in (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--precision",
+        type=str,
+        default="float32",
+        choices=["float32", "mixed_bfloat16", "float64"],
+        help="Floating point precision of the process modules iceflow, thk and vert_flow: float32, mixed_bfloat16 (the emulator computes in bfloat16), or float64 for reference runs (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--graph_step",
+        action="store_true",
+        default=False,
+        help="Trace the process modules that support it (time, iceflow, thk, vert_flow) into a single tf.function per time step (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--graph_step_jit",
+        action="store_true",
+        default=False,
+        help="Compile the graph step with XLA, only used with graph_step (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--profiling",
+        action="store_true",
+        default=False,
+        help="Profile the initialize, update and finalize functions of all modules (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--profiling_sync",
+        action="store_true",
+        default=False,
+        help="Wait for the device to complete at each profiled call to get exact device timings (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--profiling_output",
+        type=str,
+        default="profiling",
+        help="Prefix of the profiling files (JSON, CSV and Chrome trace) (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--profiling_tf_trace_steps",
+        type=list,
+        default=[],
+        help="Time step window [first, last] for which a tf.profiler trace is captured, empty means no trace (default: %(default)s)",
+    )
 
     return parser
 
@@ -160,21 +233,606 @@ def setup_igm_params(
     return params
 
 
+class Profiler:
+    """
+    Records the wall-clock time (and peak TF memory when the device reports it) of
+    named code sections, e.g. the initialize/update/finalize functions of each module.
+    Sections can be nested, and the records can be exported as statistics (JSON, CSV)
+    or as a timeline in the Chrome trace format (chrome://tracing or perfetto).
+    """
+
+    def __init__(self, sync: bool = False, device: str = "GPU:0") -> None:
+        self.sync = sync
+        self.device = device
+        self.events = []
+        self.stack = []
+        self.t0 = time.perf_counter()
+
+    def _sync(self) -> None:
+        if self.sync and hasattr(tf.test.experimental, "sync_devices"):
+            tf.test.experimental.sync_devices()
+
+    def _reset_memory(self) -> None:
+        try:
+            tf.config.experimental.reset_memory_stats(self.device)
+        except (ValueError, RuntimeError):
+            pass
+
+    def _peak_memory(self) -> int:
+        try:
+            return tf.config.experimental.get_memory_info(self.device)["peak"]
+        except (ValueError, RuntimeError):
+            return 0
+
+    @contextmanager
+    def record(self, name: str, phase: str = "update"):
+        self._sync()
+        if not self.stack:
+            self._reset_memory()
+        self.stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._sync()
+            end = time.perf_counter()
+            self.stack.pop()
+            self.events.append(
+                {
+                    "name": name,
+                    "phase": phase,
+                    "depth": len(self.stack),
+                    "start": start - self.t0,
+                    "duration": end - start,
+                    "peak_memory": self._peak_memory(),
+                }
+            )
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Returns count, total, mean, p50, p95 and peak memory for each (name, phase)."""
+        groups = {}
+        for e in self.events:
+            groups.setdefault(e["name"] + ":" + e["phase"], []).append(e)
+
+        stats = {}
+        for key, events in groups.items():
+            durations = np.array([e["duration"] for e in events])
+            stats[key] = {
+                "name": events[0]["name"],
+                "phase": events[0]["phase"],
+                "count": len(durations),
+                "total": float(np.sum(durations)),
+                "mean": float(np.mean(durations)),
+                "p50": float(np.percentile(durations, 50)),
+                "p95": float(np.percentile(durations, 95)),
+                "peak_memory": int(max(e["peak_memory"] for e in events)),
+            }
+        return stats
+
+    def to_json(self, filename: str) -> None:
+        with open(filename, "w") as f:
+            json.dump(self.stats(), f, indent=2)
+
+    def to_csv(self, filename: str) -> None:
+        fields = ["name", "phase", "count", "total", "mean", "p50", "p95", "peak_memory"]
+        with open(filename, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for row in self.stats().values():
+                writer.writerow(row)
+
+    def to_chrome_trace(self, filename: str) -> None:
+        trace = [
+            {
+                "name": e["name"],
+                "cat": e["phase"],
+                "ph": "X",
+                "ts": e["start"] * 10**6,
+                "dur": e["duration"] * 10**6,
+                "pid": 0,
+                "tid": 0,
+                "args": {"peak_memory": e["peak_memory"]},
+            }
+            for e in self.events
+        ]
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+    def export(self, prefix: str) -> None:
+        self.to_json(prefix + ".json")
+        self.to_csv(prefix + ".csv")
+        self.to_chrome_trace(prefix + "-trace.json")
+        for ext in [".json", ".csv", "-trace.json"]:
+            os.system("echo rm " + prefix + ext + " >> clean.sh")
+
+
+def _module_name(module: ModuleType) -> str:
+    return module.__name__.split(".")[-1]
+
+
+def profile(state: State, name: str, phase: str = "update"):
+    """Context manager recording a code section if profiling is activated, e.g.
+    with profile(state, "iceflow_retrain"): ..."""
+    if hasattr(state, "profiler"):
+        return state.profiler.record(name, phase)
+    return nullcontext()
+
+
+def _tf_trace(params: Any, state: State, step: int) -> None:
+    # capture a tf.profiler trace between the time steps given in profiling_tf_trace_steps,
+    # step < 0 means the time loop is over and closes any pending trace
+    if len(params.profiling_tf_trace_steps) == 2:
+        first, last = params.profiling_tf_trace_steps
+        tracing = getattr(state, "profiler_tf_tracing", False)
+        if (step == first) & (not tracing):
+            tf.profiler.experimental.start(params.profiling_output + "-tf-trace")
+            state.profiler_tf_tracing = True
+        elif tracing & ((step > last) | (step < 0)):
+            tf.profiler.experimental.stop()
+            state.profiler_tf_tracing = False
+
+
+class Scheduler:
+    """
+    Decides on the host which modules (or tasks of a module) fire at each time step.
+    Modules register in their initialize function with an update frequency, in years
+    or in iterations (unit "it"), a phase, and the modules they depend on, and start
+    their update with "if not state.scheduler.due(name, state): return". A module
+    also fires whenever one of its dependencies fired in the same time step, and
+    modules that did not register fire at every time step.
+
+    In years, the frequency is counted from the last update (the phase is the time
+    of a virtual previous update, by default the module fires at the first step),
+    the time elapsed since the previous update is given by elapsed(name) such that
+    a module can integrate over the skipped time steps. In iterations, the module
+    fires when (it - phase) is a multiple of the frequency.
+
+    The time is read from the device at most once per time step (i.e. per value of
+    state.it), whatever the number of registered modules.
+    """
+
+    def __init__(self) -> None:
+        self.tasks = {}
+        self._it = None
+        self._t = None
+
+    def register(
+        self,
+        name: str,
+        freq: float,
+        phase: float = None,
+        unit: str = "year",
+        depends_on: List[str] = [],
+    ) -> None:
+        assert unit in ["year", "it"]
+        self.tasks[name] = {
+            "freq": freq,
+            "phase": phase,
+            "unit": unit,
+            "depends_on": list(depends_on),
+            "last": None if unit == "it" else phase,
+            "elapsed": None,
+            "fired_at": None,
+            "count": 0,
+        }
+
+    def _now(self, state: State, unit: str) -> float:
+        if unit == "it":
+            return state.it
+        if (self._t is None) or (not self._it == state.it):
+            self._it = state.it
+            self._t = float(state.t.numpy())
+        return self._t
+
+    def time(self, state: State) -> float:
+        """Time of the current time step, read from the device at most once per step."""
+        return self._now(state, "year")
+
+    def due(self, name: str, state: State) -> bool:
+        """Returns whether the module fires now, and records it if so."""
+        if name not in self.tasks:
+            return True
+
+        task = self.tasks[name]
+        now = self._now(state, task["unit"])
+
+        if task["unit"] == "it":
+            fire = (task["last"] is None) or (
+                (now - (task["phase"] or 0)) % task["freq"] == 0
+            )
+        else:
+            fire = (task["last"] is None) or (now - task["last"] >= task["freq"])
+
+        fire |= any(
+            (d in self.tasks) and (self.tasks[d]["fired_at"] == state.it)
+            for d in task["depends_on"]
+        )
+
+        if fire:
+            task["elapsed"] = None if task["last"] is None else now - task["last"]
+            task["last"] = now
+            task["fired_at"] = state.it
+            task["count"] += 1
+
+        return fire
+
+    def elapsed(self, name: str) -> float:
+        """Time (or number of iterations) elapsed between the two last updates."""
+        return self.tasks[name]["elapsed"]
+
+    def state_dict(self) -> Dict[str, Any]:
+        return {name: task["last"] for name, task in self.tasks.items()}
+
+    def load_state_dict(self, last: Dict[str, Any]) -> None:
+        for name, value in last.items():
+            if name in self.tasks:
+                self.tasks[name]["last"] = value
+
+
+def schedule(
+    state: State,
+    name: str,
+    freq: float,
+    phase: float = None,
+    unit: str = "year",
+    depends_on: List[str] = [],
+) -> None:
+    """Register a module (or a task of a module) to the scheduler of the state,
+    e.g. schedule(state, "smb_simple", params.smb_simple_update_freq)"""
+    if not hasattr(state, "scheduler"):
+        state.scheduler = Scheduler()
+    state.scheduler.register(name, freq, phase, unit, depends_on)
+
+
+def _update_module(module: ModuleType, params: Any, state: State) -> None:
+    # scheduled modules check state.scheduler.due at the top of their own update,
+    # such that calling module.update directly respects their frequency as well
+    with profile(state, _module_name(module), "update"):
+        module.update(params, state)
+
+
 def run_intializers(modules: List, params: Any, state: State) -> None:
+    if params.profiling and not hasattr(state, "profiler"):
+        state.profiler = Profiler(sync=params.profiling_sync, device=f"GPU:{params.gpu_id}")
+
+    if not hasattr(state, "scheduler"):
+        state.scheduler = Scheduler()
+
     for module in modules:
-        module.initialize(params, state)
+        with profile(state, _module_name(module), "initialize"):
+            module.initialize(params, state)
+
+    if not params.restart_from == "":
+        load_checkpoint(params.restart_from, state)
 
 
 def run_processes(modules: List, params: Any, state: State) -> None:
     if hasattr(state, "t"):
-        while state.t < params.time_end:
-            for module in modules:
-                module.update(params, state)
+        if params.graph_step:
+            run_processes_graph(modules, params, state)
+        else:
+            step = 0
+            while state.t < params.time_end:
+                if params.profiling:
+                    _tf_trace(params, state, step)
+                for module in modules:
+                    _update_module(module, params, state)
+                _checkpoint_if_due(params, state)
+                step += 1
+            if params.profiling:
+                _tf_trace(params, state, -1)
+
+
+def _split_graph_segments(modules: List) -> List[Tuple[bool, List]]:
+    """Groups consecutive modules that provide an update_graph function."""
+    segments = []
+    for module in modules:
+        fusable = hasattr(module, "update_graph")
+        if segments and segments[-1][0] == fusable:
+            segments[-1][1].append(module)
+        else:
+            segments.append((fusable, [module]))
+    return segments
+
+
+def _state_tensors(state: State) -> Dict[str, tf.Tensor]:
+    # tf.Variable are captured by reference in the graph, only plain tensors are passed
+    return {k: v for k, v in vars(state).items() if isinstance(v, tf.Tensor)}
+
+
+def _build_graph_step(segment: List, params: Any, state: State):
+    """
+    Trace the update_graph functions of a segment of modules into a single tf.function.
+    The state is rebuilt inside the graph from the tensors given as input, all the
+    tensors found in the state after the step are returned and written back.
+    """
+
+    @tf.function(jit_compile=params.graph_step_jit, reduce_retracing=True)
+    def graph_step(fields):
+        graph_state = State()
+        graph_state.__dict__.update(vars(state))
+        graph_state.__dict__.update(fields)
+        for module in segment:
+            module.update_graph(params, graph_state)
+        return _state_tensors(graph_state)
+
+    return graph_step
+
+
+def run_processes_graph(modules: List, params: Any, state: State) -> None:
+    """
+    Same as run_processes, but the consecutive modules that provide an update_graph
+    function are fused in a single compiled step. Their optional update_graph_host
+    function is called eagerly right before the fused step (e.g. for host-side
+    counters or emulator retraining). The first iteration, which does not advance
+    the time, is done eagerly.
+    """
+    for module in modules:
+        _update_module(module, params, state)
+
+    segments = _split_graph_segments(modules)
+    graph_steps = [
+        _build_graph_step(segment, params, state) if fusable else None
+        for fusable, segment in segments
+    ]
+
+    state.tcomp_graph_step = []
+
+    step = 1
+    while state.t < params.time_end:
+        if params.profiling:
+            _tf_trace(params, state, step)
+        for (fusable, segment), graph_step in zip(segments, graph_steps):
+            if fusable:
+                state.tcomp_graph_step.append(time.time())
+                for module in segment:
+                    if hasattr(module, "update_graph_host"):
+                        with profile(state, _module_name(module), "update_graph_host"):
+                            module.update_graph_host(params, state)
+                with profile(state, "graph_step", "update"):
+                    for k, v in graph_step(_state_tensors(state)).items():
+                        setattr(state, k, v)
+                # the save flag is tested by the eager output modules, read it once
+                if tf.is_tensor(getattr(state, "saveresult", None)):
+                    state.saveresult = bool(state.saveresult.numpy())
+                state.tcomp_graph_step[-1] -= time.time()
+                state.tcomp_graph_step[-1] *= -1
+            else:
+                for module in segment:
+                    _update_module(module, params, state)
+        _checkpoint_if_due(params, state)
+        step += 1
+    if params.profiling:
+        _tf_trace(params, state, -1)
 
 
 def run_finalizers(modules: List, params: Any, state: State) -> None:
     for module in modules:
-        module.finalize(params, state)
+        with profile(state, _module_name(module), "finalize"):
+            module.finalize(params, state)
+
+    if hasattr(state, "profiler"):
+        state.profiler.export(params.profiling_output)
+
+    if hasattr(state, "checkpoint_pending"):
+        state.checkpoint_pending.result()
+
+
+# attributes of the state that are never checkpointed: handles, and caches or
+# compiled functions rebuilt on demand (the scheduler is stored separately)
+_CHECKPOINT_EXCLUDE = [
+    "logger", "profiler", "checkpoint_pending", "scheduler",
+    "fig", "ax", "axes", "cbar", "ip", "profile_tif_file", "flex",
+    "iceflow_forward_cache", "retrain_epoch", "solve_loop", "quantized_emulator",
+    "feature_normalizer", "image_normalizer", "ndvi_emulator", "convexity_weights",
+    # the asynchronous reference solve of the diagnostic mode is not reproducible
+    # (the evaluations skipped while it runs depend on its speed)
+    "diagnostic_executor", "diagnostic_future", "diagnostic_solver",
+]
+
+# attributes skipped by the checkpoints and already reported
+_checkpoint_skipped = set()
+
+_checkpoint_executor = None
+
+
+def _snapshot_state(state: State) -> Dict[str, np.ndarray]:
+    """
+    Copy the state to host memory as a dictionary of numpy arrays: tf.Variable and
+    tensor fields (also in lists), numpy arrays, weights of the keras models (e.g.
+    the emulator), slots of the optimizers, objects with a state_dict method (e.g.
+    the replay buffers), RNG states, while other JSON-serializable attributes
+    (counters, flags, ...) are stored in a metadata entry. The other attributes
+    are skipped, and reported once.
+    """
+    arrays = {}
+    meta = {}
+    for k, v in vars(state).items():
+        if k in _CHECKPOINT_EXCLUDE:
+            continue
+        if isinstance(v, tf.Variable):
+            arrays["var__" + k] = v.numpy()
+        elif isinstance(v, tf.Tensor):
+            if not v.dtype == tf.string:
+                arrays["tensor__" + k] = v.numpy()
+        elif isinstance(v, np.ndarray):
+            arrays["np__" + k] = v
+        elif isinstance(v, tf.keras.Model):
+            for i, w in enumerate(v.get_weights()):
+                arrays["model__" + k + "__" + str(i)] = w
+        elif isinstance(v, (tf.keras.optimizers.legacy.Optimizer, tf.keras.optimizers.Optimizer)):
+            for i, w in enumerate(v.variables()):
+                arrays["opt__" + k + "__" + str(i)] = w.numpy()
+        elif hasattr(v, "state_dict") and hasattr(v, "load_state_dict"):
+            meta["obj__" + k] = {}
+            for key, x in v.state_dict().items():
+                if isinstance(x, np.ndarray):
+                    arrays["obj__" + k + "__" + key] = x
+                else:
+                    meta["obj__" + k][key] = x
+        elif isinstance(v, list) and (len(v) > 0) and all(
+            isinstance(x, (tf.Variable, tf.Tensor)) for x in v
+        ):
+            for i, x in enumerate(v):
+                arrays["list__" + k + "__" + str(i)] = x.numpy()
+        else:
+            try:
+                json.dumps(v)
+                meta[k] = v
+            except (TypeError, ValueError):
+                if k not in _checkpoint_skipped:
+                    _checkpoint_skipped.add(k)
+                    logging.warning("The attribute " + k + " of the state is not checkpointed")
+
+    if hasattr(state, "scheduler"):
+        meta["scheduler__last"] = state.scheduler.state_dict()
+
+    arrays["rng__tf"] = tf.random.get_global_generator().state.numpy()
+    meta["rng__numpy"] = [
+        x.tolist() if isinstance(x, np.ndarray) else x for x in np.random.get_state()
+    ]
+    arrays["meta"] = np.array(json.dumps(meta))
+    return arrays
+
+
+def _write_checkpoint(arrays: Dict[str, np.ndarray], filename: str) -> None:
+    # write to a temporary file first and rename it, so a checkpoint is never left half-written
+    tmpfile = filename + ".tmp"
+    with open(tmpfile, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmpfile, filename)
+
+
+def save_checkpoint(params: Any, state: State, asynchronous: bool = True) -> None:
+    """
+    Checkpoint the full state in params.checkpoint_file. The state is copied to host
+    memory at call time, the file is written by a background thread if asynchronous.
+    """
+    global _checkpoint_executor
+
+    arrays = _snapshot_state(state)
+
+    if hasattr(state, "checkpoint_pending"):
+        state.checkpoint_pending.result()
+
+    if asynchronous:
+        if _checkpoint_executor is None:
+            _checkpoint_executor = ThreadPoolExecutor(max_workers=1)
+        state.checkpoint_pending = _checkpoint_executor.submit(
+            _write_checkpoint, arrays, params.checkpoint_file
+        )
+    else:
+        _write_checkpoint(arrays, params.checkpoint_file)
+
+
+def _checkpoint_if_due(params: Any, state: State) -> None:
+    if params.checkpoint_freq > 0:
+        t = float(state.t.numpy())
+        if not hasattr(state, "tlast_checkpoint"):
+            state.tlast_checkpoint = t
+        elif t - state.tlast_checkpoint >= params.checkpoint_freq:
+            state.tlast_checkpoint = t
+            save_checkpoint(params, state)
+
+
+def register_optimizer(state: State, name: str, variables: List[str]) -> None:
+    """
+    Record the attributes of the state on which the optimizer state.<name> is
+    built (tf.Variable fields, or keras models for their trainable variables),
+    in the order of its var_list, such that its slots can be rebuilt on exactly
+    these variables when restarting from a checkpoint.
+    """
+    if not hasattr(state, "optimizer_variables"):
+        state.optimizer_variables = {}
+    state.optimizer_variables[name] = list(variables)
+
+
+def _restore_optimizer(state: State, name: str, weights: List[np.ndarray]) -> None:
+    optimizer = getattr(state, name)
+
+    # slots are created lazily, create them on the variables recorded by register_optimizer
+    if len(optimizer.variables()) != len(weights):
+        var_list = []
+        for v in getattr(state, "optimizer_variables", {}).get(name, []):
+            v = getattr(state, v)
+            var_list += v.trainable_variables if isinstance(v, tf.keras.Model) else [v]
+        if len(var_list) > 0:
+            if hasattr(optimizer, "_create_all_weights"):
+                optimizer._create_all_weights(var_list)
+            else:
+                optimizer.build(var_list)
+    if len(optimizer.variables()) == len(weights):
+        for var, w in zip(optimizer.variables(), weights):
+            var.assign(w)
+    else:
+        raise ValueError(
+            "Could not restore the slots of the optimizer " + name + " from the checkpoint, "
+            "its variables must be recorded with register_optimizer"
+        )
+
+
+def load_checkpoint(filename: str, state: State) -> None:
+    """
+    Restore a state saved by save_checkpoint. This is meant to be called after the
+    initializers, which create the fields, the emulator and the optimizers.
+    """
+    with np.load(filename, allow_pickle=False) as data:
+        arrays = {k: data[k] for k in data.files}
+
+    meta = json.loads(str(arrays.pop("meta")))
+    rng_numpy = meta.pop("rng__numpy")
+    scheduler_last = meta.pop("scheduler__last", {})
+    if hasattr(state, "scheduler"):
+        state.scheduler.load_state_dict(scheduler_last)
+    np.random.set_state(tuple(np.array(x) if isinstance(x, list) else x for x in rng_numpy))
+    tf.random.get_global_generator().reset(arrays.pop("rng__tf"))
+
+    objects = {k[len("obj__"):]: meta.pop(k) for k in list(meta) if k.startswith("obj__")}
+
+    for k, v in meta.items():
+        setattr(state, k, v)
+
+    models, optimizers, lists = {}, {}, {}
+    for key, v in arrays.items():
+        kind, name = key.split("__", 1)
+        if kind == "var":
+            old = getattr(state, name, None)
+            if isinstance(old, tf.Variable) and (old.shape == v.shape) & (old.dtype == v.dtype):
+                old.assign(v)
+            else:
+                setattr(state, name, tf.Variable(v, trainable=False))
+        elif kind == "tensor":
+            setattr(state, name, tf.constant(v))
+        elif kind == "np":
+            setattr(state, name, v)
+        elif kind == "model":
+            name, i = name.rsplit("__", 1)
+            models.setdefault(name, {})[int(i)] = v
+        elif kind == "opt":
+            name, i = name.rsplit("__", 1)
+            optimizers.setdefault(name, {})[int(i)] = v
+        elif kind == "obj":
+            name, key = name.rsplit("__", 1)
+            objects.setdefault(name, {})[key] = v
+        elif kind == "list":
+            name, i = name.rsplit("__", 1)
+            lists.setdefault(name, {})[int(i)] = v
+
+    for name, values in lists.items():
+        setattr(state, name, [tf.constant(values[i]) for i in range(len(values))])
+
+    # the objects are created by the initializers, their content is restored
+    for name, content in objects.items():
+        if hasattr(state, name):
+            getattr(state, name).load_state_dict(content)
+
+    for name, weights in models.items():
+        if hasattr(state, name):
+            getattr(state, name).set_weights([weights[i] for i in range(len(weights))])
+
+    for name, weights in optimizers.items():
+        if hasattr(state, name):
+            _restore_optimizer(state, name, [weights[i] for i in range(len(weights))])
 
 
 def add_logger(params, state) -> None:
@@ -324,12 +982,35 @@ def validate_module(module) -> None:
             )
 
 
+# import time (in s) and packages newly loaded for each module, filled by load_modules_from_directory
+STARTUP_PROFILE: Dict[str, Dict[str, Any]] = {}
+
+
+def _top_level_packages() -> set:
+    return {name.split(".")[0] for name in sys.modules}
+
+
+def print_startup_profile(import_times: Dict[str, float] = None) -> None:
+    """Prints the import times given in import_times (e.g. tensorflow, igm) followed by the
+    import time of each module, as well as the heavy packages first loaded by the module."""
+    print("Startup profile (import times):")
+    for name, t in (import_times or {}).items():
+        print("     %24s  |  time : %8.4f" % (name, t))
+    for name, prof in STARTUP_PROFILE.items():
+        print(
+            "     %24s  |  time : %8.4f  |  loads : %s"
+            % (name, prof["time"], ", ".join(sorted(prof["packages"])))
+        )
+
+
 def load_modules_from_directory(
     modules_list: List[str], module_folder: str
 ) -> List[ModuleType]:
     imported_modules = []
     for module_name in modules_list:
         module_path = f"igm.modules.{module_folder}.{module_name}"
+        packages_before = _top_level_packages()
+        start = time.perf_counter()
         try:
             module = importlib.import_module(module_path)
         except ModuleNotFoundError:
@@ -349,6 +1030,11 @@ def load_modules_from_directory(
                     f"Can not find module {module_name}. Make sure it is either in the 1) {Path(igm.__file__).parent}/modules/{module_folder} directory or 2) in your current working directory."
                 )
 
+        STARTUP_PROFILE[module_name] = {
+            "time": time.perf_counter() - start,
+            "packages": _top_level_packages() - packages_before - {"igm"},
+        }
+
         validate_module(module)
         imported_modules.append(module)
 
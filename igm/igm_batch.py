@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2021-2023 Guillaume Jouvet <guillaume.jouvet@unil.ch>
+# Published under the GNU GPL (Version 3), check at the LICENSE file
+
+"""
+ Run IGM over many glaciers (RGI IDs or input NetCDF files) with a common
+ params file. The jobs are scheduled over a pool of worker processes, each
+ worker is pinned to its own set of CPUs with matching TF thread pools, and
+ keeps its TF runtime and loaded emulator from one job to the next. The status,
+ timings and output_ts.nc summary of each job are collected in one index file.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from igm.modules.utils import str2bool
+
+_WORKER = {}
+
+
+def params_batch() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="IGM batch runner")
+
+    parser.add_argument(
+        "--param_file",
+        type=str,
+        default="params.json",
+        help="Base param file (JSON/YAML) shared by all jobs",
+    )
+    parser.add_argument(
+        "--batch_jobs",
+        type=str,
+        nargs="*",
+        default=[],
+        help="List of jobs, each job being an RGI ID or an input NetCDF file (.nc)",
+    )
+    parser.add_argument(
+        "--batch_jobs_file",
+        type=str,
+        default="",
+        help="Text file listing the jobs (one RGI ID or NetCDF file per line)",
+    )
+    parser.add_argument(
+        "--batch_workers",
+        type=int,
+        default=1,
+        help="Number of worker processes",
+    )
+    parser.add_argument(
+        "--batch_intra_threads",
+        type=int,
+        default=0,
+        help="TF intra-op threads per worker (0 means the number of CPUs of the worker)",
+    )
+    parser.add_argument(
+        "--batch_inter_threads",
+        type=int,
+        default=1,
+        help="TF inter-op threads per worker (0 means TF default)",
+    )
+    parser.add_argument(
+        "--batch_pin_cpus",
+        type=str2bool,
+        default=True,
+        help="Pin each worker to its own set of CPUs (Linux only)",
+    )
+    parser.add_argument(
+        "--batch_output_dir",
+        type=str,
+        default="batch",
+        help="Directory containing one working directory per job",
+    )
+    parser.add_argument(
+        "--batch_index_file",
+        type=str,
+        default="batch_index.json",
+        help="Index file collecting status, timings and summary of all jobs",
+    )
+
+    return parser
+
+
+def _worker_cpus(index: int, workers: int) -> list:
+    if not hasattr(os, "sched_getaffinity"):
+        return []
+    cpus = sorted(os.sched_getaffinity(0))
+    n = max(1, len(cpus) // workers)
+    return cpus[(index * n) % len(cpus) : (index * n) % len(cpus) + n]
+
+
+def _initialize_worker(queue, workers, intra_threads, inter_threads, pin_cpus) -> None:
+    """Set the CPU affinity and the TF thread pools, before the TF runtime starts."""
+
+    index = queue.get()
+    cpus = _worker_cpus(index, workers)
+
+    if pin_cpus and (len(cpus) > 0):
+        os.sched_setaffinity(0, cpus)
+
+    if intra_threads == 0:
+        intra_threads = len(cpus)
+
+    import tensorflow as tf
+
+    if intra_threads > 0:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_threads)
+    if inter_threads > 0:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_threads)
+
+    _WORKER.update(index=index, cpus=cpus)
+
+
+def _job_params(job: str, param_file: str):
+    """Build the params of a job from the base param file, without reading sys.argv."""
+
+    import igm
+
+    parser = igm.params_core()
+    params, __ = parser.parse_known_args([])
+    params.param_file = param_file
+
+    modules = igm.setup_igm_modules(params)
+    for module in modules:
+        module.params(parser)
+
+    params, __ = parser.parse_known_args([])
+    params = igm.load_user_defined_params(
+        param_file=param_file, params_dict=vars(params)
+    )
+    parser.set_defaults(**params)
+    params, __ = parser.parse_known_args([])
+    params.param_file = param_file
+
+    if job.endswith(".nc"):
+        params.lncd_input_file = os.path.abspath(job)
+    else:
+        params.oggm_RGI_ID = job
+
+    # the emulator is loaded once per worker, and reused from one job to the next
+    params.iflo_emulator_cache = True
+
+    return modules, params
+
+
+def _summarize_ts(filename: str) -> dict:
+    from netCDF4 import Dataset
+
+    summary = {}
+    with Dataset(filename, "r") as nc:
+        for var in ["time", "vol", "area"]:
+            if var in nc.variables:
+                values = nc.variables[var][:]
+                summary[var + "_start"] = float(values[0])
+                summary[var + "_end"] = float(values[-1])
+    return summary
+
+
+def _job_directory(job: str) -> str:
+    """Name of the working directory of a job, an input file or an RGI ID."""
+
+    # only the extension .nc is stripped, such that RGI IDs (e.g. RGI60-11.01450) are kept whole
+    name = os.path.basename(job)
+    return name[:-3] if name.endswith(".nc") else name
+
+
+def run_job(job: str, param_file: str, directory: str) -> dict:
+    """Run a single job in its own working directory, and return its record."""
+
+    import tensorflow as tf
+    import igm
+
+    record = {
+        "job": job,
+        "directory": directory,
+        "worker": _WORKER.get("index", 0),
+        "cpus": _WORKER.get("cpus", []),
+        "status": "failed",
+        "error": "",
+        "timings": {},
+        "summary": {},
+    }
+
+    cwd = os.getcwd()
+    start = time.perf_counter()
+
+    try:
+        modules, params = _job_params(job, param_file)
+        record["timings"]["setup"] = time.perf_counter() - start
+
+        os.makedirs(directory, exist_ok=True)
+        os.chdir(directory)
+
+        state = igm.State()
+
+        with tf.device(f"/GPU:{params.gpu_id}"):
+            for name, run in [
+                ("initialize", igm.run_intializers),
+                ("process", igm.run_processes),
+                ("finalize", igm.run_finalizers),
+            ]:
+                t = time.perf_counter()
+                run(modules, params, state)
+                record["timings"][name] = time.perf_counter() - t
+
+        if hasattr(params, "wts_output_file") and os.path.exists(params.wts_output_file):
+            record["summary"] = _summarize_ts(params.wts_output_file)
+
+        record["status"] = "done"
+
+    except Exception:
+        record["error"] = traceback.format_exc()
+
+    finally:
+        os.chdir(cwd)
+
+    record["timings"]["total"] = time.perf_counter() - start
+
+    return record
+
+
+def _write_index(records: list, index_file: str) -> None:
+    with open(index_file, "w") as f:
+        json.dump(records, f, indent=2)
+
+
+def run_batch(
+    jobs: list,
+    param_file: str,
+    workers: int = 1,
+    intra_threads: int = 0,
+    inter_threads: int = 1,
+    pin_cpus: bool = True,
+    output_dir: str = "batch",
+    index_file: str = "batch_index.json",
+) -> list:
+    """
+    Run all jobs over a pool of worker processes, and write the index file,
+    which is updated each time a job completes.
+    """
+
+    param_file = os.path.abspath(param_file)
+    output_dir = os.path.abspath(output_dir)
+
+    # spawn (not fork) such that each worker starts its own TF runtime
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    for i in range(workers):
+        queue.put(i)
+
+    records = []
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_initialize_worker,
+        initargs=(queue, workers, intra_threads, inter_threads, pin_cpus),
+    ) as executor:
+        futures = {
+            executor.submit(
+                run_job, job, param_file,
+                os.path.join(output_dir, _job_directory(job)),
+            ): job
+            for job in jobs
+        }
+
+        for future in as_completed(futures):
+            records.append(future.result())
+            print(
+                "Job %s : %s (%.1f s)"
+                % (futures[future], records[-1]["status"], records[-1]["timings"]["total"])
+            )
+            _write_index(sorted(records, key=lambda r: jobs.index(r["job"])), index_file)
+
+    return sorted(records, key=lambda r: jobs.index(r["job"]))
+
+
+def main() -> None:
+    parser = params_batch()
+    params = parser.parse_args()
+
+    jobs = list(params.batch_jobs)
+    if not params.batch_jobs_file == "":
+        with open(params.batch_jobs_file, "r") as f:
+            jobs += [line.strip() for line in f if len(line.strip()) > 0]
+
+    if len(jobs) == 0:
+        parser.print_help()
+        sys.exit(1)
+
+    records = run_batch(
+        jobs,
+        params.param_file,
+        workers=params.batch_workers,
+        intra_threads=params.batch_intra_threads,
+        inter_threads=params.batch_inter_threads,
+        pin_cpus=params.batch_pin_cpus,
+        output_dir=params.batch_output_dir,
+        index_file=params.batch_index_file,
+    )
+
+    failed = [r["job"] for r in records if r["status"] == "failed"]
+    if len(failed) > 0:
+        print("Failed jobs : " + ", ".join(failed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,586 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2021-2023 Guillaume Jouvet <guillaume.jouvet@unil.ch>
+# Published under the GNU GPL (Version 3), check at the LICENSE file
+
+"""
+ Benchmark the hot paths of IGM on synthetic glaciers of increasing size (from
+ 100x100 to 4000x4000 by default). Each kernel (emulator inference, emulator
+ retraining, solve_iceflow, one evaluation of the ice flow energy with and without
+ the precomputed geometry, compute_divflux_slope_limiter, compute_w_kinematic_tf,
+ enthalpy, particles, and the updates of thk, time and write_ncdf) is timed separately, and the throughput (cells x steps
+ per second) and peak memory are written in a JSON file, which permits to track
+ the performance of IGM across versions. The results file of a former run
+ on the same hardware can serve as a baseline (--bench_baseline), the run then
+ fails if a kernel became slower or more memory hungry than a given tolerance.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import tempfile
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from igm.modules.utils import str2bool
+
+KERNELS = [
+    "emulator_inference",
+    "emulator_retraining",
+    "solve_iceflow",
+    "energy",
+    "energy_geometry",
+    "divflux",
+    "w_kinematic",
+    "enthalpy",
+    "particles",
+    "thk",
+    "time",
+    "write_ncdf",
+]
+
+
+def params_bench() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="IGM benchmark")
+
+    parser.add_argument(
+        "--param_file",
+        type=str,
+        default="",
+        help="Optional param file (JSON/YAML) overriding the default module parameters",
+    )
+    parser.add_argument(
+        "--bench_sizes",
+        type=int,
+        nargs="*",
+        default=[100, 250, 500, 1000, 2000, 4000],
+        help="Sizes N of the N x N synthetic glaciers",
+    )
+    parser.add_argument(
+        "--bench_kernels",
+        type=str,
+        nargs="*",
+        default=KERNELS,
+        help="Kernels to benchmark, among " + ", ".join(KERNELS),
+    )
+    parser.add_argument(
+        "--bench_steps",
+        type=int,
+        default=10,
+        help="Number of timed steps of each kernel",
+    )
+    parser.add_argument(
+        "--bench_warmup",
+        type=int,
+        default=2,
+        help="Number of untimed steps of each kernel (tracing, autotuning, seeding)",
+    )
+    parser.add_argument(
+        "--bench_resolution",
+        type=float,
+        default=100.0,
+        help="Horizontal resolution of the synthetic glaciers (m)",
+    )
+    parser.add_argument(
+        "--bench_solve_nbit",
+        type=int,
+        default=10,
+        help="Number of iterations of solve_iceflow in one step",
+    )
+    parser.add_argument(
+        "--bench_isolate",
+        type=str2bool,
+        default=True,
+        help="Run each kernel and size in a fresh process, such that the peak memory is the one of the kernel",
+    )
+    parser.add_argument(
+        "--bench_output",
+        type=str,
+        default="bench_results.json",
+        help="JSON file collecting the machine, the settings and the results",
+    )
+    parser.add_argument(
+        "--bench_baseline",
+        type=str,
+        default="",
+        help="Results file of a former run on the same hardware; if given, its kernels and sizes are run again with its settings, and the run fails on regressions",
+    )
+    parser.add_argument(
+        "--bench_time_tolerance",
+        type=float,
+        default=0.25,
+        help="Relative increase of the median step time above which a kernel is a regression",
+    )
+    parser.add_argument(
+        "--bench_memory_tolerance",
+        type=float,
+        default=0.25,
+        help="Relative increase of the peak memory above which a kernel is a regression",
+    )
+
+    return parser
+
+
+def make_synthetic(state, n: int, dx: float) -> None:
+    """
+    Synthetic valley glacier of n x n cells, the bedrock being the one of the
+    make_synthetic test module, stretched to the size of the domain.
+    """
+
+    import numpy as np
+    import tensorflow as tf
+
+    from igm.modules.utils import complete_data
+
+    x = np.arange(0, n) * dx
+    y = np.arange(0, n) * dx
+    L = n * dx
+
+    X, Y = np.meshgrid(x, y)
+
+    topg = 1000 + 0.15 * Y * (20000 / L) + ((X - L / 2) ** 2) / 50000 * (10000 / L) ** 2
+    thk = 300 * np.sqrt(np.maximum(1 - ((X - L / 2) / (L / 4)) ** 2, 0))
+    thk *= Y > L / 10
+
+    state.x = tf.constant(x.astype("float32"))
+    state.y = tf.constant(y.astype("float32"))
+
+    state.topg = tf.Variable(topg.astype("float32"), trainable=False)
+    state.thk = tf.Variable(thk.astype("float32"), trainable=False)
+
+    complete_data(state)
+
+    # accumulation in the upper half of the glacier
+    state.smb = tf.Variable(
+        tf.where(state.thk > 0, 0.002 * (tf.cast(state.Y, "float32") - L / 2) / dx, 0.0),
+        trainable=False,
+    )
+    state.air_temp = tf.ones((12, n, n)) * -10.0
+
+
+def _bench_params(param_file: str):
+    """Params of the benchmarked modules, without reading sys.argv."""
+
+    import igm
+
+    modules = igm.load_modules(
+        {
+            "modules_preproc": [],
+            "modules_process": ["time", "iceflow", "vert_flow", "enthalpy", "particles", "thk"],
+            "modules_postproc": ["write_ncdf"],
+        }
+    )
+
+    parser = igm.params_core()
+    for module in modules:
+        module.params(parser)
+
+    params, __ = parser.parse_known_args([])
+    if not param_file == "":
+        params = igm.load_user_defined_params(
+            param_file=param_file, params_dict=vars(params)
+        )
+        parser.set_defaults(**params)
+        params, __ = parser.parse_known_args([])
+
+    # the enthalpy model requires a 3D arrhenius factor
+    params.iflo_dim_arrhenius = 3
+    params.iflo_type = "emulated"
+    params.iflo_retrain_emulator_freq = 1
+    params.iflo_solve_stop_if_no_decrease = False
+    params.part_tracking_method = "3d"
+
+    return modules, params
+
+
+def _setup(n: int, dx: float, param_file: str, solve_nbit: int):
+    import igm
+
+    from igm.modules.process.iceflow.solve import initialize_iceflow_solver
+    from igm.modules.process.vert_flow.vert_flow import vertical_disc_tf
+
+    modules, params = _bench_params(param_file)
+    params.iflo_solve_nbitmax = solve_nbit
+
+    state = igm.State()
+    make_synthetic(state, n, dx)
+
+    for module in modules:
+        module.initialize(params, state)
+
+    state.it = 0
+
+    initialize_iceflow_solver(params, state)
+
+    modules = {module.__name__.split(".")[-1]: module for module in modules}
+    modules["vert_flow"].update(params, state)
+
+    state.dz = vertical_disc_tf(state.thk, params.iflo_Nz, params.iflo_vert_spacing)
+
+    return modules, params, state
+
+
+def _kernel(name: str, modules: dict, params, state):
+    """Returns the function running one step of the kernel."""
+
+    import tensorflow as tf
+
+    from igm.modules.utils import compute_divflux_slope_limiter
+    from igm.modules.process.iceflow.emulate import (
+        update_iceflow_emulated,
+        update_iceflow_emulator,
+    )
+    from igm.modules.process.iceflow.solve import solve_iceflow
+    from igm.modules.process.iceflow.energy_iceflow import (
+        iceflow_energy,
+        iceflow_energy_geometry,
+        iceflow_geometry,
+    )
+    from igm.modules.process.vert_flow.vert_flow import compute_w_kinematic_tf
+
+    if name == "emulator_inference":
+        return lambda: update_iceflow_emulated(params, state)
+    if name == "emulator_retraining":
+        return lambda: update_iceflow_emulator(params, state)
+    if name == "solve_iceflow":
+        return lambda: solve_iceflow(params, state, state.U, state.V)
+    if name in ["energy", "energy_geometry"]:
+        # one iteration of the solver evaluates the energy and its gradient
+        fieldin = [tf.expand_dims(vars(state)[f], axis=0) for f in params.iflo_fieldin]
+        U, V = tf.expand_dims(state.U, axis=0), tf.expand_dims(state.V, axis=0)
+        geometry = iceflow_geometry(params, fieldin)
+
+        def step():
+            with tf.GradientTape() as t:
+                t.watch([U, V])
+                if name == "energy":
+                    C = iceflow_energy(params, U, V, fieldin)
+                else:
+                    C = iceflow_energy_geometry(params, U, V, geometry)
+                COST = sum(tf.reduce_mean(c) for c in C)
+            return t.gradient(COST, [U, V])
+
+        return step
+    if name == "divflux":
+        return lambda: compute_divflux_slope_limiter(
+            state.ubar, state.vbar, state.thk, state.dx, state.dx, state.dt,
+            slope_type=params.thk_slope_type,
+        )
+    if name == "w_kinematic":
+        return lambda: compute_w_kinematic_tf(
+            state.U, state.V, state.topg, state.thk, state.dz, state.dx, state.vert_weight
+        )
+    if name == "enthalpy":
+        return lambda: modules["enthalpy"].update(params, state)
+    if name in ["particles", "thk", "time", "write_ncdf"]:
+        return lambda: modules[name].update(params, state)
+
+    raise ValueError("Unknown kernel " + name + ", it must be among " + ", ".join(KERNELS))
+
+
+def _peak_rss() -> int:
+    # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_kernel(
+    kernel: str,
+    n: int,
+    steps: int = 10,
+    warmup: int = 2,
+    dx: float = 100.0,
+    param_file: str = "",
+    solve_nbit: int = 10,
+) -> dict:
+    """Time one kernel on the n x n synthetic glacier, and return its record."""
+
+    import tensorflow as tf
+    import igm
+
+    record = {
+        "kernel": kernel,
+        "size": n,
+        "cells": n * n,
+        "status": "failed",
+        "error": "",
+    }
+
+    # the outputs (e.g. of write_ncdf) are written in a temporary directory
+    cwd = os.getcwd()
+    tmpdir = tempfile.TemporaryDirectory()
+
+    try:
+        os.chdir(tmpdir.name)
+
+        with tf.device("/GPU:0"):
+            modules, params, state = _setup(n, dx, param_file, solve_nbit)
+            step = _kernel(kernel, modules, params, state)
+
+            for __ in range(warmup):
+                step()
+                state.it += 1
+
+            profiler = igm.Profiler(sync=True)
+            for __ in range(steps):
+                with profiler.record(kernel, "%dx%d" % (n, n)):
+                    step()
+                state.it += 1
+
+        stats = list(profiler.stats().values())[0]
+
+        record.update(
+            steps=stats["count"],
+            total=stats["total"],
+            mean=stats["mean"],
+            p50=stats["p50"],
+            p95=stats["p95"],
+            cells_steps_per_s=n * n * stats["count"] / stats["total"],
+            peak_memory=stats["peak_memory"],
+            peak_rss=_peak_rss(),
+            status="done",
+        )
+
+    except Exception:
+        record["error"] = traceback.format_exc()
+
+    finally:
+        os.chdir(cwd)
+        tmpdir.cleanup()
+
+    return record
+
+
+def _machine() -> dict:
+    import tensorflow as tf
+
+    try:
+        from importlib.metadata import version
+
+        igm_version = version("igm-model")
+    except Exception:
+        igm_version = "unknown"
+
+    return {
+        "igm": igm_version,
+        "tensorflow": tf.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "gpus": [d.name for d in tf.config.list_physical_devices("GPU")],
+    }
+
+
+def run_bench(
+    sizes: list = [100, 250, 500, 1000, 2000, 4000],
+    kernels: list = KERNELS,
+    steps: int = 10,
+    warmup: int = 2,
+    dx: float = 100.0,
+    param_file: str = "",
+    solve_nbit: int = 10,
+    isolate: bool = True,
+    output: str = "bench_results.json",
+) -> dict:
+    """
+    Run all kernels on all sizes, and write the results file, which is updated
+    each time a kernel completes.
+    """
+
+    if not param_file == "":
+        param_file = os.path.abspath(param_file)
+
+    for kernel in kernels:
+        if kernel not in KERNELS:
+            raise ValueError("Unknown kernel " + kernel + ", it must be among " + ", ".join(KERNELS))
+
+    results = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": _machine(),
+        "settings": {
+            "steps": steps,
+            "warmup": warmup,
+            "resolution": dx,
+            "solve_nbit": solve_nbit,
+            "isolate": isolate,
+            "param_file": param_file,
+        },
+        "results": [],
+    }
+
+    for n in sizes:
+        for kernel in kernels:
+            args = (kernel, n, steps, warmup, dx, param_file, solve_nbit)
+
+            if isolate:
+                # spawn (not fork) such that the process starts its own TF runtime
+                with ProcessPoolExecutor(
+                    max_workers=1, mp_context=multiprocessing.get_context("spawn")
+                ) as executor:
+                    try:
+                        record = executor.submit(run_kernel, *args).result()
+                    except Exception:
+                        # e.g. the process was killed when running out of memory
+                        record = {"kernel": kernel, "size": n, "cells": n * n,
+                                  "status": "failed", "error": traceback.format_exc()}
+            else:
+                record = run_kernel(*args)
+
+            results["results"].append(record)
+
+            if record["status"] == "done":
+                print(
+                    "%-20s %5d x %-5d : %10.4f s/step %12.3e cells.steps/s %8.1f MB"
+                    % (kernel, n, n, record["mean"], record["cells_steps_per_s"],
+                       max(record["peak_memory"], record["peak_rss"]) / 2**20)
+                )
+            else:
+                print("%-20s %5d x %-5d : failed" % (kernel, n, n))
+
+            with open(output, "w") as f:
+                json.dump(results, f, indent=2)
+
+    return results
+
+
+# a baseline is only meaningful on the hardware it was recorded on
+HARDWARE = ["processor", "cpu_count", "gpus"]
+
+
+def _check_hardware(machine: dict, baseline: dict) -> None:
+    for key in HARDWARE:
+        if not machine.get(key) == baseline.get(key):
+            raise ValueError(
+                "The baseline was recorded on another hardware profile (%s : %s instead of %s)"
+                % (key, machine.get(key), baseline.get(key))
+            )
+
+
+def compare_to_baseline(
+    results: dict,
+    baseline: dict,
+    time_tolerance: float = 0.25,
+    memory_tolerance: float = 0.25,
+) -> list:
+    """
+    Compare the results of a run to a baseline (the results of a former run on
+    the same hardware), and return the regressions, i.e. the kernels that failed
+    while they ran in the baseline, or whose median step time or peak memory
+    increased by more than the relative tolerance.
+    """
+
+    _check_hardware(results["machine"], baseline["machine"])
+
+    current = {(r["kernel"], r["size"]): r for r in results["results"]}
+
+    regressions = []
+
+    for ref in baseline["results"]:
+        key = (ref["kernel"], ref["size"])
+        if (not ref["status"] == "done") or (key not in current):
+            continue
+
+        record = current[key]
+
+        if not record["status"] == "done":
+            regressions.append(
+                {"kernel": key[0], "size": key[1], "metric": "status",
+                 "baseline": ref["status"], "current": record["status"], "ratio": None}
+            )
+            continue
+
+        for metric, tolerance in [
+            ("p50", time_tolerance),
+            ("peak_memory", memory_tolerance),
+            ("peak_rss", memory_tolerance),
+        ]:
+            if (ref[metric] > 0) and (record[metric] > (1 + tolerance) * ref[metric]):
+                regressions.append(
+                    {"kernel": key[0], "size": key[1], "metric": metric,
+                     "baseline": ref[metric], "current": record[metric],
+                     "ratio": record[metric] / ref[metric]}
+                )
+
+    return regressions
+
+
+def run_regression(
+    baseline_file: str,
+    time_tolerance: float = 0.25,
+    memory_tolerance: float = 0.25,
+    output: str = "bench_results.json",
+) -> list:
+    """Run again the kernels and sizes of a baseline with its settings, and return the regressions."""
+
+    with open(baseline_file, "r") as f:
+        baseline = json.load(f)
+
+    # fail before running anything if the hardware does not match
+    _check_hardware(_machine(), baseline["machine"])
+
+    settings = baseline["settings"]
+
+    results = run_bench(
+        sizes=list(dict.fromkeys(r["size"] for r in baseline["results"])),
+        kernels=list(dict.fromkeys(r["kernel"] for r in baseline["results"])),
+        steps=settings["steps"],
+        warmup=settings["warmup"],
+        dx=settings["resolution"],
+        param_file=settings["param_file"],
+        solve_nbit=settings["solve_nbit"],
+        isolate=settings["isolate"],
+        output=output,
+    )
+
+    regressions = compare_to_baseline(results, baseline, time_tolerance, memory_tolerance)
+
+    for r in regressions:
+        if r["metric"] == "status":
+            print("Regression %s (%d) : %s" % (r["kernel"], r["size"], r["current"]))
+        else:
+            print(
+                "Regression %s (%d) : %s %.4g -> %.4g (x%.2f)"
+                % (r["kernel"], r["size"], r["metric"], r["baseline"], r["current"], r["ratio"])
+            )
+
+    return regressions
+
+
+def main() -> None:
+    parser = params_bench()
+    params = parser.parse_args()
+
+    if not params.bench_baseline == "":
+        regressions = run_regression(
+            params.bench_baseline,
+            time_tolerance=params.bench_time_tolerance,
+            memory_tolerance=params.bench_memory_tolerance,
+            output=params.bench_output,
+        )
+        sys.exit(int(len(regressions) > 0))
+
+    results = run_bench(
+        sizes=params.bench_sizes,
+        kernels=params.bench_kernels,
+        steps=params.bench_steps,
+        warmup=params.bench_warmup,
+        dx=params.bench_resolution,
+        param_file=params.param_file,
+        solve_nbit=params.bench_solve_nbit,
+        isolate=params.bench_isolate,
+        output=params.bench_output,
+    )
+
+    failed = [r for r in results["results"] if r["status"] == "failed"]
+    if len(failed) > 0:
+        print("Failed : " + ", ".join("%s (%d)" % (r["kernel"], r["size"]) for r in failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
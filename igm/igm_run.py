@@ -4,6 +4,7 @@
 # Published under the GNU GPL (Version 3), check at the LICENSE file
 
 import os
+import time
 import tensorflow as tf
 from igm import (
     State,
@@ -16,7 +17,9 @@ from igm import (
     setup_igm_params,
     print_gpu_info,
     add_logger,
-    download_unzip_and_store
+    download_unzip_and_store,
+    print_startup_profile,
+    IMPORT_TIMES
 )
 
 
@@ -32,9 +35,15 @@ def main() -> None:
         add_logger(params=params, state=state)
         tf.get_logger().setLevel(params.logging_level)
         
+    _start = time.perf_counter()
     imported_modules = setup_igm_modules(params)
+    IMPORT_TIMES["modules"] = time.perf_counter() - _start
+
     params = setup_igm_params(parser, imported_modules)
 
+    if params.startup_profile:
+        print_startup_profile(IMPORT_TIMES)
+
     if params.print_params:
         print_params(params=params)
         
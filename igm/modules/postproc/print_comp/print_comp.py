@@ -7,7 +7,6 @@ import numpy as np
 import os, sys, shutil
 import time
 import tensorflow as tf
-import matplotlib.pyplot as plt
 
 
 def params(parser):
@@ -52,6 +51,10 @@ def finalize(params, state):
 
     ################################################################
 
+    if hasattr(state, "profiler"):
+        _print_profiler_stats(params, state)
+        return
+
     modules = [A for A in state.__dict__.keys() if "tcomp_" in A]
 
     state.tcomp_all = [np.sum([np.sum(getattr(state, m)) for m in modules])]
@@ -80,18 +83,45 @@ def finalize(params, state):
     _plot_computational_pie(params, state)
 
 
-def _plot_computational_pie(params, state):
+def _print_profiler_stats(params, state):
     """
-    Plot to the computational time of each model components in a pie
+    Print the statistics gathered by the profiler (activated with --profiling)
     """
 
-    def make_autopct(values):
-        def my_autopct(pct):
-            total = sum(values)
-            val = int(round(pct * total / 100.0))
-            return "{:.0f}".format(val)
+    stats = state.profiler.stats()
 
-        return my_autopct
+    print("Computational statistics report:")
+    with open("computational-statistics.txt", "w") as f:
+        for st in stats.values():
+            CELA = (
+                st["name"] + ":" + st["phase"],
+                st["count"],
+                st["total"],
+                st["mean"],
+                st["p50"],
+                st["p95"],
+                st["peak_memory"] / 1024**3,
+            )
+            line = (
+                "     %32s  |  count : %6.0f  |  total : %8.4f  |  mean : %8.4f  |  p50 : %8.4f  |  p95 : %8.4f  |  peak mem : %6.3f Gb"
+                % CELA
+            )
+            print(line, file=f)
+            print(line)
+
+    os.system( "echo rm " + "computational-statistics.txt" + " >> clean.sh" )
+
+    _plot_pie(
+        [st["total"] for st in stats.values() if st["phase"] == "update"],
+        [st["name"] for st in stats.values() if st["phase"] == "update"],
+        "computational-pie.png",
+    )
+
+
+def _plot_computational_pie(params, state):
+    """
+    Plot to the computational time of each model components in a pie
+    """
 
     total = []
     name = []
@@ -103,40 +133,14 @@ def _plot_computational_pie(params, state):
         total.append(np.sum(getattr(state, m)[1:]))
         name.append(m[6:])
 
-    sumallindiv = np.sum(total)
+    _plot_pie(total, name, "computational-pie.png")
 
-    fig, ax = plt.subplots(figsize=(6, 6), subplot_kw=dict(aspect="equal"), dpi=200)
-    wedges, texts, autotexts = ax.pie(
-        total, autopct=make_autopct(total), textprops=dict(color="w")
-    )
-    ax.legend(
-        wedges,
-        name,
-        title="Model components",
-        loc="center left",
-        bbox_to_anchor=(1, 0, 0.5, 1),
-    )
-    plt.setp(autotexts, size=8, weight="bold")
-    #    ax.set_title("Matplotlib bakery: A pie")
-    plt.tight_layout()
-    plt.savefig("computational-pie.png", pad_inches=0)
-    plt.close("all")
-
-    os.system("echo rm computational-pie.png >> clean.sh")
 
 def _plot_memory_pie(params, state):
     """
     Plot to the memory size of each model components in a pie
     """
 
-    def make_autopct(values):
-        def my_autopct(pct):
-            total = sum(values)
-            val = int(round(pct * total / 100.0))
-            return "{:.0f}".format(val)
-
-        return my_autopct
-
     size_of_tensor = {}
 
     for m in state.__dict__.keys():
@@ -154,7 +158,19 @@ def _plot_memory_pie(params, state):
     total = list(size_of_tensor.values())[:10]
     name = list(size_of_tensor.keys())[:10]
 
-    sumallindiv = np.sum(total)
+    _plot_pie(total, name, "memory-pie.png")
+
+
+def _plot_pie(total, name, filename):
+    import matplotlib.pyplot as plt
+
+    def make_autopct(values):
+        def my_autopct(pct):
+            total = sum(values)
+            val = int(round(pct * total / 100.0))
+            return "{:.0f}".format(val)
+
+        return my_autopct
 
     fig, ax = plt.subplots(figsize=(6, 6), subplot_kw=dict(aspect="equal"), dpi=200)
     wedges, texts, autotexts = ax.pie(
@@ -170,7 +186,7 @@ def _plot_memory_pie(params, state):
     plt.setp(autotexts, size=8, weight="bold")
     #    ax.set_title("Matplotlib bakery: A pie")
     plt.tight_layout()
-    plt.savefig("memory-pie.png", pad_inches=0)
+    plt.savefig(filename, pad_inches=0)
     plt.close("all")
 
-    os.system("echo rm memory-pie.png >> clean.sh")
+    os.system("echo rm " + filename + " >> clean.sh")
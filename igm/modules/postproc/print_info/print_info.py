@@ -6,7 +6,6 @@
 import numpy as np
 import os
 import datetime
-import matplotlib.pyplot as plt
 
 
 def params(parser):
@@ -31,7 +30,7 @@ def update(params, state):
                 state.it,
                 state.t,
                 state.dt_target,
-                np.sum(state.thk) * (state.dx**2) / 10**9,
+                np.sum(state.thk, dtype="float64") * (state.dx**2) / 10**9,
             )
         )
 
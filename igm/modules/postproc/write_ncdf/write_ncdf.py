@@ -5,7 +5,6 @@
 
 import numpy as np
 import os, sys, shutil
-import matplotlib.pyplot as plt
 import datetime, time
 import tensorflow as tf
 import argparse
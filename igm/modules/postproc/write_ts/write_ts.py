@@ -27,7 +27,8 @@ def initialize(params, state):
 
 def update(params, state):
     if state.saveresult:
-        vol = np.sum(state.thk) * (state.dx**2) / 10**9
+        # the volume is accumulated in float64 whatever the precision of thk
+        vol = np.sum(state.thk, dtype="float64") * (state.dx**2) / 10**9
         area = np.sum(state.thk > 1) * (state.dx**2) / 10**6
 
         if not hasattr(state, "already_called_update_write_ts"):
@@ -1,6 +1,5 @@
 # Import the most important libraries
 import numpy as np
-import matplotlib.pyplot as plt
 import tensorflow as tf
 import math
  
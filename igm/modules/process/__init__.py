@@ -3,4 +3,15 @@
 # Copyright (C) 2021-2023 Guillaume Jouvet <guillaume.jouvet@unil.ch>
 # Published under the GNU GPL (Version 3), check at the LICENSE file
 
-from . import iceflow
\ No newline at end of file
+import importlib
+
+
+# modules are imported only when accessed, e.g. igm.modules.process.iceflow,
+# this avoids loading all the modules (and their dependencies) when importing igm
+def __getattr__(name):
+    try:
+        return importlib.import_module("." + name, __name__)
+    except ModuleNotFoundError as e:
+        if e.name != __name__ + "." + name:
+            raise
+        raise AttributeError(f"module {__name__} has no attribute {name}") from None
\ No newline at end of file
@@ -5,12 +5,12 @@
 
 import numpy as np
 import os, sys, shutil
-import matplotlib.pyplot as plt
 import tensorflow as tf
 import time
 from netCDF4 import Dataset
 import json
 from igm.modules.utils import interp1d_tf
+from igm.common import schedule
 
 
 def params(parser):
@@ -111,7 +111,7 @@ def initialize(params, state):
         dtype="float32", trainable=False
     )
 
-    state.tlast_clim_oggm = tf.Variable(-(10**10), dtype="float32", trainable=False)
+    schedule(state, "clim_oggm", params.clim_oggm_update_freq)
     state.tcomp_clim_oggm = []
 
     if params.clim_oggm_clim_trend_array == []:
@@ -129,59 +129,59 @@ def initialize(params, state):
 
 
 def update(params, state):
-    if (state.t - state.tlast_clim_oggm) >= params.clim_oggm_update_freq:
-        if hasattr(state, "logger"):
-            state.logger.info("update climate at time : " + str(state.t.numpy()))
-
-        state.tcomp_clim_oggm.append(time.time())
-
-        # find out the index that corresponds to the current year
-        index_year = int(state.t - params.yr_0)
-
-        if (index_year >= 0) & (index_year < state.prec.shape[0]):
-            II = index_year
-            delta_temp = 0.0
-            prec_scal = 1.0
-        else:
-            i0, i1 = np.round(params.clim_oggm_ref_period - params.yr_0)
-            II = np.random.randint(i0, i1)
-            delta_temp = interp1d_tf(state.climpar[:, 0], state.climpar[:, 1], state.t)
-            prec_scal = interp1d_tf(state.climpar[:, 0], state.climpar[:, 2], state.t)
-
-        PREC = tf.expand_dims(
-            tf.expand_dims(np.squeeze(state.prec[II, :]), axis=-1), axis=-1
-        )
-        TEMP = tf.expand_dims(
-            tf.expand_dims(np.squeeze(state.temp[II, :]), axis=-1), axis=-1
-        )
-        TEMP_STD = tf.expand_dims(
-            tf.expand_dims(np.squeeze(state.temp_std[II, :]), axis=-1), axis=-1
-        )
+    if not state.scheduler.due("clim_oggm", state):
+        return
 
-        # apply delta temp and precp scaling
-        TEMP += delta_temp
-        PREC *= prec_scal
+    if hasattr(state, "logger"):
+        state.logger.info("update climate at time : " + str(state.t.numpy()))
 
-        # extend air_temp and precipitation over the entire glacier and all day of the year
-        state.precipitation = tf.tile(PREC, (1, state.y.shape[0], state.x.shape[0]))
-        state.air_temp = tf.tile(TEMP, (1, state.y.shape[0], state.x.shape[0]))
-        state.air_temp_std = tf.tile(TEMP_STD, (1, state.y.shape[0], state.x.shape[0]))
+    state.tcomp_clim_oggm.append(time.time())
 
-        # vertical correction (lapse rates)
-        temp_corr_addi = params.temp_default_gradient * (state.usurf - params.ref_hgt)
-        temp_corr_addi = tf.expand_dims(temp_corr_addi, axis=0)
-        temp_corr_addi = tf.tile(temp_corr_addi, (state.temp.shape[1], 1, 1))
+    # find out the index that corresponds to the current year
+    index_year = int(state.t - params.yr_0)
 
-        # the final precipitation and temperature must have shape (12,ny,nx)
-        state.air_temp = state.air_temp + temp_corr_addi
-        
-        state.meanprec = tf.math.reduce_mean(state.precipitation, axis=0)
-        state.meantemp = tf.math.reduce_mean(state.air_temp, axis=0)
+    if (index_year >= 0) & (index_year < state.prec.shape[0]):
+        II = index_year
+        delta_temp = 0.0
+        prec_scal = 1.0
+    else:
+        i0, i1 = np.round(params.clim_oggm_ref_period - params.yr_0)
+        II = np.random.randint(i0, i1)
+        delta_temp = interp1d_tf(state.climpar[:, 0], state.climpar[:, 1], state.t)
+        prec_scal = interp1d_tf(state.climpar[:, 0], state.climpar[:, 2], state.t)
 
-        state.tlast_clim_oggm.assign(state.t)
+    PREC = tf.expand_dims(
+        tf.expand_dims(np.squeeze(state.prec[II, :]), axis=-1), axis=-1
+    )
+    TEMP = tf.expand_dims(
+        tf.expand_dims(np.squeeze(state.temp[II, :]), axis=-1), axis=-1
+    )
+    TEMP_STD = tf.expand_dims(
+        tf.expand_dims(np.squeeze(state.temp_std[II, :]), axis=-1), axis=-1
+    )
+
+    # apply delta temp and precp scaling
+    TEMP += delta_temp
+    PREC *= prec_scal
+
+    # extend air_temp and precipitation over the entire glacier and all day of the year
+    state.precipitation = tf.tile(PREC, (1, state.y.shape[0], state.x.shape[0]))
+    state.air_temp = tf.tile(TEMP, (1, state.y.shape[0], state.x.shape[0]))
+    state.air_temp_std = tf.tile(TEMP_STD, (1, state.y.shape[0], state.x.shape[0]))
+
+    # vertical correction (lapse rates)
+    temp_corr_addi = params.temp_default_gradient * (state.usurf - params.ref_hgt)
+    temp_corr_addi = tf.expand_dims(temp_corr_addi, axis=0)
+    temp_corr_addi = tf.tile(temp_corr_addi, (state.temp.shape[1], 1, 1))
+
+    # the final precipitation and temperature must have shape (12,ny,nx)
+    state.air_temp = state.air_temp + temp_corr_addi
+        
+    state.meanprec = tf.math.reduce_mean(state.precipitation, axis=0)
+    state.meantemp = tf.math.reduce_mean(state.air_temp, axis=0)
 
-        state.tcomp_clim_oggm[-1] -= time.time()
-        state.tcomp_clim_oggm[-1] *= -1
+    state.tcomp_clim_oggm[-1] -= time.time()
+    state.tcomp_clim_oggm[-1] *= -1
 
 
 def finalize(params, state):
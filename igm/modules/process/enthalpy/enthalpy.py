@@ -4,7 +4,6 @@
 # Published under the GNU GPL (Version 3), check at the LICENSE file
 
 import numpy as np
-import matplotlib.pyplot as plt
 import tensorflow as tf
 import time
 
@@ -3,10 +3,10 @@
 # Published under the GNU GPL (Version 3), check at the LICENSE file
 
 import numpy as np
-import matplotlib.pyplot as plt
 import tensorflow as tf
 import time
 from igm.modules.utils import *
+from igm.common import schedule
 
 
 
@@ -47,7 +47,7 @@ def initialize(params, state):
 
     if not hasattr(state,"tcomp_gflex"):
         state.tcomp_gflex = []
-        state.tlast_gflex = tf.Variable(params.time_start, dtype=tf.float32)
+        schedule(state, "gflex", params.gflex_update_freq, phase=params.time_start)
         state.topg0 = state.usurf - state.thk
 
     state.flex = F2D()
@@ -80,6 +80,9 @@ def initialize(params, state):
     
 
 def update(params, state):
+    if not state.scheduler.due("gflex", state):
+        return
+
     from scipy.interpolate import griddata
     
     initialize(params, state)
@@ -120,73 +123,70 @@ def update(params, state):
         
         return pad_width
 
-    if (state.t - state.tlast_gflex) >= params.gflex_update_freq:
-        if hasattr(state, "logger"):
-            state.logger.info("Update gflex at time : " + str(state.t.numpy()))
+    if hasattr(state, "logger"):
+        state.logger.info("Update gflex at time : " + str(state.t.numpy()))
 
-        state.tcomp_gflex.append(time.time())
+    state.tcomp_gflex.append(time.time())
 
-        state.flex.Te = np.float32(state.flex.Te0)       
-        state.flex.qs = state.thk.numpy() * 917 * 9.81  # convert thicknesses to loads
+    state.flex.Te = np.float32(state.flex.Te0)       
+    state.flex.qs = state.thk.numpy() * 917 * 9.81  # convert thicknesses to loads
         
-        if state.dx < state.flex.dx:
-            if np.shape(state.flex.Te)==np.shape(state.flex.qs): # in case you want to use a pre-padded (and resampled) Te grid
-                state.flex.Te = downsample_array_to_resolution(state.flex.Te, state.dx, state.flex.dx)  
-            state.flex.qs = downsample_array_to_resolution(state.flex.qs, state.dx, state.flex.dx)    
+    if state.dx < state.flex.dx:
+        if np.shape(state.flex.Te)==np.shape(state.flex.qs): # in case you want to use a pre-padded (and resampled) Te grid
+            state.flex.Te = downsample_array_to_resolution(state.flex.Te, state.dx, state.flex.dx)  
+        state.flex.qs = downsample_array_to_resolution(state.flex.qs, state.dx, state.flex.dx)    
             
-            r, c = np.shape(state.flex.qs) # dimension of the downsampled arrays
-            rr, cc = np.shape( state.thk.numpy()) # dimension of the original array
+        r, c = np.shape(state.flex.qs) # dimension of the downsampled arrays
+        rr, cc = np.shape( state.thk.numpy()) # dimension of the original array
             
-            if state.flex.pad == True:
-                p = pad_arrays(params,state) # padding of one flexural wavelength
-            else:
-                p = 0
+        if state.flex.pad == True:
+            p = pad_arrays(params,state) # padding of one flexural wavelength
+        else:
+            p = 0
             
-            # gFlex
-            state.flex.initialize()
-            state.flex.run()
-            state.flex.finalize()
+        # gFlex
+        state.flex.initialize()
+        state.flex.run()
+        state.flex.finalize()
             
-            # transform result back to original resolution and dimension
-            u, v = np.shape(state.flex.w) # dimension of the padded arrays
-            start_row = p
-            end_row = start_row + r
-            start_col = p
-            end_col = start_col + c
-            x = np.arange(0, v)
-            y = np.arange(0, u)
-            X, Y = np.meshgrid(x, y)
-            points = np.column_stack((X.flatten(), Y.flatten()))
-            values = state.flex.w.flatten()
-            target_x = np.linspace(start_col, end_col, cc)
-            target_y = np.linspace(start_row, end_row, rr)
-            target_X, target_Y = np.meshgrid(target_x, target_y)
+        # transform result back to original resolution and dimension
+        u, v = np.shape(state.flex.w) # dimension of the padded arrays
+        start_row = p
+        end_row = start_row + r
+        start_col = p
+        end_col = start_col + c
+        x = np.arange(0, v)
+        y = np.arange(0, u)
+        X, Y = np.meshgrid(x, y)
+        points = np.column_stack((X.flatten(), Y.flatten()))
+        values = state.flex.w.flatten()
+        target_x = np.linspace(start_col, end_col, cc)
+        target_y = np.linspace(start_row, end_row, rr)
+        target_X, target_Y = np.meshgrid(target_x, target_y)
                         
-            state.flex.w = griddata(points, values, (target_X, target_Y), method='linear', fill_value = 0)
-        else:
-            if state.flex.pad == True:
-                p = pad_arrays(params,state)
+        state.flex.w = griddata(points, values, (target_X, target_Y), method='linear', fill_value = 0)
+    else:
+        if state.flex.pad == True:
+            p = pad_arrays(params,state)
             
-            state.flex.initialize()
-            state.flex.run()
-            state.flex.finalize()
+        state.flex.initialize()
+        state.flex.run()
+        state.flex.finalize()
             
-            if state.flex.pad == True:
-                # remove the padded cols and rows
-                state.flex.w = state.flex.w[p:-p,p:-p]
+        if state.flex.pad == True:
+            # remove the padded cols and rows
+            state.flex.w = state.flex.w[p:-p,p:-p]
         
-        # add the deflection to the topography 
-        state.topg = state.topg0 + state.flex.w
-        state.usurf = state.topg + state.thk
-        # state.flex.plotChoice='both'
-        # state.flex.output()
-        # plt.imshow(state.flex.w)
-        # plt.colorbar()
-
-        state.tlast_gflex.assign(state.t)
-
-        state.tcomp_gflex[-1] -= time.time()
-        state.tcomp_gflex[-1] *= -1
+    # add the deflection to the topography 
+    state.topg = state.topg0 + state.flex.w
+    state.usurf = state.topg + state.thk
+    # state.flex.plotChoice='both'
+    # state.flex.output()
+    # plt.imshow(state.flex.w)
+    # plt.colorbar()
+
+    state.tcomp_gflex[-1] -= time.time()
+    state.tcomp_gflex[-1] *= -1
 
 
 def finalize(params, state):
@@ -9,6 +9,7 @@ import time
 import tensorflow as tf
 
 from igm.modules.utils import *
+from igm.common import schedule
 
 
 def params(parser):
@@ -36,32 +37,36 @@ def params(parser):
 
 def initialize(params, state):
     state.tcomp_glerosion = []
-    state.tlast_erosion = tf.Variable(params.time_start, dtype=tf.float32)
+    schedule(state, "glerosion", params.glerosion_update_freq, phase=params.time_start)
 
 
 def update(params, state):
-    if (state.t - state.tlast_erosion) >= params.glerosion_update_freq:
-        if hasattr(state, "logger"):
-            state.logger.info(
-                "update topg_glacial_erosion at time : " + str(state.t.numpy())
-            )
+    if not state.scheduler.due("glerosion", state):
+        return
 
-        state.tcomp_glerosion.append(time.time())
+    if hasattr(state, "logger"):
+        state.logger.info(
+            "update topg_glacial_erosion at time : " + str(state.t.numpy())
+        )
 
-        velbase_mag = getmag(state.U[0], state.V[0])
+    state.tcomp_glerosion.append(time.time())
 
-        # apply erosion law, erosion rate is proportional to a power of basal sliding speed
-        dtopgdt = params.glerosion_cst * (velbase_mag**params.glerosion_exp)
+    velbase_mag = getmag(state.U[0], state.V[0])
 
-        state.topg = state.topg - (state.t - state.tlast_erosion) * dtopgdt
+    # apply erosion law, erosion rate is proportional to a power of basal sliding speed
+    dtopgdt = params.glerosion_cst * (velbase_mag**params.glerosion_exp)
 
-        # THIS WORK ONLY FOR GROUNDED ICE, TO BE ADAPTED FOR FLOATING ICE
-        state.usurf = state.topg + state.thk
+    # erosion is integrated over the time elapsed since the previous update
+    elapsed = state.scheduler.elapsed("glerosion")
+    if elapsed is None:
+        elapsed = state.dt
+    state.topg = state.topg - elapsed * dtopgdt
 
-        state.tlast_erosion.assign(state.t)
+    # THIS WORK ONLY FOR GROUNDED ICE, TO BE ADAPTED FOR FLOATING ICE
+    state.usurf = state.topg + state.thk
 
-        state.tcomp_glerosion[-1] -= time.time()
-        state.tcomp_glerosion[-1] *= -1
+    state.tcomp_glerosion[-1] -= time.time()
+    state.tcomp_glerosion[-1] *= -1
 
 
 def finalize(params, state):
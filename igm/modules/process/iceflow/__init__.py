@@ -2,5 +2,7 @@ from .iceflow import (
     params,
     initialize,
     finalize,
-    update
+    update,
+    update_graph_host,
+    update_graph
 )
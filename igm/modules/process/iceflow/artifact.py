@@ -0,0 +1,123 @@
+import numpy as np
+import tensorflow as tf
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+# version of the artifact format, which is part of the content hash
+ARTIFACT_VERSION = 1
+
+# files of an emulator directory, as written by save_iceflow_model
+_EMULATOR_FILES = ["model.h5", "fieldin.dat", "vert_grid.dat"]
+
+
+def emulator_hash(dirpath):
+    """
+    Content hash of an emulator directory (model.h5, fieldin.dat, vert_grid.dat)
+    """
+    h = hashlib.sha256(("igm-emulator-artifact-%d" % ARTIFACT_VERSION).encode())
+    for f in _EMULATOR_FILES:
+        filename = os.path.join(dirpath, f)
+        if os.path.exists(filename):
+            h.update(f.encode())
+            with open(filename, "rb") as fid:
+                h.update(fid.read())
+    return h.hexdigest()
+
+
+def _read_emulator_directory(dirpath):
+    fieldin = []
+    with open(os.path.join(dirpath, "fieldin.dat"), "r") as fid:
+        for fileline in fid:
+            part = fileline.split()
+            if len(part) > 0:
+                fieldin.append(part[0])
+
+    vert_spacing = None
+    if os.path.exists(os.path.join(dirpath, "vert_grid.dat")):
+        with open(os.path.join(dirpath, "vert_grid.dat"), "r") as fid:
+            vert_spacing = float(fid.readlines()[1].split()[0])
+
+    model = tf.keras.models.load_model(os.path.join(dirpath, "model.h5"), compile=False)
+
+    return fieldin, vert_spacing, model
+
+
+def build_emulator_artifact(dirpath, cache_directory):
+    """
+    Convert the emulator of a directory into an artifact of the cache directory,
+    unless it is already there, and return the path of the artifact. The artifact
+    is a directory named by the content hash of the emulator, which contains the
+    weights of the network in a single flat array (weights.npy), and a JSON
+    manifest with the input fields, the vertical discretization and the network
+    config. The artifact is written in a temporary directory and renamed, such
+    that concurrent processes (e.g. igm_batch workers) can share the cache.
+    """
+    key = emulator_hash(dirpath)
+    path = os.path.join(cache_directory, key)
+
+    if os.path.exists(os.path.join(path, "manifest.json")):
+        return path
+
+    fieldin, vert_spacing, model = _read_emulator_directory(dirpath)
+
+    weights = model.get_weights()
+
+    manifest = {
+        "version": ARTIFACT_VERSION,
+        "hash": key,
+        "source": str(dirpath),
+        "fieldin": fieldin,
+        "Nz": int(model.output_shape[-1] // 2),
+        "vert_spacing": vert_spacing,
+        "dtype": str(np.result_type(*weights)),
+        "weights": [list(w.shape) for w in weights],
+        "model": json.loads(model.to_json()),
+    }
+
+    os.makedirs(cache_directory, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=cache_directory)
+
+    np.save(
+        os.path.join(tmp, "weights.npy"),
+        np.concatenate([w.ravel() for w in weights]).astype(manifest["dtype"]),
+    )
+    with open(os.path.join(tmp, "manifest.json"), "w") as fid:
+        json.dump(manifest, fid, indent=1)
+
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # another process has written the same artifact in the meantime
+        shutil.rmtree(tmp)
+
+    return path
+
+
+def load_emulator_artifact(path):
+    """
+    Load an emulator artifact, the network being built from its config, and its
+    weights being read in a single array. Returns the model and the manifest.
+    """
+    with open(os.path.join(path, "manifest.json"), "r") as fid:
+        manifest = json.load(fid)
+
+    assert manifest["version"] == ARTIFACT_VERSION
+
+    model = tf.keras.models.model_from_json(json.dumps(manifest["model"]))
+
+    # set_weights copies the weights to the variables, the file is read at once
+    flat = np.load(os.path.join(path, "weights.npy"))
+
+    weights = []
+    i = 0
+    for shape in manifest["weights"]:
+        n = int(np.prod(shape))
+        weights.append(flat[i : i + n].reshape(shape))
+        i += n
+
+    model.set_weights(weights)
+
+    return model, manifest
@@ -1,8 +1,10 @@
 import numpy as np 
 import tensorflow as tf 
+from concurrent.futures import ThreadPoolExecutor
 
 from .utils import *
 from .solve import *
+from .solve import _solver_optimizer
 from .emulate import *
 
 def initialize_iceflow_diagnostic(params,state):
@@ -11,13 +13,26 @@ def initialize_iceflow_diagnostic(params,state):
     
     initialize_iceflow_solver(params,state)
 
+    # in diagnostic mode, the solver computes the reference velocity
+    register_optimizer(state, "optimizer", ["UT", "VT"])
+
     state.UT = tf.Variable(
-        tf.zeros((params.iflo_Nz, state.thk.shape[0], state.thk.shape[1]))
+        tf.zeros((params.iflo_Nz, state.thk.shape[0], state.thk.shape[1]), dtype=state.thk.dtype)
     )
     state.VT = tf.Variable(
-        tf.zeros((params.iflo_Nz, state.thk.shape[0], state.thk.shape[1]))
+        tf.zeros((params.iflo_Nz, state.thk.shape[0], state.thk.shape[1]), dtype=state.thk.dtype)
     )
 
+    # one reference solve at a time runs in the background, with its own velocity and optimizer
+    if params.iflo_diagnostic_async:
+        state.diagnostic_executor = ThreadPoolExecutor(max_workers=1)
+        state.diagnostic_future = None
+        state.diagnostic_solver = {
+            "U": tf.Variable(state.UT),
+            "V": tf.Variable(state.VT),
+            "optimizer": _solver_optimizer(params),
+        }
+
 def update_iceflow_diagnostic(params, state):
     
     if params.iflo_retrain_emulator_freq > 0:
@@ -28,7 +43,10 @@ def update_iceflow_diagnostic(params, state):
 
     update_iceflow_emulated(params, state)
 
-    if state.it % 10 == 0:
+    if params.iflo_diagnostic_async:
+        _update_iceflow_diagnostic_async(params, state, COST_Emulator)
+
+    elif state.it % 10 == 0:
         UT, VT, Cost_Glen = solve_iceflow(params, state, state.UT, state.VT)
         state.UT.assign(UT)
         state.VT.assign(VT)
@@ -40,11 +58,72 @@ def update_iceflow_diagnostic(params, state):
 
         ERR = [state.t.numpy(), COST_Glen, COST_Emulator, l1, l2]
 
-        print(ERR)
+        _write_errors(ERR)
+
+
+def _update_iceflow_diagnostic_async(params, state, COST_Emulator):
+    """
+    The reference solve runs on a background thread, on a copy of the inputs,
+    with its own velocity and optimizer. Its result is published to the state
+    (UT, VT) and its errors are written once it is done, on the main thread.
+    The inputs are not copied (this evaluation is skipped) while the former
+    reference solve is still running.
+    """
+
+    if (state.diagnostic_future is not None) and state.diagnostic_future.done():
+        _collect_reference(params, state)
+
+    if (state.it % 10 == 0) and (state.diagnostic_future is None):
+        snapshot = {
+            "t": state.t.numpy(),
+            "fieldin": [tf.identity(vars(state)[f]) for f in params.iflo_fieldin],
+            "U": tf.identity(state.U),
+            "V": tf.identity(state.V),
+            "COST_Emulator": COST_Emulator,
+        }
+        state.diagnostic_future = state.diagnostic_executor.submit(
+            _solve_reference, params, state.diagnostic_solver, snapshot
+        )
+
+def _solve_reference(params, solver, snapshot):
+    # the background solve does not access the state, only its own velocity and optimizer
+    with tf.device(params.iflo_diagnostic_device or None):
+        UT, VT, Cost_Glen = solve_iceflow(
+            params, None, solver["U"], solver["V"], fieldin=snapshot["fieldin"],
+            optimizer=solver["optimizer"], nbitmax=params.iflo_solve_nbitmax,
+        )
+        solver["U"].assign(UT)
+        solver["V"].assign(VT)
+
+    return snapshot, UT, VT, Cost_Glen
+
+def _collect_reference(params, state):
+    snapshot, UT, VT, Cost_Glen = state.diagnostic_future.result()
+    state.diagnostic_future = None
+
+    state.UT.assign(UT)
+    state.VT.assign(VT)
+
+    print("nb solve iterations :", len(Cost_Glen))
+
+    thk = snapshot["fieldin"][params.iflo_fieldin.index("thk")]
+
+    l1, l2 = computemisfit(state, thk, snapshot["U"] - UT, snapshot["V"] - VT)
+
+    _write_errors([snapshot["t"], Cost_Glen[-1].numpy(), snapshot["COST_Emulator"], l1, l2])
+
+def _write_errors(ERR):
+    print(ERR)
 
-        with open("errors.txt", "ab") as f:
-            np.savetxt(f, np.expand_dims(ERR, axis=0), delimiter=",", fmt="%5.5f")
+    with open("errors.txt", "ab") as f:
+        np.savetxt(f, np.expand_dims(ERR, axis=0), delimiter=",", fmt="%5.5f")
 
+def finalize_iceflow_diagnostic(params, state):
+    # the last reference solve is waited for
+    if params.iflo_diagnostic_async:
+        if state.diagnostic_future is not None:
+            _collect_reference(params, state)
+        state.diagnostic_executor.shutdown()
 
 def computemisfit(state, thk, U, V):
     ubar = tf.reduce_sum(state.vert_weight * U, axis=0)
@@ -0,0 +1,124 @@
+import numpy as np
+import tensorflow as tf
+import copy
+import time
+
+from .energy_iceflow import *
+from .neural_network import *
+from .replay import ReplayBuffer
+from .utils import compute_PAD
+
+
+def gather_distill_states(params, state, X):
+    """
+    Keep (a uniform sample of) the input stacks X of the emulator met during the
+    run, up to the distillation
+    """
+    if not hasattr(state, "distill_buffer"):
+        state.distill_buffer = ReplayBuffer(params.iflo_distill_nb_samples)
+
+    state.distill_buffer.add(X)
+
+
+def _energy(params, X, Y):
+    iz = params.iflo_exclude_borders
+
+    if iz>0:
+        C_shear, C_slid, C_grav, C_float = iceflow_energy_XY(params, X[:, iz:-iz, iz:-iz, :], Y[:, iz:-iz, iz:-iz, :])
+    else:
+        C_shear, C_slid, C_grav, C_float = iceflow_energy_XY(params, X, Y)
+
+    return tf.reduce_mean(C_shear) + tf.reduce_mean(C_slid) \
+         + tf.reduce_mean(C_grav)  + tf.reduce_mean(C_float)
+
+
+def _forward_time(model, X, nb=5):
+    model(X).numpy()
+    times = []
+    for i in range(nb):
+        t0 = time.perf_counter()
+        model(X).numpy()
+        times.append(time.perf_counter() - t0)
+    return np.median(times)
+
+
+def distill_emulator(params, state):
+    """
+    Train a smaller CNN (the student, with iflo_distill_nb_layers layers of
+    iflo_distill_nb_out_filter filters) on the states gathered during the run,
+    to match the outputs of the emulator (the teacher) while minimizing the
+    Blatter-Pattyn energy. The student replaces the teacher for the rest of the
+    run if its relative energy error does not exceed iflo_distill_max_energy_error.
+    The speedup and the energy error are printed, and kept in state.distill_report.
+    """
+    teacher = state.iceflow_model
+
+    Ny, Nx, nc = state.distill_buffer.shape
+    X = state.distill_buffer.sample(len(state.distill_buffer), (Ny, Nx, nc), state.thk.dtype)
+
+    PAD = compute_PAD(params, Nx, Ny)
+
+    def outputs(model, X):
+        return tf.cast(model(tf.pad(X, PAD, "CONSTANT"))[:, :Ny, :Nx, :], X.dtype)
+
+    Yt = [outputs(teacher, X[i : i + 1]) for i in range(X.shape[0])]
+    Et = [_energy(params, X[i : i + 1], Yt[i]) for i in range(X.shape[0])]
+
+    student_params = copy.copy(params)
+    student_params.iflo_nb_layers = params.iflo_distill_nb_layers
+    student_params.iflo_nb_out_filter = params.iflo_distill_nb_out_filter
+
+    student = cnn(student_params, nc, teacher.output_shape[-1])
+    if not params.precision == "float32":
+        student = set_model_precision(student, params.precision)
+
+    if (int(tf.__version__.split(".")[1]) <= 10) | (int(tf.__version__.split(".")[1]) >= 16) :
+        optimizer = getattr(tf.keras.optimizers,params.iflo_optimizer_emulator)(
+            learning_rate=params.iflo_distill_lr
+        )
+    else:
+        optimizer = getattr(tf.keras.optimizers.legacy,params.iflo_optimizer_emulator)(
+            learning_rate=params.iflo_distill_lr
+        )
+
+    for epoch in range(params.iflo_distill_nbit):
+        for i in range(X.shape[0]):
+            with tf.GradientTape() as t:
+                Ys = outputs(student, X[i : i + 1])
+
+                # misfit to the teacher, and energy excess of the student, both relative
+                COST = tf.reduce_mean((Ys - Yt[i]) ** 2) / tf.reduce_mean(Yt[i] ** 2) \
+                     + params.iflo_distill_energy_weight \
+                     * (_energy(params, X[i : i + 1], Ys) - Et[i]) / tf.abs(Et[i])
+
+            grads = t.gradient(COST, student.trainable_variables)
+
+            optimizer.apply_gradients(zip(grads, student.trainable_variables))
+
+        if (epoch + 1) % 100 == 0:
+            print("distill : ", epoch, COST.numpy())
+
+    energy_error = np.mean([
+        ((_energy(params, X[i : i + 1], outputs(student, X[i : i + 1])) - Et[i]) / tf.abs(Et[i])).numpy()
+        for i in range(X.shape[0])
+    ])
+
+    speedup = _forward_time(teacher, tf.pad(X[:1], PAD, "CONSTANT")) \
+            / _forward_time(student, tf.pad(X[:1], PAD, "CONSTANT"))
+
+    swapped = bool(energy_error <= params.iflo_distill_max_energy_error)
+
+    state.distill_report = {
+        "speedup": float(speedup),
+        "energy_error": float(energy_error),
+        "swapped": swapped,
+    }
+
+    print(
+        "Distilled emulator: speedup %.2f, relative energy error %.4f, %s"
+        % (speedup, energy_error, "swapped in" if swapped else "not swapped in")
+    )
+
+    if swapped:
+        state.iceflow_model = student
+        state.iceflow_model.compile()
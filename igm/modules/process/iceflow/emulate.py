@@ -2,13 +2,22 @@
 import numpy as np 
 import tensorflow as tf 
 import os
+import math
 
+from igm.common import register_optimizer
 from .utils import *
 from .energy_iceflow import *
 from .neural_network import *
+from .replay import ReplayBuffer
+from .artifact import build_emulator_artifact, load_emulator_artifact
+from .distill import gather_distill_states, distill_emulator
+from .quantize import quantize_emulator
 
 from igm import emulators
 import importlib_resources
+
+# emulators loaded with iflo_emulator_cache, indexed by directory
+_EMULATOR_CACHE = {}
   
 def initialize_iceflow_emulator(params,state):
 
@@ -20,6 +29,7 @@ def initialize_iceflow_emulator(params,state):
         state.opti_retrain = getattr(tf.keras.optimizers.legacy,params.iflo_optimizer_emulator)( 
             learning_rate=params.iflo_retrain_emulator_lr
         )
+    register_optimizer(state, "opti_retrain", ["iceflow_model"])
 
     direct_name = (
         "pinnbp"
@@ -61,17 +71,34 @@ def initialize_iceflow_emulator(params,state):
             else:
                 print("----------------------------------> No pretrained emulator found ")
 
-        fieldin = []
-        fid = open(os.path.join(dirpath, "fieldin.dat"), "r")
-        for fileline in fid:
-            part = fileline.split()
-            fieldin.append(part[0])
-        fid.close()
+        if params.iflo_emulator_cache and (str(dirpath) in _EMULATOR_CACHE):
+            # reuse the model loaded in a previous run, with its original weights
+            state.iceflow_model, weights, fieldin = _EMULATOR_CACHE[str(dirpath)]
+            state.iceflow_model.set_weights(weights)
+        else:
+            if params.iflo_emulator_artifact:
+                # the emulator is converted once into an artifact, which loads fast
+                path = build_emulator_artifact(
+                    dirpath, os.path.expanduser(params.iflo_emulator_artifact_directory)
+                )
+                state.iceflow_model, manifest = load_emulator_artifact(path)
+                fieldin = manifest["fieldin"]
+            else:
+                fieldin = []
+                fid = open(os.path.join(dirpath, "fieldin.dat"), "r")
+                for fileline in fid:
+                    part = fileline.split()
+                    fieldin.append(part[0])
+                fid.close()
+                state.iceflow_model = tf.keras.models.load_model(
+                    os.path.join(dirpath, "model.h5"), compile=False
+                )
+            state.iceflow_model.compile() 
+            if params.iflo_emulator_cache:
+                _EMULATOR_CACHE[str(dirpath)] = (
+                    state.iceflow_model, state.iceflow_model.get_weights(), fieldin
+                )
         assert params.iflo_fieldin == fieldin
-        state.iceflow_model = tf.keras.models.load_model(
-            os.path.join(dirpath, "model.h5"), compile=False
-        )
-        state.iceflow_model.compile() 
     else:
         print("----------------------------------> No pretrained emulator, start from scratch.") 
         nb_inputs = len(params.iflo_fieldin) + (params.iflo_dim_arrhenius == 3) * (
@@ -86,6 +113,22 @@ def initialize_iceflow_emulator(params,state):
         elif params.iflo_network=='unet':
             state.iceflow_model = unet(params, nb_inputs, nb_outputs)
 
+    # the emulator computes in the precision given by the precision option
+    if not params.precision == "float32":
+        state.iceflow_model = set_model_precision(state.iceflow_model, params.precision)
+        state.iceflow_model.compile()
+
+    # the patches of the former retrainings are replayed with the current ones
+    if params.iflo_replay_size > 0:
+        state.replay_buffer = ReplayBuffer(
+            params.iflo_replay_size, params.iflo_replay_downsample, params.iflo_replay_eviction
+        )
+
+    # the compiled forward passes are traced once per bucket of input shapes
+    state.iceflow_forward_cache = {}
+    if params.iflo_compile_cache_directory != "":
+        _set_xla_persistent_cache(params.iflo_compile_cache_directory)
+
     # direct_name = 'pinnbp_10_4_cnn_16_32_2_1'        
     # dirpath = importlib_resources.files(emulators).joinpath(direct_name)
     # iceflow_model_pretrained = tf.keras.models.load_model(
@@ -99,34 +142,49 @@ def initialize_iceflow_emulator(params,state):
 def update_iceflow_emulated(params, state):
     # Define the input of the NN, include scaling
 
-    Ny, Nx = state.thk.shape
+    Ny, Nx = state.thk.shape[-2:]
     N = params.iflo_Nz
 
     fieldin = [vars(state)[f] for f in params.iflo_fieldin]
 
     X = fieldin_to_X(params, fieldin)
 
-    if params.iflo_exclude_borders>0:
-        iz = params.iflo_exclude_borders
-        X = tf.pad(X, [[0, 0], [iz, iz], [iz, iz], [0, 0]], "SYMMETRIC")
-        
-    if params.iflo_multiple_window_size==0:
-        Y = state.iceflow_model(X)
-    else:
-        Y = state.iceflow_model(tf.pad(X, state.PAD, "CONSTANT"))[:, :Ny, :Nx, :]
+    # the states met up to the distillation are gathered to train the student
+    if params.iflo_distill and (not hasattr(state, "distill_report")) and tf.executing_eagerly():
+        gather_distill_states(params, state, X)
 
-    if params.iflo_exclude_borders>0:
-        iz = params.iflo_exclude_borders
-        Y = Y[:, iz:-iz, iz:-iz, :]
+    # the emulator is evaluated on the ice-covered region only, unless it is not cheaper
+    if not (params.iflo_crop_active_region and _emulate_active_region(params, state, X)):
 
-    U, V = Y_to_UV(params, Y)
-    U = U[0]
-    V = V[0]
+        if params.iflo_exclude_borders>0:
+            iz = params.iflo_exclude_borders
+            X = tf.pad(X, [[0, 0], [iz, iz], [iz, iz], [0, 0]], "SYMMETRIC")
+            
+        if params.iflo_tile_inference:
+            Y = _tiled_inference(params, state, X)
+        elif params.iflo_multiple_window_size==0:
+            Y = emulator_forward(params, state, X)
+        else:
+            Y = emulator_forward(params, state, tf.pad(X, state.PAD, "CONSTANT"))[:, :Ny, :Nx, :]
+
+        if params.iflo_exclude_borders>0:
+            iz = params.iflo_exclude_borders
+            Y = Y[:, iz:-iz, iz:-iz, :]
+
+        # with mixed_bfloat16, the output of the emulator is brought back to the fields precision
+        Y = tf.cast(Y, X.dtype)
+
+        U, V = Y_to_UV(params, Y)
 
-    #    U = tf.where(state.thk > 0, U, 0)
+        # in ensemble mode, the batch dimension is kept as the member dimension
+        if params.iflo_ensemble_size == 0:
+            U = U[0]
+            V = V[0]
 
-    state.U.assign(U)
-    state.V.assign(V)
+        #    U = tf.where(state.thk > 0, U, 0)
+
+        state.U.assign(U)
+        state.V.assign(V)
 
     # If requested, the speeds are artifically upper-bounded
     if params.iflo_force_max_velbar > 0:
@@ -148,9 +206,267 @@ def update_iceflow_emulated(params, state):
 
     update_2d_iceflow_variables(params, state)
 
+    # the inputs and velocity of this evaluation are the reference of the lazy velocity
+    if params.iflo_lazy_velocity and tf.executing_eagerly():
+        _record_velocity(params, state)
+
+
+def _host_time(state):
+    # the time read by the scheduler in this time step, if any
+    if not hasattr(state, "t"):
+        return 0.0
+    if hasattr(state, "scheduler"):
+        return state.scheduler.time(state)
+    return float(state.t.numpy())
+
+
+def _record_velocity(params, state):
+    state.lazy_fieldin = [tf.identity(vars(state)[f]) for f in params.iflo_fieldin]
+    state.lazy_model_id = id(state.iceflow_model)
+    state.lazy_U_prev = getattr(state, "lazy_U", None)
+    state.lazy_V_prev = getattr(state, "lazy_V", None)
+    state.lazy_t_prev = getattr(state, "lazy_t", None)
+    state.lazy_U = tf.identity(state.U)
+    state.lazy_V = tf.identity(state.V)
+    state.lazy_t = _host_time(state)
+
+
+def _relative_change(params, fields, fields0):
+    # the changes of all the fields are reduced on the device, and read at once
+    num, den = [], []
+    for f, f0 in zip(fields, fields0):
+        d = tf.abs(f - f0)
+        if params.iflo_lazy_velocity_norm == "rms":
+            num.append(tf.sqrt(tf.reduce_mean(d**2)))
+            den.append(tf.sqrt(tf.reduce_mean(f0**2)))
+        else:
+            num.append(tf.reduce_max(d))
+            den.append(tf.reduce_max(tf.abs(f0)))
+    num = tf.stack(num)
+    den = tf.stack(den)
+    change = tf.where(
+        den > 0, num / den, tf.where(num > 0, np.inf * tf.ones_like(num), tf.zeros_like(num))
+    )
+    return float(tf.reduce_max(change).numpy())
+
+
+def reuse_velocity(params, state):
+    """
+    Reuse the velocity of the last evaluation of the emulator (or extrapolate it
+    linearly in time from the two last evaluations) as long as the relative change
+    of the inputs of the emulator since this evaluation does not exceed
+    iflo_lazy_velocity_tol, and the emulator has not changed. Returns whether the
+    velocity was reused, the number of reuses is counted in state.lazy_velocity_skipped.
+    """
+    if (getattr(state, "lazy_fieldin", None) is None) or \
+       (not getattr(state, "lazy_model_id", None) == id(state.iceflow_model)):
+        return False
+
+    change = _relative_change(
+        params, [vars(state)[f] for f in params.iflo_fieldin], state.lazy_fieldin
+    )
+
+    if change > params.iflo_lazy_velocity_tol:
+        return False
+
+    if params.iflo_lazy_velocity_extrapolate and (state.lazy_U_prev is not None) \
+       and (state.lazy_t > state.lazy_t_prev):
+        w = (_host_time(state) - state.lazy_t) / (state.lazy_t - state.lazy_t_prev)
+        state.U.assign(state.lazy_U + w * (state.lazy_U - state.lazy_U_prev))
+        state.V.assign(state.lazy_V + w * (state.lazy_V - state.lazy_V_prev))
+        update_2d_iceflow_variables(params, state)
+
+    state.lazy_velocity_skipped = getattr(state, "lazy_velocity_skipped", 0) + 1
+
+    return True
+
+
+def emulator_forward(params, state, X, differentiable=False):
+    """
+    Evaluate the emulator on X. With iflo_compile_emulator, the input is padded
+    (with zeros, at the bottom and right) to a bucket size, and evaluated with an
+    XLA-compiled concrete function traced once per bucket, such that the varying
+    input shapes do not trigger retracing. With iflo_inference_backend int8 or
+    float16, the quantized emulator is used instead, unless the output must be
+    differentiable (e.g. for the data assimilation).
+    """
+    if (not params.iflo_inference_backend == "keras") and (not differentiable) and tf.executing_eagerly():
+        # the emulator is quantized again once its weights have changed
+        if not getattr(state, "quantized_emulator_key", None) == id(state.iceflow_model):
+            state.quantized_emulator = quantize_emulator(params, state.iceflow_model, X)
+            state.quantized_emulator_key = id(state.iceflow_model)
+        if state.quantized_emulator is not None:
+            return state.quantized_emulator(X)
+
+    if (not params.iflo_compile_emulator) or (None in X.shape):
+        return state.iceflow_model(X)
+
+    nb, Ny, Nx, nc = X.shape
+
+    h = _bucket_size(Ny, params.iflo_compile_bucket, math.inf)
+    w = _bucket_size(Nx, params.iflo_compile_bucket, math.inf)
+
+    # the cache is tied to the model, which may be replaced (e.g. a new precision)
+    key = (id(state.iceflow_model), nb, h, w, nc, X.dtype.name)
+
+    if key not in state.iceflow_forward_cache:
+        model = state.iceflow_model
+        forward = tf.function(lambda X: model(X, training=False), jit_compile=True)
+        state.iceflow_forward_cache[key] = forward.get_concrete_function(
+            tf.TensorSpec((nb, h, w, nc), X.dtype)
+        )
+
+    Y = state.iceflow_forward_cache[key](tf.pad(X, [[0, 0], [0, h - Ny], [0, w - Nx], [0, 0]]))
+
+    return Y[:, :Ny, :Nx, :]
+
+
+def _set_xla_persistent_cache(directory):
+    # the XLA flags are read at the first compilation of the process
+    os.makedirs(directory, exist_ok=True)
+    flag = "--tf_xla_persistent_cache_directory=" + os.path.abspath(directory)
+    flags = os.environ.get("TF_XLA_FLAGS", "")
+    if flag not in flags:
+        os.environ["TF_XLA_FLAGS"] = (flags + " " + flag).strip()
+
+
+def _bucket_size(n, base, nmax):
+    # the sizes grow by a factor ~sqrt(2) from base, in multiples of 8
+    s = base
+    while s < n:
+        s = int(math.ceil(s * math.sqrt(2) / 8)) * 8
+    return min(s, nmax)
+
+
+def _active_region_boxes(params, thk):
+    """
+    Boxes covering the ice (thk > 0 in any member) extended by a halo of the
+    width of the receptive field of the CNN, such that the velocity on the ice
+    does not depend on the box border. The box sizes are rounded up to a small
+    set of bucket sizes. Each box comes with the mask of the cells it writes
+    back, the masks of the different boxes being disjoint.
+    """
+    from scipy import ndimage
+
+    mask = np.any(thk.numpy() > 0, axis=tuple(range(len(thk.shape) - 2)))
+
+    halo = params.iflo_nb_layers * (params.iflo_conv_ker_size - 1) // 2
+
+    region = ndimage.maximum_filter(mask.astype(np.uint8), size=2 * halo + 1, mode="constant") > 0
+
+    labels, __ = ndimage.label(region, structure=np.ones((3, 3)))
+
+    Ny, Nx = mask.shape
+
+    boxes = []
+    for i, (sy, sx) in enumerate(ndimage.find_objects(labels)):
+        h = _bucket_size(sy.stop - sy.start, params.iflo_crop_bucket, Ny)
+        w = _bucket_size(sx.stop - sx.start, params.iflo_crop_bucket, Nx)
+        y0 = min(sy.start, Ny - h)
+        x0 = min(sx.start, Nx - w)
+        boxes.append((y0, y0 + h, x0, x0 + w, labels[y0 : y0 + h, x0 : x0 + w] == i + 1))
+
+    return boxes
+
+
+def _emulate_active_region(params, state, X):
+    """
+    Evaluate the emulator on the boxes covering the ice, the boxes of the same
+    size being stacked in one batch, and scatter the result back into state.U
+    and state.V (zero elsewhere). Returns False, without doing anything, if the
+    boxes cover more cells than the domain.
+    """
+    boxes = _active_region_boxes(params, state.thk)
+
+    if sum((y1 - y0) * (x1 - x0) for y0, y1, x0, x1, __ in boxes) >= np.prod(X.shape[1:3]):
+        return False
+
+    state.U.assign(tf.zeros_like(state.U))
+    state.V.assign(tf.zeros_like(state.V))
+
+    groups = {}
+    for box in boxes:
+        groups.setdefault((box[1] - box[0], box[3] - box[2]), []).append(box)
+
+    nb = X.shape[0]
+
+    for group in groups.values():
+        Y = emulator_forward(
+            params, state, tf.concat([X[:, y0:y1, x0:x1, :] for y0, y1, x0, x1, __ in group], axis=0)
+        )
+
+        U, V = Y_to_UV(params, tf.cast(Y, X.dtype))
+
+        for j, (y0, y1, x0, x1, m) in enumerate(group):
+            Ub = U[j * nb : (j + 1) * nb]
+            Vb = V[j * nb : (j + 1) * nb]
+            if params.iflo_ensemble_size == 0:
+                Ub = Ub[0]
+                Vb = Vb[0]
+            state.U[..., y0:y1, x0:x1].assign(tf.where(m, Ub, state.U[..., y0:y1, x0:x1]))
+            state.V[..., y0:y1, x0:x1].assign(tf.where(m, Vb, state.V[..., y0:y1, x0:x1]))
+
+    return True
+
+
+def _tile_windows(n, t, halo):
+    # split [0,n) in intervals of size <= t, each one with a window of fixed size
+    # extending it by halo on both sides, shifted (not cut) at the domain borders
+    if n <= t + 2 * halo:
+        return [(0, n, 0, n)]
+    k = math.ceil(n / t)
+    t = math.ceil(n / k)
+    windows = []
+    for i in range(k):
+        i0 = i * t
+        i1 = min(n, i0 + t)
+        w0 = min(max(i0 - halo, 0), n - t - 2 * halo)
+        windows.append((w0, w0 + t + 2 * halo, i0, i1))
+    return windows
+
+
+def _tiled_inference(params, state, X):
+    """
+    Evaluate the emulator tile-wise, each tile being extended by a halo of the
+    width of the receptive field of the CNN, such that stitching the interiors
+    of the tiles gives the same result as a single call on the full grid. The
+    tile size is set from the memory budget iflo_tile_memory, several tiles
+    being evaluated in one batch if they fit in the budget.
+    """
+    nb, Ny, Nx, nc = X.shape
+
+    halo = params.iflo_nb_layers * (params.iflo_conv_ker_size - 1) // 2
+
+    # the live activations are dominated by two hidden layers of the CNN
+    bytes_per_cell = X.dtype.size * (2 * params.iflo_nb_out_filter + nc + 2 * params.iflo_Nz)
+    cells = params.iflo_tile_memory * 1024**2 / (nb * bytes_per_cell)
+
+    t = int(math.sqrt(cells)) - 2 * halo
+    if t < halo:
+        raise ValueError("iflo_tile_memory is too small for the receptive field of the emulator")
+
+    windows = [(wy, wx) for wy in _tile_windows(Ny, t, halo) for wx in _tile_windows(Nx, t, halo)]
+
+    Th = windows[0][0][1] - windows[0][0][0]
+    Tw = windows[0][1][1] - windows[0][1][0]
+    batch = max(1, int(cells // (Th * Tw)))
+
+    interiors = []
+    for k in range(0, len(windows), batch):
+        Y = emulator_forward(
+            params, state, tf.concat([X[:, y0:y1, x0:x1, :] for (y0, y1, __, __), (x0, x1, __, __) in windows[k : k + batch]], axis=0)
+        )
+        for j, ((y0, __, i0, i1), (x0, __, j0, j1)) in enumerate(windows[k : k + batch]):
+            interiors.append(Y[j * nb : (j + 1) * nb, i0 - y0 : i1 - y0, j0 - x0 : j1 - x0, :])
+
+    nx = len(_tile_windows(Nx, t, halo))
+    rows = [tf.concat(interiors[i : i + nx], axis=2) for i in range(0, len(interiors), nx)]
+
+    return tf.concat(rows, axis=1)
+
 
 def update_iceflow_emulator(params, state):
-    if (state.it < 0) | (state.it % params.iflo_retrain_emulator_freq == 0):
+    if (state.it < 0) or state.scheduler.due("iceflow_retrain", state):
         fieldin = [vars(state)[f] for f in params.iflo_fieldin]
 
 ########################
@@ -166,7 +482,22 @@ def update_iceflow_emulator(params, state):
 
         XX = fieldin_to_X(params, fieldin)
 
+        # with the adaptive policy, the emulator is retrained only if it has drifted
+        if params.iflo_retrain_emulator_adaptive and (state.it >= 0):
+            state.emulator_residual = _emulator_residual(params, state, XX)
+            if state.emulator_residual <= (1 + params.iflo_retrain_emulator_tol) * getattr(state, "emulator_residual_ref", 0):
+                return
+
         X = _split_into_patches(XX, params.iflo_retrain_emulator_framesizemax)
+
+        # the patches of the former retrainings are replayed with the current ones
+        if params.iflo_replay_size > 0:
+            XR = state.replay_buffer.sample(
+                int(math.ceil(params.iflo_replay_ratio * X.shape[0])), X.shape[1:], X.dtype
+            )
+            state.replay_buffer.add(X)
+            if XR is not None:
+                X = tf.concat([X, XR], axis=0)
         
         Ny = X.shape[1]
         Nx = X.shape[2]
@@ -181,52 +512,88 @@ def update_iceflow_emulator(params, state):
 
         iz = params.iflo_exclude_borders 
 
+        # the terms of the energy which do not depend on the emulator output are
+        # computed once for all the epochs, per patch (or per batch of patches)
+        if params.iflo_retrain_emulator_batched:
+            nb = _retrain_batch_size(params, X, PAD)
+        else:
+            nb = 1
+        geometries = [_patch_geometry(params, X[i : i + nb]) for i in range(0, X.shape[0], nb)]
+
         for epoch in range(nbit):
-            cost_emulator = tf.Variable(0.0)
+            # all the patches at once, with one accumulated optimizer step per epoch
+            if params.iflo_retrain_emulator_batched:
+                cost_emulator = _retrain_epoch_batched(params, state, X, PAD, geometries)
+
+                state.opti_retrain.lr = params.iflo_retrain_emulator_lr * (
+                    0.95 ** (epoch / 1000)
+                )
 
-            for i in range(X.shape[0]):
-                with tf.GradientTape() as t:
+                if (epoch + 1) % 100 == 0:
+                    print("train : ", epoch, cost_emulator.numpy())
 
-                    Y = state.iceflow_model(tf.pad(X[i:i+1, :, :, :], PAD, "CONSTANT"))[:,:Ny,:Nx,:]
+            else:
+                cost_emulator = tf.Variable(0.0, dtype=X.dtype)
+
+                for i in range(X.shape[0]):
+                    with tf.GradientTape() as t:
+
+                        Y = state.iceflow_model(tf.pad(X[i:i+1, :, :, :], PAD, "CONSTANT"))[:,:Ny,:Nx,:]
+
+                        # the energy is evaluated in the fields precision
+                        Y = tf.cast(Y, X.dtype)
                     
-                    if iz>0:
-                        C_shear, C_slid, C_grav, C_float = iceflow_energy_XY(params, X[i : i + 1, iz:-iz, iz:-iz, :], Y[:, iz:-iz, iz:-iz, :])
-                    else:
-                        C_shear, C_slid, C_grav, C_float = iceflow_energy_XY(params, X[i : i + 1, :, :, :], Y[:, :, :, :])
+                        if iz>0:
+                            C_shear, C_slid, C_grav, C_float = iceflow_energy_Y(params, Y[:, iz:-iz, iz:-iz, :], geometries[i])
+                        else:
+                            C_shear, C_slid, C_grav, C_float = iceflow_energy_Y(params, Y[:, :, :, :], geometries[i])
  
-                    COST = tf.reduce_mean(C_shear) + tf.reduce_mean(C_slid) \
-                         + tf.reduce_mean(C_grav)  + tf.reduce_mean(C_float)
+                        COST = tf.reduce_mean(C_shear) + tf.reduce_mean(C_slid) \
+                             + tf.reduce_mean(C_grav)  + tf.reduce_mean(C_float)
                     
-                    if (epoch + 1) % 100 == 0:
-                        print("---------- > ", tf.reduce_mean(C_shear).numpy(), tf.reduce_mean(C_slid).numpy(), tf.reduce_mean(C_grav).numpy(), tf.reduce_mean(C_float).numpy())
+                        if (epoch + 1) % 100 == 0:
+                            print("---------- > ", tf.reduce_mean(C_shear).numpy(), tf.reduce_mean(C_slid).numpy(), tf.reduce_mean(C_grav).numpy(), tf.reduce_mean(C_float).numpy())
 
-#                    state.C_shear = tf.pad(C_shear[0],[[0,1],[0,1]],"CONSTANT")
-#                    state.C_slid  = tf.pad(C_slid[0],[[0,1],[0,1]],"CONSTANT")
-#                    state.C_grav  = tf.pad(C_grav[0],[[0,1],[0,1]],"CONSTANT")
-#                    state.C_float = C_float[0] 
+    #                    state.C_shear = tf.pad(C_shear[0],[[0,1],[0,1]],"CONSTANT")
+    #                    state.C_slid  = tf.pad(C_slid[0],[[0,1],[0,1]],"CONSTANT")
+    #                    state.C_grav  = tf.pad(C_grav[0],[[0,1],[0,1]],"CONSTANT")
+    #                    state.C_float = C_float[0] 
 
-                    # print(state.C_shear.shape, state.C_slid.shape, state.C_grav.shape, state.C_float.shape,state.thk.shape )
+                        # print(state.C_shear.shape, state.C_slid.shape, state.C_grav.shape, state.C_float.shape,state.thk.shape )
 
-                    cost_emulator = cost_emulator + COST
+                        cost_emulator = cost_emulator + COST
 
-                    if (epoch + 1) % 100 == 0:
-                        U, V = Y_to_UV(params, Y)
-                        U = U[0]
-                        V = V[0]
-                        velsurf_mag = tf.sqrt(U[-1] ** 2 + V[-1] ** 2)
-                        print("train : ", epoch, COST.numpy(), np.max(velsurf_mag))
+                        if (epoch + 1) % 100 == 0:
+                            U, V = Y_to_UV(params, Y)
+                            U = U[0]
+                            V = V[0]
+                            velsurf_mag = tf.sqrt(U[-1] ** 2 + V[-1] ** 2)
+                            print("train : ", epoch, COST.numpy(), np.max(velsurf_mag))
 
-                grads = t.gradient(COST, state.iceflow_model.trainable_variables)
+                    grads = t.gradient(COST, state.iceflow_model.trainable_variables)
 
-                state.opti_retrain.apply_gradients(
-                    zip(grads, state.iceflow_model.trainable_variables)
-                )
+                    state.opti_retrain.apply_gradients(
+                        zip(grads, state.iceflow_model.trainable_variables)
+                    )
 
-                state.opti_retrain.lr = params.iflo_retrain_emulator_lr * (
-                    0.95 ** (epoch / 1000)
-                )
+                    state.opti_retrain.lr = params.iflo_retrain_emulator_lr * (
+                        0.95 ** (epoch / 1000)
+                    )
 
             state.COST_EMULATOR.append(cost_emulator)
+
+            # with the adaptive policy, stop once the energy no longer decreases
+            if params.iflo_retrain_emulator_adaptive and (epoch > 0):
+                if state.COST_EMULATOR[-1] >= state.COST_EMULATOR[-2]:
+                    break
+
+        # the quantized emulator and the lazy velocity are outdated
+        state.quantized_emulator_key = None
+        state.lazy_fieldin = None
+
+        # the residual right after retraining is the reference to detect a drift
+        if params.iflo_retrain_emulator_adaptive:
+            state.emulator_residual_ref = _emulator_residual(params, state, XX)
             
     
     if len(params.iflo_save_cost_emulator)>0:
@@ -234,6 +601,115 @@ def update_iceflow_emulator(params, state):
 
 
 
+def _patch_geometry(params, X):
+    # geometry of the energy of the patches X, without the excluded borders
+    iz = params.iflo_exclude_borders
+
+    if iz>0:
+        return iceflow_geometry_X(params, X[:, iz:-iz, iz:-iz, :])
+    else:
+        return iceflow_geometry_X(params, X)
+
+
+def _retrain_batch_size(params, X, PAD):
+    # the activations of all the layers are kept for the backward pass
+    npatch, Ny, Nx, nc = X.shape
+
+    if params.iflo_retrain_emulator_memory > 0:
+        bytes_per_patch = (Ny + PAD[1][1]) * (Nx + PAD[2][1]) * X.dtype.size \
+                        * (2 * params.iflo_nb_layers * params.iflo_nb_out_filter + nc + 2 * params.iflo_Nz)
+        return max(1, int(params.iflo_retrain_emulator_memory * 1024**2 // bytes_per_patch))
+    else:
+        return npatch
+
+
+def _retrain_epoch_batched(params, state, X, PAD, geometries):
+    """
+    One retraining epoch over all the patches of X, evaluated in batches of as
+    many patches as fit in the memory budget iflo_retrain_emulator_memory, with
+    the precomputed geometries of the batches. The gradients of the batches are
+    accumulated, and the optimizer does a single step. The epoch is compiled
+    once per model and patch shape.
+    """
+    key = (id(state.iceflow_model), id(state.opti_retrain)) + tuple(X.shape)
+
+    if getattr(state, "retrain_epoch_key", None) != key:
+        state.retrain_epoch = _build_retrain_epoch(params, state, X, PAD)
+        state.retrain_epoch_key = key
+
+    return state.retrain_epoch(X, geometries)
+
+
+def _build_retrain_epoch(params, state, X, PAD):
+    model = state.iceflow_model
+    optimizer = state.opti_retrain
+
+    npatch, Ny, Nx, nc = X.shape
+
+    iz = params.iflo_exclude_borders
+
+    nb = _retrain_batch_size(params, X, PAD)
+
+    @tf.function
+    def retrain_epoch(X, geometries):
+        grads = [tf.zeros_like(v) for v in model.trainable_variables]
+        cost = tf.constant(0.0, dtype=X.dtype)
+
+        for k, i in enumerate(range(0, npatch, nb)):
+            XB = X[i : i + nb]
+            with tf.GradientTape() as t:
+                Y = model(tf.pad(XB, PAD, "CONSTANT"))[:, :Ny, :Nx, :]
+
+                # the energy is evaluated in the fields precision
+                Y = tf.cast(Y, X.dtype)
+
+                if iz>0:
+                    C_shear, C_slid, C_grav, C_float = iceflow_energy_Y(params, Y[:, iz:-iz, iz:-iz, :], geometries[k])
+                else:
+                    C_shear, C_slid, C_grav, C_float = iceflow_energy_Y(params, Y, geometries[k])
+
+                # the mean over the batch is weighted by its share of the patches
+                COST = (tf.reduce_mean(C_shear) + tf.reduce_mean(C_slid) \
+                     +  tf.reduce_mean(C_grav)  + tf.reduce_mean(C_float)) * (XB.shape[0] / npatch)
+
+            grads = [g + dg for g, dg in zip(grads, t.gradient(COST, model.trainable_variables))]
+
+            # the cost is the sum over the patches, as in the patch-wise retraining
+            cost = cost + COST * npatch
+
+        optimizer.apply_gradients(zip(grads, model.trainable_variables))
+
+        return cost
+
+    return retrain_epoch
+
+
+def _emulator_residual(params, state, X):
+    """
+    Norm of the gradient of the energy with respect to the velocity given by the
+    emulator, which vanishes if the emulator minimizes the Blatter-Pattyn energy.
+    This costs one forward pass of the emulator, and no backward pass through it.
+    """
+    Ny, Nx = X.shape[1:3]
+
+    Y = emulator_forward(params, state, tf.pad(X, state.PAD, "CONSTANT"))[:, :Ny, :Nx, :]
+    Y = tf.cast(Y, X.dtype)
+
+    iz = params.iflo_exclude_borders
+
+    with tf.GradientTape() as t:
+        t.watch(Y)
+        if iz>0:
+            C_shear, C_slid, C_grav, C_float = iceflow_energy_XY(params, X[:, iz:-iz, iz:-iz, :], Y[:, iz:-iz, iz:-iz, :])
+        else:
+            C_shear, C_slid, C_grav, C_float = iceflow_energy_XY(params, X, Y)
+
+        COST = tf.reduce_mean(C_shear) + tf.reduce_mean(C_slid) \
+             + tf.reduce_mean(C_grav)  + tf.reduce_mean(C_float)
+
+    return float(tf.norm(t.gradient(COST, Y)).numpy())
+
+
 # def _update_iceflow_emulator_lbfgs(params, state):
 
 #     import tensorflow_probability as tfp
@@ -286,9 +762,11 @@ def _split_into_patches(X, nbmax):
     ly = int(ny / sy)
     lx = int(nx / sx)
 
-    for i in range(sx):
-        for j in range(sy):
-            XX.append(X[0, j * ly : (j + 1) * ly, i * lx : (i + 1) * lx, :])
+    # patches are taken from each element of the batch (e.g. each ensemble member)
+    for k in range(X.shape[0]):
+        for i in range(sx):
+            for j in range(sy):
+                XX.append(X[k, j * ly : (j + 1) * ly, i * lx : (i + 1) * lx, :])
 
     return tf.stack(XX, axis=0)
 
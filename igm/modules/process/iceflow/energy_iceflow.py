@@ -19,7 +19,7 @@ def _compute_gradient_stag(s, dX, dY):
 
 
 @tf.function(experimental_relax_shapes=True)
-def _compute_strainrate_Glen_tf(U, V, thk, slidingco, dX, ddz, sloptopgx, sloptopgy, thr):
+def _compute_strainrate_Glen_tf(U, V, slc, dX, ddz, sloptopgx, sloptopgy, thr):
     # Compute horinzontal derivatives
     dUdx = (U[:, :, :, 1:] - U[:, :, :, :-1]) / dX[0, 0, 0]
     dVdx = (V[:, :, :, 1:] - V[:, :, :, :-1]) / dX[0, 0, 0]
@@ -47,7 +47,6 @@ def _compute_strainrate_Glen_tf(U, V, thk, slidingco, dX, ddz, sloptopgx, slopto
         # vertical derivative if there is at least two layears
         dUdz = (Um[:, 1:, :, :] - Um[:, :-1, :, :]) / tf.maximum(ddz, thr)
         dVdz = (Vm[:, 1:, :, :] - Vm[:, :-1, :, :]) / tf.maximum(ddz, thr)
-        slc = tf.expand_dims(_stag4(slidingco), axis=1)
         dUdz = tf.where(slc > 0, dUdz, 0.01 * dUdz)
         dVdz = tf.where(slc > 0, dVdz, 0.01 * dVdz)
     else:
@@ -102,11 +101,20 @@ def _stag8(B):
 
 
 def iceflow_energy(params, U, V, fieldin):
+    return iceflow_energy_geometry(params, U, V, iceflow_geometry(params, fieldin))
+
+
+def iceflow_geometry(params, fieldin):
+    """
+    Precompute the terms of the energy that do not depend on the velocity (mask
+    of the ice, vertical discretization, slopes, rheology and sliding
+    coefficients, calving front), such that the energy can be evaluated many
+    times on the same geometry (e.g. in the solver or the retraining iterations)
+    with iceflow_energy_geometry
+    """
     thk, usurf, arrhenius, slidingco, dX = fieldin
 
-    return _iceflow_energy(
-        U,
-        V,
+    return _iceflow_geometry(
         thk,
         usurf,
         arrhenius,
@@ -116,25 +124,100 @@ def iceflow_energy(params, U, V, fieldin):
         params.iflo_vert_spacing,
         params.iflo_exp_glen,
         params.iflo_exp_weertman,
+        params.iflo_new_friction_param,
+        params.iflo_cf_cond,
+        params.iflo_cf_eswn,
+        len(arrhenius.shape) - 1,
+    )
+
+
+def iceflow_energy_geometry(params, U, V, geometry):
+    return _iceflow_energy_geometry(
+        U,
+        V,
+        geometry,
+        params.iflo_Nz,
+        params.iflo_exp_glen,
+        params.iflo_exp_weertman,
         params.iflo_regu_glen,
         params.iflo_regu_weertman,
         params.iflo_thr_ice_thk,
         params.iflo_ice_density,
         params.iflo_gravity_cst,
-        params.iflo_new_friction_param,
         params.iflo_cf_cond,
-        params.iflo_cf_eswn,
         params.iflo_regu,
         params.iflo_min_sr,
         params.iflo_max_sr,
-        params.iflo_force_negative_gravitational_energy
+        params.iflo_force_negative_gravitational_energy,
     )
 
 
+def iceflow_hessian_diagonal(params, U, V, geometry):
+    """
+    Approximation of the diagonal of the Hessian of the energy with respect to U
+    (or V), up to constant factors, on the geometry of iceflow_geometry: the
+    effective viscosity of the staggered cells times the layer thickness over dx^2
+    (horizontal derivatives) and over the layer thickness (vertical derivatives),
+    plus the linearized sliding coefficient at the base, gathered on the nodes
+    from their neighbouring cells. It costs a single evaluation of the strain
+    rate, and serves to precondition the Newton solver.
+    """
+    p = 1.0 + 1.0 / params.iflo_exp_glen
+    s = 1.0 + 1.0 / params.iflo_exp_weertman
+
+    dz = geometry["dz"]
+    dX = geometry["dX"][0, 0, 0]
+
+    sloptopgx, sloptopgy = geometry["sloptopgx"], geometry["sloptopgy"]
+
+    srx, srz = _compute_strainrate_Glen_tf(
+        U, V, geometry["slc"], geometry["dX"], dz,
+        tf.expand_dims(sloptopgx, axis=1), tf.expand_dims(sloptopgy, axis=1),
+        thr=params.iflo_thr_ice_thk,
+    )
+
+    sr = tf.clip_by_value(srx + srz, params.iflo_min_sr**2, params.iflo_max_sr**2)
+
+    # the staggered B is 2D, or 3D like dz
+    B = geometry["Bstag"]
+    if len(B.shape) == 3:
+        B = tf.expand_dims(B, axis=1)
+
+    visc = B * (sr + params.iflo_regu_glen**2) ** ((p - 2) / 2)
+
+    if U.shape[1] > 1:
+        H = visc * (dz / dX**2 + 1.0 / tf.maximum(dz, params.iflo_thr_ice_thk))
+    else:
+        H = visc * dz / dX**2
+
+    H = tf.where(geometry["COND"], H, 0.0)
+
+    # linearized sliding, N being the squared basal velocity as in the energy
+    N = (
+        _stag4(U[:, 0, :, :] ** 2 + V[:, 0, :, :] ** 2)
+        + params.iflo_regu_weertman**2
+        + (_stag4(U[:, 0, :, :]) * sloptopgx + _stag4(V[:, 0, :, :]) * sloptopgy) ** 2
+    )
+    Hb = geometry["Cstag"] * N ** ((s - 2) / 2)
+
+    def cells_to_nodes(h):
+        # sum of the (up to) 4 cells around each node, along the two last dimensions
+        pad = [[0, 0]] * (len(h.shape) - 2) + [[1, 1], [1, 1]]
+        h = tf.pad(h, pad, "CONSTANT")
+        return h[..., 1:, 1:] + h[..., 1:, :-1] + h[..., :-1, 1:] + h[..., :-1, :-1]
+
+    D = cells_to_nodes(H)
+
+    # sum of the (up to) 2 layers around each node
+    if U.shape[1] > 1:
+        D = tf.pad(D, [[0, 0], [1, 1], [0, 0], [0, 0]], "CONSTANT")
+        D = D[:, 1:] + D[:, :-1]
+
+    return tf.concat([D[:, :1] + tf.expand_dims(cells_to_nodes(Hb), axis=1), D[:, 1:]], axis=1)
+
+
 @tf.function(experimental_relax_shapes=True)
-def _iceflow_energy(
-    U,
-    V,
+def _iceflow_geometry(
     thk,
     usurf,
     arrhenius,
@@ -144,20 +227,13 @@ def _iceflow_energy(
     vert_spacing,
     exp_glen,
     exp_weertman,
-    regu_glen,
-    regu_weertman,
-    thr_ice_thk,
-    ice_density,
-    gravity_cst,
     new_friction_param,
     iflo_cf_cond,
     iflo_cf_eswn,
-    iflo_regu,
-    min_sr,
-    max_sr,
-    iflo_force_negative_gravitational_energy
+    dim_arrhenius,
 ):
-    # warning, the energy is here normalized dividing by int_Omega
+    # dim_arrhenius is passed as a python int (and not read from the shape of arrhenius), such
+    # that 2D and 3D arrhenius get distinct traces and not one trace of unknown rank
 
     COND = (
         (thk[:, 1:, 1:] > 0)
@@ -190,18 +266,93 @@ def _iceflow_energy(
         else:
             C = (slidingco + 10 ** (-12)) ** -(1.0 / exp_weertman)
 
-    p = 1.0 + 1.0 / exp_glen
-    s = 1.0 + 1.0 / exp_weertman
-
     sloptopgx, sloptopgy = _compute_gradient_stag(usurf - thk, dX, dX)
-    sloptopgx = tf.expand_dims(sloptopgx, axis=1)
-    sloptopgy = tf.expand_dims(sloptopgy, axis=1)
 
     # TODO : sloptopgx, sloptopgy must be the elevaion of layers! not the bedrock, this probably has very little effects.
 
+    slopsurfx, slopsurfy = _compute_gradient_stag(usurf, dX, dX)
+
+    geometry = {
+        "COND": COND,
+        "dz": dz,
+        "Bstag": _stag4(B) if dim_arrhenius == 2 else _stag8(B),
+        "Cstag": _stag4(C),
+        "slc": tf.expand_dims(_stag4(C), axis=1),
+        "dX": dX,
+        "sloptopgx": sloptopgx,
+        "sloptopgy": sloptopgy,
+        "slopsurfx": tf.expand_dims(slopsurfx, axis=1),
+        "slopsurfy": tf.expand_dims(slopsurfy, axis=1),
+    }
+
+    # if activae this applies the stress condition along the calving front
+    if iflo_cf_cond:
+
+        lsurf = usurf - thk
+        
+    #   Check formula (17) in [Jouvet and Graeser 2012], Unit is Mpa 
+        P =tf.where(lsurf<0, 0.5 * 10 ** (-6) * 9.81 * 910 * ( thk**2 - (1000/910)*lsurf**2 ) , 0.0)  / dX[:, 0, 0] 
+        
+        if len(iflo_cf_eswn) == 0:
+            thkext = tf.pad(thk,[[0,0],[1,1],[1,1]],"CONSTANT",constant_values=1)
+            lsurfext = tf.pad(lsurf,[[0,0],[1,1],[1,1]],"CONSTANT",constant_values=1)
+        else:
+            thkext = thk
+            thkext = tf.pad(thkext,[[0,0],[1,0],[0,0]],"CONSTANT",constant_values=1.0*('S' not in iflo_cf_eswn))
+            thkext = tf.pad(thkext,[[0,0],[0,1],[0,0]],"CONSTANT",constant_values=1.0*('N' not in iflo_cf_eswn))
+            thkext = tf.pad(thkext,[[0,0],[0,0],[1,0]],"CONSTANT",constant_values=1.0*('W' not in iflo_cf_eswn))
+            thkext = tf.pad(thkext,[[0,0],[0,0],[0,1]],"CONSTANT",constant_values=1.0*('E' not in iflo_cf_eswn)) 
+            lsurfext = lsurf
+            lsurfext = tf.pad(lsurfext,[[0,0],[1,0],[0,0]],"CONSTANT",constant_values=1.0*('S' not in iflo_cf_eswn))
+            lsurfext = tf.pad(lsurfext,[[0,0],[0,1],[0,0]],"CONSTANT",constant_values=1.0*('N' not in iflo_cf_eswn))
+            lsurfext = tf.pad(lsurfext,[[0,0],[0,0],[1,0]],"CONSTANT",constant_values=1.0*('W' not in iflo_cf_eswn))
+            lsurfext = tf.pad(lsurfext,[[0,0],[0,0],[0,1]],"CONSTANT",constant_values=1.0*('E' not in iflo_cf_eswn)) 
+        
+        # this permits to locate the calving front in a cell in the 4 directions
+        geometry["CF_W"] = P * tf.where((lsurf<0)&(thk>0)&(thkext[:,1:-1,:-2]==0)&(lsurfext[:,1:-1,:-2]<=0),1.0,0.0)
+        geometry["CF_E"] = P * tf.where((lsurf<0)&(thk>0)&(thkext[:,1:-1,2:]==0)&(lsurfext[:,1:-1,2:]<=0),1.0,0.0) 
+        geometry["CF_S"] = P * tf.where((lsurf<0)&(thk>0)&(thkext[:,:-2,1:-1]==0)&(lsurfext[:,:-2,1:-1]<=0),1.0,0.0)
+        geometry["CF_N"] = P * tf.where((lsurf<0)&(thk>0)&(thkext[:,2:,1:-1]==0)&(lsurfext[:,2:,1:-1]<=0),1.0,0.0)
+
+        if Nz > 1:
+            geometry["weight"] = tf.stack([tf.ones_like(thk) * z for z in temd], axis=1) # dimensionless, 
+
+    return geometry
+
+
+@tf.function(experimental_relax_shapes=True)
+def _iceflow_energy_geometry(
+    U,
+    V,
+    geometry,
+    Nz,
+    exp_glen,
+    exp_weertman,
+    regu_glen,
+    regu_weertman,
+    thr_ice_thk,
+    ice_density,
+    gravity_cst,
+    iflo_cf_cond,
+    iflo_regu,
+    min_sr,
+    max_sr,
+    iflo_force_negative_gravitational_energy,
+):
+    # warning, the energy is here normalized dividing by int_Omega
+
+    COND = geometry["COND"]
+    dz = geometry["dz"]
+
+    p = 1.0 + 1.0 / exp_glen
+    s = 1.0 + 1.0 / exp_weertman
+
+    sloptopgx = tf.expand_dims(geometry["sloptopgx"], axis=1)
+    sloptopgy = tf.expand_dims(geometry["sloptopgy"], axis=1)
+
     # sr has unit y^(-1)
     srx, srz = _compute_strainrate_Glen_tf(
-        U, V, thk, C, dX, dz, sloptopgx, sloptopgy, thr=thr_ice_thk
+        U, V, geometry["slc"], geometry["dX"], dz, sloptopgx, sloptopgy, thr=thr_ice_thk
     )
     
     sr = srx + srz
@@ -214,25 +365,24 @@ def _iceflow_energy(
  
 
     # C_shear is unit  Mpa y^(1/n) y^(-1-1/n) * m = Mpa m/y
-    if len(B.shape) == 3:
-        C_shear = _stag4(B) * tf.reduce_sum(dz * ((srcapped + regu_glen**2) ** ((p-2) / 2)) * sr, axis=1 ) / p
+    # (the staggered B is 2D, of the same rank as dz, or 3D)
+    if len(geometry["Bstag"].shape) == 3:
+        C_shear = geometry["Bstag"] * tf.reduce_sum(dz * ((srcapped + regu_glen**2) ** ((p-2) / 2)) * sr, axis=1 ) / p
     else:
-        C_shear = tf.reduce_sum( _stag8(B) * dz * ((srcapped + regu_glen**2) ** ((p-2) / 2)) * sr, axis=1 ) / p
+        C_shear = tf.reduce_sum( geometry["Bstag"] * dz * ((srcapped + regu_glen**2) ** ((p-2) / 2)) * sr, axis=1 ) / p
         
     if iflo_regu > 0:
         
         srx = tf.where(COND, srx, 0.0)
  
-        if len(B.shape) == 3:
-            C_shear_2 = _stag4(B) * tf.reduce_sum(dz * ((srx + regu_glen**2) ** (p / 2)), axis=1 ) / p
+        if len(geometry["Bstag"].shape) == 3:
+            C_shear_2 = geometry["Bstag"] * tf.reduce_sum(dz * ((srx + regu_glen**2) ** (p / 2)), axis=1 ) / p
         else:
-            C_shear_2 = tf.reduce_sum( _stag8(B) * dz * ((srx + regu_glen**2) ** (p / 2)), axis=1 ) / p 
+            C_shear_2 = tf.reduce_sum( geometry["Bstag"] * dz * ((srx + regu_glen**2) ** (p / 2)), axis=1 ) / p 
 
         C_shear = C_shear + iflo_regu*C_shear_2
-        
-    lsurf = usurf - thk
 
-    sloptopgx, sloptopgy = _compute_gradient_stag(lsurf, dX, dX)
+    sloptopgx, sloptopgy = geometry["sloptopgx"], geometry["sloptopgy"]
 
     # C_slid is unit Mpa y^m m^(-m) * m^(1+m) * y^(-1-m)  = Mpa  m/y
     N = (
@@ -240,11 +390,9 @@ def _iceflow_energy(
         + regu_weertman**2
         + (_stag4(U[:, 0, :, :]) * sloptopgx + _stag4(V[:, 0, :, :]) * sloptopgy) ** 2
     )
-    C_slid = _stag4(C) * N ** (s / 2) / s
+    C_slid = geometry["Cstag"] * N ** (s / 2) / s
 
-    slopsurfx, slopsurfy = _compute_gradient_stag(usurf, dX, dX)
-    slopsurfx = tf.expand_dims(slopsurfx, axis=1)
-    slopsurfy = tf.expand_dims(slopsurfy, axis=1)
+    slopsurfx, slopsurfy = geometry["slopsurfx"], geometry["slopsurfy"]
 
     if Nz > 1:
         uds = _stag8(U) * slopsurfx + _stag8(V) * slopsurfy
@@ -267,46 +415,19 @@ def _iceflow_energy(
     # if activae this applies the stress condition along the calving front
     if iflo_cf_cond:
 
-        ################################################################
-        
-        lsurf = usurf - thk
-        
-    #   Check formula (17) in [Jouvet and Graeser 2012], Unit is Mpa 
-        P =tf.where(lsurf<0, 0.5 * 10 ** (-6) * 9.81 * 910 * ( thk**2 - (1000/910)*lsurf**2 ) , 0.0)  / dX[:, 0, 0] 
-        
-        if len(iflo_cf_eswn) == 0:
-            thkext = tf.pad(thk,[[0,0],[1,1],[1,1]],"CONSTANT",constant_values=1)
-            lsurfext = tf.pad(lsurf,[[0,0],[1,1],[1,1]],"CONSTANT",constant_values=1)
-        else:
-            thkext = thk
-            thkext = tf.pad(thkext,[[0,0],[1,0],[0,0]],"CONSTANT",constant_values=1.0*('S' not in iflo_cf_eswn))
-            thkext = tf.pad(thkext,[[0,0],[0,1],[0,0]],"CONSTANT",constant_values=1.0*('N' not in iflo_cf_eswn))
-            thkext = tf.pad(thkext,[[0,0],[0,0],[1,0]],"CONSTANT",constant_values=1.0*('W' not in iflo_cf_eswn))
-            thkext = tf.pad(thkext,[[0,0],[0,0],[0,1]],"CONSTANT",constant_values=1.0*('E' not in iflo_cf_eswn)) 
-            lsurfext = lsurf
-            lsurfext = tf.pad(lsurfext,[[0,0],[1,0],[0,0]],"CONSTANT",constant_values=1.0*('S' not in iflo_cf_eswn))
-            lsurfext = tf.pad(lsurfext,[[0,0],[0,1],[0,0]],"CONSTANT",constant_values=1.0*('N' not in iflo_cf_eswn))
-            lsurfext = tf.pad(lsurfext,[[0,0],[0,0],[1,0]],"CONSTANT",constant_values=1.0*('W' not in iflo_cf_eswn))
-            lsurfext = tf.pad(lsurfext,[[0,0],[0,0],[0,1]],"CONSTANT",constant_values=1.0*('E' not in iflo_cf_eswn)) 
-        
-        # this permits to locate the calving front in a cell in the 4 directions
-        CF_W = tf.where((lsurf<0)&(thk>0)&(thkext[:,1:-1,:-2]==0)&(lsurfext[:,1:-1,:-2]<=0),1.0,0.0)
-        CF_E = tf.where((lsurf<0)&(thk>0)&(thkext[:,1:-1,2:]==0)&(lsurfext[:,1:-1,2:]<=0),1.0,0.0) 
-        CF_S = tf.where((lsurf<0)&(thk>0)&(thkext[:,:-2,1:-1]==0)&(lsurfext[:,:-2,1:-1]<=0),1.0,0.0)
-        CF_N = tf.where((lsurf<0)&(thk>0)&(thkext[:,2:,1:-1]==0)&(lsurfext[:,2:,1:-1]<=0),1.0,0.0)
- 
+        # the calving front masks of the geometry include the pressure P
         if Nz > 1:
             # Blatter-Pattyn
-            weight = tf.stack([tf.ones_like(thk) * z for z in temd], axis=1) # dimensionless, 
+            weight = geometry["weight"]
             C_float = (
-                  P * tf.reduce_sum(weight * _stag2(U), axis=1) * CF_W
-                - P * tf.reduce_sum(weight * _stag2(U), axis=1) * CF_E 
-                + P * tf.reduce_sum(weight * _stag2(V), axis=1) * CF_S 
-                - P * tf.reduce_sum(weight * _stag2(V), axis=1) * CF_N 
+                  tf.reduce_sum(weight * _stag2(U), axis=1) * geometry["CF_W"]
+                - tf.reduce_sum(weight * _stag2(U), axis=1) * geometry["CF_E"] 
+                + tf.reduce_sum(weight * _stag2(V), axis=1) * geometry["CF_S"] 
+                - tf.reduce_sum(weight * _stag2(V), axis=1) * geometry["CF_N"] 
             ) 
         else:
             # SSA
-            C_float = ( P * U * CF_W - P * U * CF_E  + P * V * CF_S - P * V * CF_N )  
+            C_float = ( U * geometry["CF_W"] - U * geometry["CF_E"]  + V * geometry["CF_S"] - V * geometry["CF_N"] )  
 
         ###########################################################
 
@@ -355,6 +476,16 @@ def iceflow_energy_XY(params, X, Y):
     return iceflow_energy(params, U, V, fieldin)
 
 
+def iceflow_energy_Y(params, Y, geometry):
+    U, V = Y_to_UV(params, Y)
+
+    return iceflow_energy_geometry(params, U, V, geometry)
+
+
+def iceflow_geometry_X(params, X):
+    return iceflow_geometry(params, X_to_fieldin(params, X))
+
+
 def Y_to_UV(params, Y):
     N = params.iflo_Nz
 
@@ -383,13 +514,21 @@ def fieldin_to_X(params, fieldin):
 
     fieldin_dim = [0, 0, 1 * (params.iflo_dim_arrhenius == 3), 0, 0]
 
+    # in ensemble mode, the member dimension of the fields is the batch dimension,
+    # fields shared by all members (e.g. dX) are broadcasted to all members
+    if params.iflo_ensemble_size > 0:
+        fieldin = [tf.broadcast_to(f, fieldin[0].shape) for f in fieldin]
+
     for f, s in zip(fieldin, fieldin_dim):
         if s == 0:
             X.append(tf.expand_dims(f, axis=-1))
         else:
             X.append(tf.experimental.numpy.moveaxis(f, [0], [-1]))
 
-    return tf.expand_dims(tf.concat(X, axis=-1), axis=0)
+    if params.iflo_ensemble_size > 0:
+        return tf.concat(X, axis=-1)
+    else:
+        return tf.expand_dims(tf.concat(X, axis=-1), axis=0)
 
 
 def X_to_fieldin(params, X):
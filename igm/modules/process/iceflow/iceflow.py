@@ -37,12 +37,12 @@ namely directly the velocity field U and V instead of the emulator parameters.
 
 import numpy as np
 import os
-import matplotlib.pyplot as plt
 import datetime, time
 import math
 import tensorflow as tf
 
 from igm.modules.utils import *
+from igm.common import schedule
 
 from .params_pretraining import *
 from .params_optimize import *
@@ -51,8 +51,6 @@ from .emulate import *
 from .solve import *
 from .diagnostic import *
 from .utils import *
-from .optimize import *
-from .pretraining import *
 
 def params(parser):
 
@@ -68,7 +66,17 @@ def initialize(params, state):
 
     state.tcomp_iceflow = []
 
+    # the fields of the ice flow are computed in the floating point type given by precision
+    cast_fields(state, ["thk", "usurf", "topg", "lsurf", "dX", "dx", "sealevel",
+                        "arrhenius", "slidingco", "U", "V"], field_dtype(params))
+
+    # the ensemble mode is only available for the forward emulated ice flow
+    if params.iflo_ensemble_size > 0:
+        assert params.iflo_type == "emulated"
+        assert not (params.iflo_run_pretraining | params.iflo_run_data_assimilation)
+
     if params.iflo_run_pretraining:
+        from .pretraining import pretraining
         pretraining(params, state)
 
     # deinfe the fields of the ice flow such a U, V, but also sliding coefficient, arrhenius, ectt
@@ -82,15 +90,34 @@ def initialize(params, state):
         # define the solver, and the optimizer
         initialize_iceflow_solver(params,state)
 
+        # the pretrained emulator provides the initial guess of the solver
+        if params.iflo_solve_warm_start:
+            assert params.iflo_pretrained_emulator
+            initialize_iceflow_emulator(params,state)
+
     elif params.iflo_type == "diagnostic":
         # define the second velocity field
         initialize_iceflow_diagnostic(params,state)
 
+    # the emulator is retrained every iflo_retrain_emulator_freq iterations
+    if params.iflo_retrain_emulator_freq > 0:
+        schedule(state, "iceflow_retrain", params.iflo_retrain_emulator_freq, unit="it")
+
     # create the vertica discretization
     define_vertical_weight(params, state)
 
+    # the halo of the cropped boxes is the receptive field of the CNN, without padding of the borders
+    if params.iflo_crop_active_region:
+        assert params.iflo_network == "cnn"
+        assert (params.iflo_exclude_borders==0) & (params.iflo_multiple_window_size==0)
+
+    # same for the halo of the tiles
+    if params.iflo_tile_inference:
+        assert params.iflo_network == "cnn"
+        assert params.iflo_multiple_window_size==0
+
     # padding is necessary when using U-net emulator
-    state.PAD = compute_PAD(params,state.thk.shape[1],state.thk.shape[0])
+    state.PAD = compute_PAD(params,state.thk.shape[-1],state.thk.shape[-2])
 
     if not params.iflo_type == "solved":
         update_iceflow_emulated(params, state)
@@ -101,6 +128,7 @@ def initialize(params, state):
     if params.iflo_run_data_assimilation:
         state.it = -1
         update_iceflow_emulator(params, state)
+        from .optimize import optimize
         optimize(params, state)
 
 def update(params, state):
@@ -113,7 +141,16 @@ def update(params, state):
         if params.iflo_retrain_emulator_freq > 0:
             update_iceflow_emulator(params, state)
 
-        update_iceflow_emulated(params, state)
+        # after the spin-up, the emulator is distilled into a smaller one
+        if params.iflo_distill and (state.it == params.iflo_distill_it):
+            distill_emulator(params, state)
+
+        # in lazy mode, the velocity is reused while the inputs barely change
+        if params.iflo_lazy_velocity and reuse_velocity(params, state):
+            if hasattr(state, "logger"):
+                state.logger.info("ICEFLOW velocity reused, skipped evaluations : " + str(state.lazy_velocity_skipped))
+        else:
+            update_iceflow_emulated(params, state)
 
     elif params.iflo_type == "solved":
         update_iceflow_solved(params, state)
@@ -124,9 +161,32 @@ def update(params, state):
     state.tcomp_iceflow[-1] -= time.time()
     state.tcomp_iceflow[-1] *= -1
 
+def update_graph_host(params, state):
+    # the retraining of the emulator is kept out of the graph step
+    if (params.iflo_type == "emulated") & (params.iflo_retrain_emulator_freq > 0):
+        update_iceflow_emulator(params, state)
+    if (params.iflo_type == "emulated") and params.iflo_distill and (state.it == params.iflo_distill_it):
+        distill_emulator(params, state)
+
+def update_graph(params, state):
+    if not params.iflo_type == "emulated":
+        raise ValueError("The graph_step option is only available with iflo_type emulated")
+    if params.iflo_crop_active_region:
+        raise ValueError("The graph_step option is not available with iflo_crop_active_region")
+    if params.iflo_lazy_velocity:
+        raise ValueError("The graph_step option is not available with iflo_lazy_velocity")
+
+    update_iceflow_emulated(params, state)
+
 def finalize(params, state):
     if params.iflo_save_model:
         save_iceflow_model(params, state)
+
+    if params.iflo_type == "diagnostic":
+        finalize_iceflow_diagnostic(params, state)
+
+    if params.iflo_lazy_velocity:
+        print("ICEFLOW lazy velocity : %d evaluations of the emulator skipped" % getattr(state, "lazy_velocity_skipped", 0))
    
  
   
\ No newline at end of file
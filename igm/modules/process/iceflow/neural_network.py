@@ -68,3 +68,27 @@ def unet(params, nb_inputs, nb_outputs):
         unpool=False,
         name="unet",
     )
+
+
+def set_model_precision(model, precision):
+    """
+    Routine serve to rebuild a model such that its layers compute in the given
+    precision: float32 (unchanged), mixed_bfloat16 (bfloat16 computations with
+    float32 weights), or float64
+    """
+
+    if precision == "float32":
+        return model
+
+    config = model.get_config()
+
+    for layer in config["layers"]:
+        if layer["class_name"] == "InputLayer":
+            layer["config"]["dtype"] = "float64" if precision == "float64" else "float32"
+        else:
+            layer["config"]["dtype"] = precision
+
+    new_model = tf.keras.models.Model.from_config(config)
+    new_model.set_weights(model.get_weights())
+
+    return new_model
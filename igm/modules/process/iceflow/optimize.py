@@ -113,9 +113,9 @@ def optimize(params, state):
 
             # evalutae th ice flow emulator                
             if params.iflo_multiple_window_size==0:
-                Y = state.iceflow_model(X)
+                Y = emulator_forward(params, state, X, differentiable=True)
             else:
-                Y = state.iceflow_model(tf.pad(X, state.PAD, "CONSTANT"))[:, :Ny, :Nx, :]
+                Y = emulator_forward(params, state, tf.pad(X, state.PAD, "CONSTANT"), differentiable=True)[:, :Ny, :Nx, :]
 
             U, V = Y_to_UV(params, Y)
 
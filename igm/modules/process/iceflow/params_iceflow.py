@@ -37,6 +37,24 @@ def params_iceflow(parser):
         default="",
         help="Directory path of the deep-learning pretrained ice flow model, take from the library if empty string",
     )
+    parser.add_argument(
+        "--iflo_emulator_cache",
+        type=str2bool,
+        default=False,
+        help="Keep the loaded emulator in memory and reuse it in the next runs of the same process (e.g. with igm_batch)",
+    )
+    parser.add_argument(
+        "--iflo_emulator_artifact",
+        type=str2bool,
+        default=False,
+        help="Convert the pretrained emulator once into a cached artifact (flat weights and JSON manifest), which loads much faster than model.h5",
+    )
+    parser.add_argument(
+        "--iflo_emulator_artifact_directory",
+        type=str,
+        default="~/.cache/igm/emulators",
+        help="Cache directory of the emulator artifacts, which are named by the content hash of the emulator",
+    )
 
     # physical parameters
     parser.add_argument(
@@ -142,6 +160,78 @@ def params_iceflow(parser):
         default=True,
         help="This permits to stop the solver if the energy does not decrease",
     )
+    parser.add_argument(
+        "--iflo_solve_multigrid_levels",
+        type=int,
+        default=0,
+        help="Number of coarser grids of the coarse-to-fine solver, 0 means solving on the original grid only (exclusive with iflo_solve_newton, iflo_optimizer_lbfgs and iflo_solve_compiled)",
+    )
+    parser.add_argument(
+        "--iflo_solve_multigrid_tol",
+        type=float,
+        default=0.0001,
+        help="Relative decrease of the energy below which the coarse-to-fine solver moves to the next finer grid",
+    )
+    parser.add_argument(
+        "--iflo_solve_newton",
+        type=str2bool,
+        default=False,
+        help="Solve with a truncated Newton (Newton-CG) method using Hessian-vector products of the energy, with iflo_solve_nbitmax Newton iterations at most (exclusive with iflo_solve_multigrid_levels, iflo_optimizer_lbfgs and iflo_solve_compiled)",
+    )
+    parser.add_argument(
+        "--iflo_solve_newton_tol",
+        type=float,
+        default=0.00001,
+        help="Relative decrease of the norm of the gradient of the energy at which the Newton solver stops",
+    )
+    parser.add_argument(
+        "--iflo_solve_newton_cg_nbitmax",
+        type=int,
+        default=50,
+        help="Maximum number of conjugate gradient iterations per Newton iteration",
+    )
+    parser.add_argument(
+        "--iflo_solve_warm_start",
+        type=str2bool,
+        default=False,
+        help="Start the solver from the velocity of the pretrained emulator (loaded in solved mode), if its energy is lower than the one of the former velocity",
+    )
+    parser.add_argument(
+        "--iflo_solve_compiled",
+        type=str2bool,
+        default=False,
+        help="Run all the iterations of the solver in a compiled loop, the stopping criteria being checked on the device (exclusive with iflo_solve_multigrid_levels, iflo_solve_newton and iflo_optimizer_lbfgs)",
+    )
+    parser.add_argument(
+        "--iflo_solve_tol",
+        type=float,
+        default=0.0,
+        help="Relative decrease of the energy (over iflo_solve_check_freq iterations with iflo_solve_compiled) below which the solver stops, 0 means no tolerance",
+    )
+    parser.add_argument(
+        "--iflo_solve_gradient_tol",
+        type=float,
+        default=0.0,
+        help="Relative decrease of the norm of the gradient of the energy at which the compiled solver stops, 0 means no tolerance",
+    )
+    parser.add_argument(
+        "--iflo_solve_check_freq",
+        type=int,
+        default=10,
+        help="Number of iterations of the compiled solver between two checks of the stopping criteria",
+    )
+    parser.add_argument(
+        "--iflo_diagnostic_async",
+        type=str2bool,
+        default=False,
+        help="In diagnostic mode, run the reference solver on a background thread, on a copy of the inputs, while the run continues with the emulator",
+    )
+    parser.add_argument(
+        "--iflo_diagnostic_device",
+        type=str,
+        default="",
+        help="Device of the asynchronous reference solver in diagnostic mode (e.g. /CPU:0 while the emulator runs on the GPU), the default device if empty",
+    )
 
     # emualtion parameters
     parser.add_argument(
@@ -181,18 +271,144 @@ def params_iceflow(parser):
         default=1,
         help="Number of iterations done at each time step for the retraining of the emulator",
     )
+    parser.add_argument(
+        "--iflo_retrain_emulator_adaptive",
+        type=str2bool,
+        default=False,
+        help="Retrain the emulator (checked every iflo_retrain_emulator_freq iterations) only if its energy residual has grown, and stop the retraining iterations once the energy no longer decreases",
+    )
+    parser.add_argument(
+        "--iflo_retrain_emulator_tol",
+        type=float,
+        default=0.5,
+        help="Relative increase of the energy residual of the emulator since its last retraining above which it is retrained (with iflo_retrain_emulator_adaptive)",
+    )
     parser.add_argument(
         "--iflo_retrain_emulator_framesizemax",
         type=float,
         default=750,
         help="Size of the patch used for retraining the emulator, this is usefull for large size arrays, otherwise the GPU memory can be overloaded",
     )
+    parser.add_argument(
+        "--iflo_retrain_emulator_batched",
+        type=str2bool,
+        default=False,
+        help="Retrain the emulator on all patches at once in a compiled function, accumulating the gradients for one optimizer step per iteration",
+    )
+    parser.add_argument(
+        "--iflo_retrain_emulator_memory",
+        type=float,
+        default=0,
+        help="Memory budget in MB of one batch of patches of iflo_retrain_emulator_batched, 0 means all patches in one batch",
+    )
+    parser.add_argument(
+        "--iflo_replay_size",
+        type=int,
+        default=0,
+        help="Number of patches of the former retrainings kept in a replay buffer, and retrained together with the current ones, 0 means no replay",
+    )
+    parser.add_argument(
+        "--iflo_replay_ratio",
+        type=float,
+        default=1.0,
+        help="Number of replayed patches per current patch at each retraining",
+    )
+    parser.add_argument(
+        "--iflo_replay_downsample",
+        type=int,
+        default=1,
+        help="Downsampling factor of the patches stored in the replay buffer (which are upsampled back when replayed)",
+    )
+    parser.add_argument(
+        "--iflo_replay_eviction",
+        type=str,
+        default="reservoir",
+        help="Eviction policy of the replay buffer: reservoir (uniform sample of all patches seen) or fifo (the oldest patch is evicted)",
+    )
     parser.add_argument(
         "--iflo_multiple_window_size",
         type=int,
         default=0,
         help="If a U-net, this force window size a multiple of 2**N",
     )
+    parser.add_argument(
+        "--iflo_crop_active_region",
+        type=str2bool,
+        default=False,
+        help="Evaluate the emulator only on boxes covering the ice (plus a halo of the receptive field of the CNN), such that the cost scales with the glacier area and not the domain area",
+    )
+    parser.add_argument(
+        "--iflo_crop_bucket",
+        type=int,
+        default=32,
+        help="Smallest box size of iflo_crop_active_region, the box sizes being rounded up to sizes growing by a factor ~sqrt(2) from it",
+    )
+    parser.add_argument(
+        "--iflo_tile_inference",
+        type=str2bool,
+        default=False,
+        help="Evaluate the emulator tile-wise (with a halo of the receptive field of the CNN), this is usefull for very large arrays, which do not fit in memory",
+    )
+    parser.add_argument(
+        "--iflo_tile_memory",
+        type=float,
+        default=1024,
+        help="Memory budget in MB of one emulator call of iflo_tile_inference, which sets the size of the tiles",
+    )
+    parser.add_argument(
+        "--iflo_compile_emulator",
+        type=str2bool,
+        default=False,
+        help="Evaluate the emulator with an XLA-compiled function, the inputs being padded to a few bucket sizes to avoid retracing",
+    )
+    parser.add_argument(
+        "--iflo_compile_bucket",
+        type=int,
+        default=32,
+        help="Smallest bucket size of iflo_compile_emulator, the bucket sizes growing by a factor ~sqrt(2) from it",
+    )
+    parser.add_argument(
+        "--iflo_compile_cache_directory",
+        type=str,
+        default="",
+        help="Directory where the XLA compilations are kept between runs, no persistent cache if empty string",
+    )
+    parser.add_argument(
+        "--iflo_inference_backend",
+        type=str,
+        default="keras",
+        help="Backend of the emulator inference: keras (default), or the CPU backends int8 (quantized weights and activations, calibrated on the current domain) and float16 (quantized weights)",
+    )
+    parser.add_argument(
+        "--iflo_quantize_max_energy_error",
+        type=float,
+        default=0.01,
+        help="Maximum relative energy error of the quantized emulator, above which the keras emulator is used",
+    )
+    parser.add_argument(
+        "--iflo_lazy_velocity",
+        type=str2bool,
+        default=False,
+        help="Reuse the velocity of the last evaluation of the emulator as long as its inputs barely changed",
+    )
+    parser.add_argument(
+        "--iflo_lazy_velocity_tol",
+        type=float,
+        default=0.001,
+        help="Relative change of the inputs of the emulator (in each input field) above which the emulator is evaluated again with iflo_lazy_velocity",
+    )
+    parser.add_argument(
+        "--iflo_lazy_velocity_norm",
+        type=str,
+        default="max",
+        help="Norm of the change of the inputs with iflo_lazy_velocity: max or rms",
+    )
+    parser.add_argument(
+        "--iflo_lazy_velocity_extrapolate",
+        type=str2bool,
+        default=False,
+        help="Extrapolate linearly in time the velocity of the two last evaluations of the emulator, instead of reusing the last one",
+    )
     parser.add_argument(
         "--iflo_force_max_velbar",
         type=float,
@@ -249,6 +465,78 @@ def params_iceflow(parser):
         default="glorot_uniform",
         help="glorot_uniform, he_normal, lecun_normal",
     )
+    parser.add_argument(
+        "--iflo_distill",
+        type=str2bool,
+        default=False,
+        help="Distill the emulator into a smaller CNN after the spin-up, trained on the states met during the run",
+    )
+    parser.add_argument(
+        "--iflo_distill_it",
+        type=int,
+        default=100,
+        help="Iteration at which the emulator is distilled",
+    )
+    parser.add_argument(
+        "--iflo_distill_nb_layers",
+        type=int,
+        default=8,
+        help="Number of layers of the distilled CNN (not more than iflo_nb_layers with iflo_crop_active_region or iflo_tile_inference)",
+    )
+    parser.add_argument(
+        "--iflo_distill_nb_out_filter",
+        type=int,
+        default=16,
+        help="Number of output filters of the distilled CNN",
+    )
+    parser.add_argument(
+        "--iflo_distill_nb_samples",
+        type=int,
+        default=16,
+        help="Number of states of the run kept to train the distilled CNN",
+    )
+    parser.add_argument(
+        "--iflo_distill_nbit",
+        type=int,
+        default=500,
+        help="Number of training iterations of the distilled CNN",
+    )
+    parser.add_argument(
+        "--iflo_distill_lr",
+        type=float,
+        default=0.001,
+        help="Learning rate of the training of the distilled CNN",
+    )
+    parser.add_argument(
+        "--iflo_distill_energy_weight",
+        type=float,
+        default=1.0,
+        help="Weight of the energy term (relative to the misfit to the original emulator) in the training of the distilled CNN",
+    )
+    parser.add_argument(
+        "--iflo_distill_max_energy_error",
+        type=float,
+        default=0.05,
+        help="Maximum relative energy error of the distilled CNN for it to replace the original emulator",
+    )
+    parser.add_argument(
+        "--iflo_ensemble_size",
+        type=int,
+        default=0,
+        help="Number of ensemble members run together in a single batched emulator call, 0 means no ensemble",
+    )
+    parser.add_argument(
+        "--iflo_ensemble_arrhenius",
+        type=list,
+        default=[],
+        help="Arrhenius factor of each ensemble member (default: iflo_init_arrhenius for all members)",
+    )
+    parser.add_argument(
+        "--iflo_ensemble_slidingco",
+        type=list,
+        default=[],
+        help="Sliding coefficient of each ensemble member (default: iflo_init_slidingco for all members)",
+    )
     parser.add_argument(
         "--iflo_exclude_borders",
         type=int,
@@ -305,7 +593,7 @@ def params_iceflow(parser):
         "--iflo_optimizer_lbfgs",
         type=str2bool,
         default=False,
-        help="iflo_optimizer_lbfgs",
+        help="Solve with the L-BFGS optimizer of tensorflow_probability (exclusive with iflo_solve_multigrid_levels, iflo_solve_newton and iflo_solve_compiled)",
     )
     
     parser.add_argument(
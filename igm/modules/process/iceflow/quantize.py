@@ -0,0 +1,77 @@
+import numpy as np
+import tensorflow as tf
+
+from .energy_iceflow import *
+
+
+class QuantizedEmulator:
+    """
+    Emulator quantized with TensorFlow Lite (int8 weights and activations, or
+    float16 weights), for the inference on CPU. The interpreter is resized to the
+    shape of the input at each call if needed.
+    """
+
+    def __init__(self, content):
+        self.interpreter = tf.lite.Interpreter(
+            model_content=content,
+            num_threads=tf.config.threading.get_intra_op_parallelism_threads() or None,
+        )
+        self.input = self.interpreter.get_input_details()[0]["index"]
+        self.output = self.interpreter.get_output_details()[0]["index"]
+        self.shape = None
+
+    def __call__(self, X):
+        if not self.shape == tuple(X.shape):
+            self.interpreter.resize_tensor_input(self.input, X.shape)
+            self.interpreter.allocate_tensors()
+            self.shape = tuple(X.shape)
+
+        self.interpreter.set_tensor(self.input, np.array(X, dtype="float32"))
+        self.interpreter.invoke()
+
+        return tf.cast(self.interpreter.get_tensor(self.output), X.dtype)
+
+
+def _energy(params, X, Y):
+    C_shear, C_slid, C_grav, C_float = iceflow_energy_XY(params, X, Y)
+
+    return tf.reduce_mean(C_shear) + tf.reduce_mean(C_slid) \
+         + tf.reduce_mean(C_grav)  + tf.reduce_mean(C_float)
+
+
+def quantize_emulator(params, model, X):
+    """
+    Quantize the emulator to the backend iflo_inference_backend (int8 or float16),
+    X being the calibration set of the int8 activations. Returns None if the
+    relative energy error of the quantized emulator on X exceeds
+    iflo_quantize_max_energy_error, such that the float32 emulator is kept.
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if params.iflo_inference_backend == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif params.iflo_inference_backend == "int8":
+        converter.representative_dataset = lambda: (
+            [np.array(X[i : i + 1], dtype="float32")] for i in range(X.shape[0])
+        )
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    else:
+        raise ValueError("Unknown iflo_inference_backend " + params.iflo_inference_backend)
+
+    quantized = QuantizedEmulator(converter.convert())
+
+    # the quantized emulator is checked against the energy of the float32 one
+    E = _energy(params, X, tf.cast(model(X), X.dtype))
+    Eq = _energy(params, X, quantized(X))
+
+    energy_error = float(((Eq - E) / tf.abs(E)).numpy())
+
+    if energy_error > params.iflo_quantize_max_energy_error:
+        print(
+            "Quantized emulator (%s) discarded, relative energy error %.4f"
+            % (params.iflo_inference_backend, energy_error)
+        )
+        return None
+
+    return quantized
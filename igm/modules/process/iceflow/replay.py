@@ -0,0 +1,84 @@
+import numpy as np
+import tensorflow as tf
+
+
+class ReplayBuffer:
+    """
+    Bounded buffer of past input patches X of the emulator, captured at the
+    retraining times, and replayed together with the current patches such that
+    the emulator does not forget the former geometries. The patches are stored
+    in float16, optionally downsampled by an integer factor (and upsampled back
+    to their original shape when replayed). When the buffer is full, a random
+    patch is evicted with a probability such that the buffer is a uniform sample
+    of all the patches seen so far (eviction "reservoir"), or the oldest patch
+    is evicted (eviction "fifo").
+    """
+
+    def __init__(self, size, downsample=1, eviction="reservoir", seed=None):
+        assert eviction in ["reservoir", "fifo"]
+        self.size = size
+        self.downsample = downsample
+        self.eviction = eviction
+        self.patches = []
+        self.shape = None
+        self.nb_seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return len(self.patches)
+
+    def add(self, X):
+        """Store the patches of X (of shape [n, ny, nx, nc])."""
+
+        # the buffer only keeps patches of the same shape, e.g. of the same domain
+        if not self.shape == tuple(X.shape[1:]):
+            self.patches = []
+            self.shape = tuple(X.shape[1:])
+            self.nb_seen = 0
+
+        k = self.downsample
+        if k > 1:
+            X = tf.nn.avg_pool2d(tf.cast(X, "float32"), k, k, "SAME")
+
+        for patch in np.array(X, dtype="float16"):
+            self.nb_seen += 1
+            if len(self.patches) < self.size:
+                self.patches.append(patch)
+            elif self.eviction == "fifo":
+                self.patches.pop(0)
+                self.patches.append(patch)
+            else:
+                i = self.rng.integers(self.nb_seen)
+                if i < self.size:
+                    self.patches[i] = patch
+
+    def state_dict(self):
+        """Content of the buffer, as numpy arrays and JSON-serializable values, for the checkpoints."""
+        return {
+            "patches": np.stack(self.patches) if len(self.patches) > 0 else np.zeros((0,), "float16"),
+            "shape": None if self.shape is None else list(self.shape),
+            "nb_seen": self.nb_seen,
+            "rng": self.rng.bit_generator.state,
+        }
+
+    def load_state_dict(self, content):
+        self.patches = list(content["patches"])
+        self.shape = None if content["shape"] is None else tuple(content["shape"])
+        self.nb_seen = int(content["nb_seen"])
+        self.rng.bit_generator.state = content["rng"]
+
+    def sample(self, n, shape, dtype):
+        """Draw (without replacement) up to n stored patches of the given shape."""
+
+        n = min(n, len(self.patches))
+
+        if (n == 0) or (not self.shape == tuple(shape)):
+            return None
+
+        X = np.stack([self.patches[i] for i in self.rng.choice(len(self.patches), n, replace=False)])
+        X = tf.cast(X, dtype)
+
+        if self.downsample > 1:
+            X = tf.cast(tf.image.resize(tf.cast(X, "float32"), self.shape[:2], "bilinear"), dtype)
+
+        return X
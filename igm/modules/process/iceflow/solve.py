@@ -1,37 +1,66 @@
 import numpy as np 
 import tensorflow as tf 
+import time
+from igm.common import register_optimizer
 from .utils import *
 from .energy_iceflow import *
 
 def initialize_iceflow_solver(params,state):
 
+    # the solvers are exclusive, the one of the eager loop (Adam, ...) being the default
+    solvers = [
+        name for name, on in [
+            ("iflo_solve_multigrid_levels", params.iflo_solve_multigrid_levels > 0),
+            ("iflo_solve_newton", params.iflo_solve_newton),
+            ("iflo_optimizer_lbfgs", params.iflo_optimizer_lbfgs),
+            ("iflo_solve_compiled", params.iflo_solve_compiled),
+        ] if on
+    ]
+    if len(solvers) > 1:
+        raise ValueError("Only one solver can be selected, got " + ", ".join(solvers))
+
+    state.optimizer = _solver_optimizer(params)
+    register_optimizer(state, "optimizer", ["U", "V"])
+
+def _solver_optimizer(params):
+
     if int(tf.__version__.split(".")[1]) <= 10:
-        state.optimizer = getattr(tf.keras.optimizers,params.iflo_optimizer_solver)(
+        return getattr(tf.keras.optimizers,params.iflo_optimizer_solver)(
             learning_rate=params.iflo_solve_step_size
         )
     else:
-        state.optimizer = getattr(tf.keras.optimizers.legacy,params.iflo_optimizer_solver)(
+        return getattr(tf.keras.optimizers.legacy,params.iflo_optimizer_solver)(
             learning_rate=params.iflo_solve_step_size
         )
 
-def solve_iceflow(params, state, U, V):
+def solve_iceflow(params, state, U, V, fieldin=None, optimizer=None, nbitmax=None, tol=0):
     """
-    solve_iceflow
+    solve_iceflow, by default on the fields of the state with the optimizer of the
+    state, stops after nbitmax iterations or once the relative decrease of the
+    energy is below tol (if tol>0)
     """
 
     Cost_Glen = []
 
-    for i in range(params.iflo_solve_nbitmax):
+    if fieldin is None:
+        fieldin = [vars(state)[f] for f in params.iflo_fieldin]
+
+    if optimizer is None:
+        optimizer = state.optimizer
+
+    if nbitmax is None:
+        nbitmax = params.iflo_solve_nbitmax
+
+    # the terms of the energy which do not depend on U, V are computed once
+    geometry = iceflow_geometry(params, [tf.expand_dims(f, axis=0) for f in fieldin])
+
+    for i in range(nbitmax):
         with tf.GradientTape() as t:
             t.watch(U)
             t.watch(V)
 
-            fieldin = [
-                tf.expand_dims(vars(state)[f], axis=0) for f in params.iflo_fieldin
-            ]
-
-            C_shear, C_slid, C_grav, C_float = iceflow_energy(
-                params, tf.expand_dims(U, axis=0), tf.expand_dims(V, axis=0), fieldin
+            C_shear, C_slid, C_grav, C_float = iceflow_energy_geometry(
+                params, tf.expand_dims(U, axis=0), tf.expand_dims(V, axis=0), geometry
             )
 
             COST = tf.reduce_mean(C_shear) + tf.reduce_mean(C_slid) \
@@ -53,9 +82,14 @@ def solve_iceflow(params, state, U, V):
                     if Cost_Glen[-1] >= Cost_Glen[-2]:
                         break
 
+            # Stop if the relative decrease of the cost is below the tolerance
+            if (tol > 0) and (i > 0):
+                if abs(Cost_Glen[-2] - Cost_Glen[-1]) <= tol * abs(Cost_Glen[-1]):
+                    break
+
             grads = tf.Variable(t.gradient(COST, [U, V]))
 
-            state.optimizer.apply_gradients(
+            optimizer.apply_gradients(
                 zip([grads[i] for i in range(grads.shape[0])], [U, V])
             )
 
@@ -63,28 +97,342 @@ def solve_iceflow(params, state, U, V):
                 velsurf_mag = tf.sqrt(U[-1] ** 2 + V[-1] ** 2)
                 print("solve :", i, COST.numpy(), np.max(velsurf_mag))
 
+    U = tf.where(fieldin[0] > 0, U, 0)
+    V = tf.where(fieldin[0] > 0, V, 0)
+
+    return U, V, Cost_Glen
+
+def _restrict(f):
+    # average on 2x2 cells, along the two last (horizontal) dimensions
+    shape = f.shape
+    F = tf.nn.avg_pool2d(tf.reshape(f, [-1, shape[-2], shape[-1], 1]), 2, 2, "SAME")
+    return tf.reshape(F, list(shape[:-2]) + F.shape[1:3])
+
+def _prolongate(f, ny, nx):
+    # bilinear interpolation, along the two last (horizontal) dimensions
+    shape = f.shape
+    F = tf.image.resize(tf.reshape(f, [-1, shape[-2], shape[-1], 1]), [ny, nx], "bilinear")
+    return tf.reshape(tf.cast(F, f.dtype), list(shape[:-2]) + [ny, nx])
+
+def solve_iceflow_multigrid(params, state, U, V):
+    """
+    Coarse-to-fine (nested iteration) solver: the input fields are restricted to
+    iflo_solve_multigrid_levels coarser grids (each one twice coarser, dX being
+    doubled), the ice flow is solved on the coarsest grid, and prolongated as the
+    initial guess of the next finer grid, up to the original grid. On each grid,
+    the solver stops after iflo_solve_nbitmax iterations or once the relative
+    decrease of the energy is below iflo_solve_multigrid_tol. The iterations and
+    wall time on each grid are printed, and kept in state.solve_report.
+    """
+
+    fieldins = [[vars(state)[f] for f in params.iflo_fieldin]]
+    for l in range(params.iflo_solve_multigrid_levels):
+        fieldin = [_restrict(f) for f in fieldins[-1]]
+        fieldin[params.iflo_fieldin.index("dX")] *= 2
+        fieldins.append(fieldin)
+
+    UV = [U, V]
+    for l in range(params.iflo_solve_multigrid_levels):
+        UV = [_restrict(f) for f in UV]
+
+    state.solve_report = []
+
+    for l in reversed(range(len(fieldins))):
+        ny, nx = fieldins[l][0].shape[-2:]
+
+        if l < params.iflo_solve_multigrid_levels:
+            UV = [_prolongate(f, ny, nx) for f in UV]
+
+        # the finest grid is solved in place, with the optimizer of the state
+        if l == 0:
+            U.assign(UV[0])
+            V.assign(UV[1])
+            Ul, Vl, optimizer = U, V, state.optimizer
+        else:
+            Ul, Vl, optimizer = tf.Variable(UV[0]), tf.Variable(UV[1]), _solver_optimizer(params)
+
+        t0 = time.time()
+        Ul, Vl, Cost_Glen = solve_iceflow(
+            params, state, Ul, Vl, fieldin=fieldins[l], optimizer=optimizer,
+            tol=params.iflo_solve_multigrid_tol
+        )
+        state.solve_report.append(
+            {"level": l, "shape": (ny, nx), "iterations": len(Cost_Glen),
+             "time": time.time() - t0, "cost": float(Cost_Glen[-1].numpy())}
+        )
+
+        UV = [Ul, Vl]
+
+    print("Multigrid solve : " + ", ".join(
+        "level %d %dx%d: %d it. %.2f s" % (r["level"], *r["shape"], r["iterations"], r["time"])
+        for r in state.solve_report
+    ))
+
+    return UV[0], UV[1], Cost_Glen
+
+def _preconditioned_cg(hessian_vector, g, D, eta, nbitmax):
+    # approximate solution of H p = -g, truncated once the residual is below eta |g|,
+    # or at the first direction of negative curvature
+    p = tf.zeros_like(g)
+    r = -g
+    z = r / D
+    d = z
+    rz = tf.reduce_sum(r * z)
+    for k in range(nbitmax):
+        Hd = hessian_vector(d)
+        dHd = tf.reduce_sum(d * Hd)
+        if dHd <= 0:
+            return p if k > 0 else -g / D
+        a = rz / dHd
+        p = p + a * d
+        r = r - a * Hd
+        if tf.norm(r) <= eta * tf.norm(g):
+            break
+        z = r / D
+        rz_new = tf.reduce_sum(r * z)
+        d = z + (rz_new / rz) * d
+        rz = rz_new
+    return p
+
+def solve_iceflow_newton(params, state, U, V):
+    """
+    Truncated Newton (Newton-CG) solver: at each iteration, the Newton direction
+    is approximated with a conjugate gradient using Hessian-vector products
+    (forward-over-reverse differentiation of the energy), preconditioned with an
+    approximate diagonal of the Hessian (from the effective viscosity and the
+    sliding coefficient, see iceflow_hessian_diagonal), followed by a
+    backtracking line search. The velocity is only solved
+    where there is ice. Stops after iflo_solve_nbitmax iterations or once the
+    norm of the gradient decreased by iflo_solve_newton_tol, or if the line
+    search finds no step decreasing the energy enough.
+    """
+
+    fieldin = [
+        tf.expand_dims(vars(state)[f], axis=0) for f in params.iflo_fieldin
+    ]
+
+    M = tf.cast(tf.broadcast_to(state.thk > 0, U.shape), U.dtype)
+    M = tf.stack([M, M], axis=0)
+
+    geometry = iceflow_geometry(params, fieldin)
+
+    def energy(UV):
+        C_shear, C_slid, C_grav, C_float = iceflow_energy_geometry(params, UV[0:1], UV[1:2], geometry)
+        return tf.reduce_mean(C_shear) + tf.reduce_mean(C_slid) \
+             + tf.reduce_mean(C_grav)  + tf.reduce_mean(C_float)
+
+    def energy_and_gradient(UV):
+        with tf.GradientTape() as t:
+            t.watch(UV)
+            E = energy(UV)
+        return E, t.gradient(E, UV) * M
+
+    def hessian_vector(UV, v):
+        with tf.autodiff.ForwardAccumulator(UV, v * M) as acc:
+            __, g = energy_and_gradient(UV)
+        return acc.jvp(g)
+
+    UV = tf.stack([U, V], axis=0)
+
+    E, g = energy_and_gradient(UV)
+    gnorm0 = tf.norm(g)
+
+    # the energy of the initial velocity, and of the velocity after each accepted step
+    Cost_Glen = [E]
+
+    for i in range(params.iflo_solve_nbitmax):
+        gnorm = tf.norm(g)
+        if gnorm <= params.iflo_solve_newton_tol * gnorm0:
+            break
+
+        # approximate diagonal of the Hessian, the same for U and V
+        D = iceflow_hessian_diagonal(params, UV[0:1], UV[1:2], geometry)
+        D = tf.concat([D, D], axis=0)
+        D = tf.where(M > 0, tf.maximum(D, 0.001 * tf.reduce_max(D)), 1)
+
+        eta = tf.minimum(0.5, tf.sqrt(gnorm / gnorm0))
+
+        P = _preconditioned_cg(
+            lambda v: hessian_vector(UV, v), g, D, eta, params.iflo_solve_newton_cg_nbitmax
+        ) * M
+
+        # backtracking line search (Armijo condition)
+        slope = tf.reduce_sum(g * P)
+        alpha = 1.0
+        for j in range(20):
+            E_new = energy(UV + alpha * P)
+            if E_new <= E + 0.0001 * alpha * slope:
+                break
+            alpha *= 0.5
+        else:
+            # no sufficient decrease along the direction, the step is rejected
+            break
+
+        UV = UV + alpha * P
+
+        E, g = energy_and_gradient(UV)
+
+        Cost_Glen.append(E)
+
+        if (i + 1) % 10 == 0:
+            print("solve newton :", i, E.numpy(), (tf.norm(g) / gnorm0).numpy())
+
+    U = tf.where(state.thk > 0, UV[0], 0)
+    V = tf.where(state.thk > 0, UV[1], 0)
+
+    return U, V, Cost_Glen
+
+def solve_iceflow_compiled(params, state, U, V):
+    """
+    solve_iceflow with all the iterations in a compiled tf.while_loop, without
+    transfer to the host. The stopping criteria are checked on the device every
+    iflo_solve_check_freq iterations: the relative decrease of the energy over
+    these iterations is below iflo_solve_tol, or the norm of the gradient has
+    decreased by iflo_solve_gradient_tol (and at each iteration, the energy no
+    longer decreases, with iflo_solve_stop_if_no_decrease). The number of
+    iterations is kept in state.solve_nbit.
+    """
+
+    fieldin = [
+        tf.expand_dims(vars(state)[f], axis=0) for f in params.iflo_fieldin
+    ]
+
+    geometry = iceflow_geometry(params, fieldin)
+
+    # the loop is compiled once per optimizer and velocity fields
+    key = (id(state.optimizer), id(U), id(V))
+
+    if getattr(state, "solve_loop_key", None) != key:
+        state.solve_loop = _build_solve_loop(params, state.optimizer, U, V)
+        state.solve_loop_key = key
+
+    costs, nbit = state.solve_loop(geometry)
+
+    state.solve_nbit = int(nbit)
+
     U = tf.where(state.thk > 0, U, 0)
     V = tf.where(state.thk > 0, V, 0)
 
-    return U, V, Cost_Glen
+    return U, V, costs[: state.solve_nbit]
+
+def _build_optimizer(optimizer, var_list):
+    # the slots of the optimizer can not be created in the compiled loop
+    if hasattr(optimizer, "_create_all_weights"):
+        optimizer._create_all_weights(var_list)
+    else:
+        optimizer.build(var_list)
+
+def _build_solve_loop(params, optimizer, U, V):
+
+    _build_optimizer(optimizer, [U, V])
+
+    nbitmax = params.iflo_solve_nbitmax
+    k = params.iflo_solve_check_freq
+    tol = params.iflo_solve_tol
+    gtol = params.iflo_solve_gradient_tol
+    stop_if_no_decrease = params.iflo_solve_stop_if_no_decrease
+
+    @tf.function
+    def solve_loop(geometry):
+
+        def body(i, stop, E_prev, E_check, gnorm0, costs):
+            with tf.GradientTape() as t:
+                C_shear, C_slid, C_grav, C_float = iceflow_energy_geometry(
+                    params, tf.expand_dims(U, axis=0), tf.expand_dims(V, axis=0), geometry
+                )
+
+                COST = tf.reduce_mean(C_shear) + tf.reduce_mean(C_slid) \
+                     + tf.reduce_mean(C_grav)  + tf.reduce_mean(C_float)
+
+            grads = t.gradient(COST, [U, V])
+
+            costs = costs.write(i, COST)
+
+            gnorm = tf.sqrt(tf.reduce_sum(grads[0] ** 2) + tf.reduce_sum(grads[1] ** 2))
+            gnorm0 = tf.where(i == 0, gnorm, gnorm0)
+
+            # Stop if the cost no longer decreases
+            if stop_if_no_decrease:
+                stop = (i > 1) & (COST >= E_prev)
+
+            # every k iterations, stop if the relative decrease of the cost or the gradient are below the tolerances
+            check = (i > 0) & (i % k == 0)
+            if tol > 0:
+                stop = stop | (check & (tf.abs(E_check - COST) <= tol * tf.abs(COST)))
+            if gtol > 0:
+                stop = stop | (check & (gnorm <= gtol * gnorm0))
+
+            E_check = tf.where(i % k == 0, COST, E_check)
+
+            def step():
+                optimizer.apply_gradients(zip(grads, [U, V]))
+                return tf.constant(0)
+
+            tf.cond(stop, lambda: tf.constant(0), step)
+
+            return i + 1, stop, COST, E_check, gnorm0, costs
+
+        zero = tf.constant(0.0, dtype=U.dtype)
+
+        nbit, stop, E_prev, E_check, gnorm0, costs = tf.while_loop(
+            lambda i, stop, *args: (i < nbitmax) & tf.logical_not(stop),
+            body,
+            [tf.constant(0), tf.constant(False), zero, zero, zero,
+             tf.TensorArray(U.dtype, size=nbitmax)],
+        )
+
+        return costs.stack(), nbit
+
+    return solve_loop
+
+def warm_start_iceflow(params, state):
+    """
+    Replace the velocity of the state by the one of the emulator, if its energy
+    is lower (e.g. after a large change of the geometry), such that the solver
+    starts closer to the solution
+    """
+
+    Ny, Nx = state.thk.shape[-2:]
+
+    fieldin = [vars(state)[f] for f in params.iflo_fieldin]
+
+    X = fieldin_to_X(params, fieldin)
+
+    Y = state.iceflow_model(tf.pad(X, state.PAD, "CONSTANT"))[:, :Ny, :Nx, :]
+
+    # with mixed_bfloat16, the output of the emulator is brought back to the fields precision
+    UE, VE = Y_to_UV(params, tf.cast(Y, X.dtype))
+
+    fieldin = [tf.expand_dims(f, axis=0) for f in fieldin]
+
+    def energy(U, V):
+        C_shear, C_slid, C_grav, C_float = iceflow_energy(params, U, V, fieldin)
+        return tf.reduce_mean(C_shear) + tf.reduce_mean(C_slid) \
+             + tf.reduce_mean(C_grav)  + tf.reduce_mean(C_float)
+
+    if energy(UE, VE) < energy(tf.expand_dims(state.U, axis=0), tf.expand_dims(state.V, axis=0)):
+        state.U.assign(UE[0])
+        state.V.assign(VE[0])
 
 def solve_iceflow_lbfgs(params, state, U, V):
 
     import tensorflow_probability as tfp
 
     Cost_Glen = []
+
+    fieldin = [
+        tf.expand_dims(vars(state)[f], axis=0) for f in params.iflo_fieldin
+    ]
+
+    geometry = iceflow_geometry(params, fieldin)
  
     def COST(UV):
 
         U = UV[0]
         V = UV[1]
 
-        fieldin = [
-            tf.expand_dims(vars(state)[f], axis=0) for f in params.iflo_fieldin
-        ]
-
-        C_shear, C_slid, C_grav, C_float = iceflow_energy(
-            params, tf.expand_dims(U, axis=0), tf.expand_dims(V, axis=0), fieldin
+        C_shear, C_slid, C_grav, C_float = iceflow_energy_geometry(
+            params, tf.expand_dims(U, axis=0), tf.expand_dims(V, axis=0), geometry
         )
 
         COST = tf.reduce_mean(C_shear) + tf.reduce_mean(C_slid) \
@@ -117,10 +465,19 @@ def solve_iceflow_lbfgs(params, state, U, V):
 
 def update_iceflow_solved(params, state):
 
-    if params.iflo_optimizer_lbfgs:
+    if params.iflo_solve_warm_start and hasattr(state, "iceflow_model"):
+        warm_start_iceflow(params, state)
+
+    if params.iflo_solve_multigrid_levels > 0:
+        U, V, Cost_Glen = solve_iceflow_multigrid(params, state, state.U, state.V)
+    elif params.iflo_solve_newton:
+        U, V, Cost_Glen = solve_iceflow_newton(params, state, state.U, state.V)
+    elif params.iflo_optimizer_lbfgs:
         U, V, Cost_Glen = solve_iceflow_lbfgs(params, state, state.U, state.V)
+    elif params.iflo_solve_compiled:
+        U, V, Cost_Glen = solve_iceflow_compiled(params, state, state.U, state.V)
     else:
-        U, V, Cost_Glen = solve_iceflow(params, state, state.U, state.V)
+        U, V, Cost_Glen = solve_iceflow(params, state, state.U, state.V, tol=params.iflo_solve_tol)
  
     state.U.assign(U)
     state.V.assign(V)
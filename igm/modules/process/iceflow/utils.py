@@ -2,13 +2,19 @@ import numpy as np
 import tensorflow as tf 
 import math
 
+from igm.modules.utils import field_dtype
+
 def initialize_iceflow_fields(params,state):
 
+    # in ensemble mode, all fields get a leading member dimension
+    if params.iflo_ensemble_size > 0:
+        initialize_ensemble_fields(params,state)
+
     # here we initialize variable parmaetrizing ice flow
     if not hasattr(state, "arrhenius"):
         if params.iflo_dim_arrhenius == 3:
             state.arrhenius = tf.Variable(
-                tf.ones((params.iflo_Nz, state.thk.shape[0], state.thk.shape[1]))
+                tf.ones((params.iflo_Nz, state.thk.shape[0], state.thk.shape[1]), dtype=state.thk.dtype)
                 * params.iflo_init_arrhenius * params.iflo_enhancement_factor, trainable=False
             )
         else:
@@ -23,11 +29,44 @@ def initialize_iceflow_fields(params,state):
 
     # here we create a new velocity field
     if not hasattr(state, "U"):
-        state.U = tf.Variable(
-            tf.zeros((params.iflo_Nz, state.thk.shape[0], state.thk.shape[1])), trainable=False
+        shape = state.thk.shape[:-2] + (params.iflo_Nz,) + state.thk.shape[-2:]
+        state.U = tf.Variable(tf.zeros(shape, dtype=state.thk.dtype), trainable=False)
+        state.V = tf.Variable(tf.zeros(shape, dtype=state.thk.dtype), trainable=False)
+
+def initialize_ensemble_fields(params,state):
+    """
+    Add a leading member dimension to the fields evolved by the model, and
+    set the member-dependent arrhenius and sliding coefficients
+    """
+
+    assert params.iflo_dim_arrhenius == 2
+
+    N = params.iflo_ensemble_size
+
+    for f in ["thk", "usurf"]:
+        if len(vars(state)[f].shape) == 2:
+            vars(state)[f] = tf.tile(tf.expand_dims(vars(state)[f], axis=0), [N, 1, 1])
+
+    for f in ["arrhenius", "slidingco"]:
+        if hasattr(state, f) and (len(vars(state)[f].shape) == 2):
+            vars(state)[f] = tf.Variable(
+                tf.ones_like(state.thk) * vars(state)[f], trainable=False
+            )
+
+    if len(params.iflo_ensemble_arrhenius) > 0:
+        assert len(params.iflo_ensemble_arrhenius) == N
+        state.arrhenius = tf.Variable(
+            tf.ones_like(state.thk) * params.iflo_enhancement_factor
+            * tf.reshape(tf.constant(params.iflo_ensemble_arrhenius, dtype=state.thk.dtype), (N, 1, 1)),
+            trainable=False,
         )
-        state.V = tf.Variable(
-            tf.zeros((params.iflo_Nz, state.thk.shape[0], state.thk.shape[1])), trainable=False
+
+    if len(params.iflo_ensemble_slidingco) > 0:
+        assert len(params.iflo_ensemble_slidingco) == N
+        state.slidingco = tf.Variable(
+            tf.ones_like(state.thk)
+            * tf.reshape(tf.constant(params.iflo_ensemble_slidingco, dtype=state.thk.dtype), (N, 1, 1)),
+            trainable=False,
         )
 
 def define_vertical_weight(params, state):
@@ -39,17 +78,18 @@ def define_vertical_weight(params, state):
     weight = (zeta / params.iflo_vert_spacing) * (
         1.0 + (params.iflo_vert_spacing - 1.0) * zeta
     )
-    weight = tf.Variable(weight[1:] - weight[:-1], dtype=tf.float32, trainable=False)
+    weight = tf.Variable(weight[1:] - weight[:-1], dtype=field_dtype(params), trainable=False)
     state.vert_weight = tf.expand_dims(tf.expand_dims(weight, axis=-1), axis=-1)
 
 
 def update_2d_iceflow_variables(params, state):
-    state.uvelbase = state.U[0, :, :]
-    state.vvelbase = state.V[0, :, :]
-    state.ubar = tf.reduce_sum(state.U * state.vert_weight, axis=0)
-    state.vbar = tf.reduce_sum(state.V * state.vert_weight, axis=0)
-    state.uvelsurf = state.U[-1, :, :]
-    state.vvelsurf = state.V[-1, :, :]
+    # the leading dimension (if any) is the ensemble member
+    state.uvelbase = state.U[..., 0, :, :]
+    state.vvelbase = state.V[..., 0, :, :]
+    state.ubar = tf.reduce_sum(state.U * state.vert_weight, axis=-3)
+    state.vbar = tf.reduce_sum(state.V * state.vert_weight, axis=-3)
+    state.uvelsurf = state.U[..., -1, :, :]
+    state.vvelsurf = state.V[..., -1, :, :]
 
 def compute_PAD(params,Nx,Ny):
 
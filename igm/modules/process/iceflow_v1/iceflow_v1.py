@@ -5,7 +5,6 @@
 
 import numpy as np
 import os
-import matplotlib.pyplot as plt
 import datetime, time
 import math
 import tensorflow as tf
@@ -5,11 +5,9 @@
 
 import numpy as np
 import os, sys, shutil
-import matplotlib.pyplot as plt
 import datetime, time
 import tensorflow as tf
 import igm
-from netCDF4 import Dataset
 
 from igm.modules.utils import *
 
@@ -8,6 +8,7 @@ import os, sys, shutil
 import time
 import tensorflow as tf
 from igm.modules.utils import interp1d_tf
+from igm.common import schedule
 
 
 def params(parser):
@@ -29,6 +30,12 @@ def params(parser):
         default=[],
         help="Time dependent parameters for simple mass balance model (time, gradabl, gradacc, ela, accmax)",
     )
+    parser.add_argument(
+        "--smb_simple_ensemble_ela_offset",
+        type=list,
+        default=[],
+        help="ELA offset of each ensemble member (one value per member of iflo_ensemble_size)",
+    )
 
 
 def initialize(params, state):
@@ -41,41 +48,54 @@ def initialize(params, state):
     else:
         state.smbpar = np.array(params.smb_simple_array[1:]).astype(np.float32)
 
+    # climate offsets of the ensemble members, shaped to broadcast along the member dimension
+    if len(params.smb_simple_ensemble_ela_offset) > 0:
+        state.smb_ela_offset = tf.reshape(
+            tf.constant(params.smb_simple_ensemble_ela_offset, dtype=tf.float32), (-1, 1, 1)
+        )
+
     state.tcomp_smb_simple = []
-    state.tlast_mb = tf.Variable(-1.0e5000)
+    schedule(state, "smb_simple", params.smb_simple_update_freq)
 
 
 def update(params, state):
-    # update smb each X years
-    if (state.t - state.tlast_mb) >= params.smb_simple_update_freq:
-        if hasattr(state, "logger"):
-            state.logger.info(
-                "Construct mass balance at time : " + str(state.t.numpy())
-            )
-
-        state.tcomp_smb_simple.append(time.time())
-
-        # get the smb parameters at given time t
-        gradabl = interp1d_tf(state.smbpar[:, 0], state.smbpar[:, 1], state.t)
-        gradacc = interp1d_tf(state.smbpar[:, 0], state.smbpar[:, 2], state.t)
-        ela = interp1d_tf(state.smbpar[:, 0], state.smbpar[:, 3], state.t)
-        maxacc = interp1d_tf(state.smbpar[:, 0], state.smbpar[:, 4], state.t)
-
-        # compute smb from glacier surface elevation and parameters
-        state.smb = state.usurf - ela
-        state.smb *= tf.where(tf.less(state.smb, 0), gradabl, gradacc)
-        state.smb = tf.clip_by_value(state.smb, -100, maxacc)
-
-        # if an icemask exists, then force negative smb aside to prevent leaks
-        if hasattr(state, "icemask"):
-            state.smb = tf.where(
-                (state.smb < 0) | (state.icemask > 0.5), state.smb, -10
-            )
-
-        state.tlast_mb.assign(state.t)
-
-        state.tcomp_smb_simple[-1] -= time.time()
-        state.tcomp_smb_simple[-1] *= -1
+    if not state.scheduler.due("smb_simple", state):
+        return
+
+    if hasattr(state, "logger"):
+        state.logger.info(
+            "Construct mass balance at time : " + str(state.t.numpy())
+        )
+
+    state.tcomp_smb_simple.append(time.time())
+
+    # get the smb parameters at given time t
+    gradabl = interp1d_tf(state.smbpar[:, 0], state.smbpar[:, 1], state.t)
+    gradacc = interp1d_tf(state.smbpar[:, 0], state.smbpar[:, 2], state.t)
+    ela = interp1d_tf(state.smbpar[:, 0], state.smbpar[:, 3], state.t)
+    maxacc = interp1d_tf(state.smbpar[:, 0], state.smbpar[:, 4], state.t)
+
+    # the parameters follow the precision of usurf
+    gradabl, gradacc, ela, maxacc = [
+        tf.cast(p, state.usurf.dtype) for p in [gradabl, gradacc, ela, maxacc]
+    ]
+
+    if hasattr(state, "smb_ela_offset"):
+        ela = ela + tf.cast(state.smb_ela_offset, ela.dtype)
+
+    # compute smb from glacier surface elevation and parameters
+    state.smb = state.usurf - ela
+    state.smb *= tf.where(tf.less(state.smb, 0), gradabl, gradacc)
+    state.smb = tf.clip_by_value(state.smb, -100, maxacc)
+
+    # if an icemask exists, then force negative smb aside to prevent leaks
+    if hasattr(state, "icemask"):
+        state.smb = tf.where(
+            (state.smb < 0) | (state.icemask > 0.5), state.smb, -10
+        )
+
+    state.tcomp_smb_simple[-1] -= time.time()
+    state.tcomp_smb_simple[-1] *= -1
 
 
 def finalize(params, state):
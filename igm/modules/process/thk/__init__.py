@@ -2,5 +2,6 @@ from .thk import (
     params,
     initialize,
     finalize,
-    update
+    update,
+    update_graph
 )
@@ -6,7 +6,7 @@
 import datetime, time
 import tensorflow as tf
 
-from igm.modules.utils import compute_divflux_slope_limiter
+from igm.modules.utils import compute_divflux_slope_limiter, field_dtype, cast_fields
 
 def params(parser):
     parser.add_argument(
@@ -30,6 +30,9 @@ def params(parser):
 
 def initialize(params, state):
 
+    # the ice thickness equation is solved in the floating point type given by precision
+    cast_fields(state, ["thk", "topg", "dx", "sealevel"], field_dtype(params))
+
     # define the lower ice surface
     if hasattr(state, "sealevel"):
         state.lsurf = tf.maximum(state.topg,-params.thk_ratio_density*state.thk + state.sealevel)
@@ -50,29 +53,36 @@ def update(params, state):
 
         state.tcomp_thk.append(time.time())
 
-        # compute the divergence of the flux
-        state.divflux = compute_divflux_slope_limiter(
-            state.ubar, state.vbar, state.thk, state.dx, state.dx, state.dt, slope_type=params.thk_slope_type
-        )
+        update_graph(params, state)
+
+        state.tcomp_thk[-1] -= time.time()
+        state.tcomp_thk[-1] *= -1
+
 
-        # if not smb model is given, set smb to zero
-        if not hasattr(state, "smb"):
-            state.smb = tf.zeros_like(state.thk)
+def update_graph(params, state):
+    # compute the divergence of the flux
+    # the time step and the smb (e.g. in float32) are cast to the precision of thk
+    dt = tf.cast(state.dt, state.thk.dtype)
 
-        # Forward Euler with projection to keep ice thickness non-negative
-        state.thk = tf.maximum(state.thk + state.dt * (state.smb - state.divflux), 0)
+    state.divflux = compute_divflux_slope_limiter(
+        state.ubar, state.vbar, state.thk, state.dx, state.dx, dt, slope_type=params.thk_slope_type
+    )
 
-        # define the lower ice surface
-        if hasattr(state, "sealevel"):
-            state.lsurf = tf.maximum(state.topg,-params.thk_ratio_density*state.thk + state.sealevel)
-        else:
-            state.lsurf = tf.maximum(state.topg,-params.thk_ratio_density*state.thk + params.thk_default_sealevel)
+    # if not smb model is given, set smb to zero
+    if not hasattr(state, "smb"):
+        state.smb = tf.zeros_like(state.thk)
 
-        # define the upper ice surface
-        state.usurf = state.lsurf + state.thk
+    # Forward Euler with projection to keep ice thickness non-negative
+    state.thk = tf.maximum(state.thk + dt * (tf.cast(state.smb, state.thk.dtype) - state.divflux), 0)
 
-        state.tcomp_thk[-1] -= time.time()
-        state.tcomp_thk[-1] *= -1
+    # define the lower ice surface
+    if hasattr(state, "sealevel"):
+        state.lsurf = tf.maximum(state.topg,-params.thk_ratio_density*state.thk + state.sealevel)
+    else:
+        state.lsurf = tf.maximum(state.topg,-params.thk_ratio_density*state.thk + params.thk_default_sealevel)
+
+    # define the upper ice surface
+    state.usurf = state.lsurf + state.thk
 
 
 def finalize(params, state):
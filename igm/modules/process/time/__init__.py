@@ -2,5 +2,7 @@ from .time import (
     params,
     initialize,
     finalize,
-    update
+    update,
+    update_graph_host,
+    update_graph
 )
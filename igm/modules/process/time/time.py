@@ -4,7 +4,6 @@
 # Published under the GNU GPL (Version 3), check at the LICENSE file
 
 import numpy as np
-import matplotlib.pyplot as plt
 import datetime, time
 import tensorflow as tf
 
@@ -47,7 +46,7 @@ def initialize(params, state):
 
     # the first loop is not advancing
     state.it = -1
-    state.itsave = -1
+    state.itsave = tf.constant(-1, dtype=tf.int32)
 
     state.dt = tf.Variable(float(params.time_step_max))
 
@@ -70,37 +69,58 @@ def update(params, state):
 
     state.tcomp_time.append(time.time())
 
-    # compute maximum ice velocitiy magnitude 
+    # the first loop does not advance, as dt is then zero to hit time_save[0]=time_start
+    update_graph(params, state)
+
+    # the output modules test the save flag on the host
+    state.saveresult = bool(state.saveresult.numpy())
+
+    state.it += 1
+
+    state.tcomp_time[-1] -= time.time()
+    state.tcomp_time[-1] *= -1
+
+
+def update_graph_host(params, state):
+    state.it += 1
+
+
+def update_graph(params, state):
+    """
+    Computes dt from the CFL condition and the saving times, and advances the time.
+    The tests on tensors are replaced by tf.where such that the function is traced
+    in the graph step (graph_step option) without host-device sync, state.saveresult
+    is then a device-side boolean flag, read once per step by run_processes_graph.
+    """
+
+    # compute maximum ice velocitiy magnitude (over all members in ensemble mode,
+    # such that all members share the minimum dt)
     velomax = tf.maximum(
         tf.reduce_max(tf.abs(state.ubar)),
         tf.reduce_max(tf.abs(state.vbar)),
     )
-    # dt_target account for both cfl and dt_max
-    if (velomax > 0) & (params.time_cfl>0):
-        state.dt_target =  tf.minimum(
-            params.time_cfl * state.dx / velomax, params.time_step_max
+
+    # dt_target account for both cfl and dt_max (the time is kept in float32 whatever the precision)
+    if params.time_cfl > 0:
+        state.dt_target = tf.cast(
+            tf.where(
+                velomax > 0,
+                tf.minimum(params.time_cfl * state.dx / velomax, params.time_step_max),
+                params.time_step_max,
+            ),
+            state.t.dtype,
         )
     else:
-        state.dt_target = params.time_step_max
-
-    state.dt = state.dt_target
+        state.dt_target = tf.constant(params.time_step_max, dtype=state.t.dtype)
 
     # modify dt such that times of requested savings are reached exactly
-    if state.time_save[state.itsave + 1] <= state.t + state.dt:
-        state.dt = state.time_save[state.itsave + 1] - state.t
-        state.saveresult = True
-        state.itsave += 1
-    else:
-        state.saveresult = False
+    tnext = tf.gather(state.time_save, state.itsave + 1)
 
-    # the first loop is not advancing
-    if state.it >= 0:
-        state.t.assign(state.t + state.dt)
-
-    state.it += 1
+    state.saveresult = tnext <= state.t + state.dt_target
+    state.dt = tf.where(state.saveresult, tnext - state.t, state.dt_target)
+    state.itsave = state.itsave + tf.cast(state.saveresult, tf.int32)
 
-    state.tcomp_time[-1] -= time.time()
-    state.tcomp_time[-1] *= -1
+    state.t.assign(state.t + state.dt)
 
 
 def finalize(params, state):
@@ -2,5 +2,6 @@ from .vert_flow import (
     params,
     initialize,
     finalize,
-    update
+    update,
+    update_graph
 )
@@ -28,6 +28,13 @@ def update(params, state):
 
     state.tcomp_vert_flow.append(time.time())
 
+    update_graph(params, state)
+
+    state.tcomp_vert_flow[-1] -= time.time()
+    state.tcomp_vert_flow[-1] *= -1
+
+
+def update_graph(params, state):
     if params.vflo_method == "kinematic":
         state.W = _compute_vertical_velocity_kinematic(params, state)
     else:
@@ -36,10 +43,6 @@ def update(params, state):
     state.wvelbase = state.W[0]
     state.wvelsurf = state.W[-1]
 
-    state.tcomp_vert_flow[-1] -= time.time()
-    state.tcomp_vert_flow[-1] *= -1
-
-
 
 def finalize(params, state):
     pass
@@ -83,7 +86,7 @@ def _compute_vertical_velocity_incompressibility(params, state):
 
 @tf.function()
 def vertical_disc_tf(thk, Nz, vert_spacing):
-    zeta = tf.cast(tf.range(Nz) / (Nz - 1), "float32")
+    zeta = tf.cast(tf.range(Nz) / (Nz - 1), thk.dtype)
     levels = (zeta / vert_spacing) * (1.0 + (vert_spacing - 1.0) * zeta)
     ddz = levels[1:] - levels[:-1]
 
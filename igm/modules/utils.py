@@ -18,7 +18,9 @@ __all__ = [
     "compute_divflux",
     "interp1d_tf",
     "complete_data",
-    "interpolate_bilinear_tf"
+    "interpolate_bilinear_tf",
+    "field_dtype",
+    "cast_fields",
 ]
 
 def str2bool(v):
@@ -170,17 +172,20 @@ def compute_divflux_slope_limiter(u, v, h, dx, dy, dt, slope_type):
      https://github.com/python-hydro/hydro_examples
     """
     
-    u = tf.concat( [u[:, 0:1], 0.5 * (u[:, :-1] + u[:, 1:]), u[:, -1:]], 1 )  # has shape (ny,nx+1)
-    v = tf.concat( [v[0:1, :], 0.5 * (v[:-1, :] + v[1:, :]), v[-1:, :]], 0 )  # has shape (ny+1,nx)
+    # any leading dimension (e.g. ensemble members) is kept, the two last are (ny,nx)
+    pad = [[0, 0]] * (len(h.shape) - 2)
 
-    Hx = tf.pad(h, [[0,0],[2,2]], 'CONSTANT') # (ny,nx+4)
-    Hy = tf.pad(h, [[2,2],[0,0]], 'CONSTANT') # (ny+4,nx)
+    u = tf.concat( [u[..., 0:1], 0.5 * (u[..., :-1] + u[..., 1:]), u[..., -1:]], -1 )  # has shape (ny,nx+1)
+    v = tf.concat( [v[..., 0:1, :], 0.5 * (v[..., :-1, :] + v[..., 1:, :]), v[..., -1:, :]], -2 )  # has shape (ny+1,nx)
+
+    Hx = tf.pad(h, pad + [[0,0],[2,2]], 'CONSTANT') # (ny,nx+4)
+    Hy = tf.pad(h, pad + [[2,2],[0,0]], 'CONSTANT') # (ny+4,nx)
     
-    sigpx = (Hx[:,2:]-Hx[:,1:-1])/dx    # (ny,nx+2)
-    sigmx = (Hx[:,1:-1]-Hx[:,:-2])/dx   # (ny,nx+2) 
+    sigpx = (Hx[...,2:]-Hx[...,1:-1])/dx    # (ny,nx+2)
+    sigmx = (Hx[...,1:-1]-Hx[...,:-2])/dx   # (ny,nx+2) 
 
-    sigpy = (Hy[2:,:] -Hy[1:-1,:])/dy   # (ny+2,nx)
-    sigmy = (Hy[1:-1,:]-Hy[:-2,:])/dy   # (ny+2,nx) 
+    sigpy = (Hy[...,2:,:] -Hy[...,1:-1,:])/dy   # (ny+2,nx)
+    sigmy = (Hy[...,1:-1,:]-Hy[...,:-2,:])/dy   # (ny+2,nx) 
 
     if slope_type == "godunov":
  
@@ -202,16 +207,16 @@ def compute_divflux_slope_limiter(u, v, h, dx, dy, dt, slope_type):
         sig2y  = minmod( sigmy , 2.0*sigpy )
         slopey = maxmod( sig1y, sig2y)
 
-    w   = Hx[:,1:-2] + 0.5*dx*(1.0 - u*dt/dx)*slopex[:,:-1]      #  (ny,nx+1)      
-    e   = Hx[:,2:-1] - 0.5*dx*(1.0 + u*dt/dx)*slopex[:,1:]       #  (ny,nx+1)    
+    w   = Hx[...,1:-2] + 0.5*dx*(1.0 - u*dt/dx)*slopex[...,:-1]      #  (ny,nx+1)      
+    e   = Hx[...,2:-1] - 0.5*dx*(1.0 + u*dt/dx)*slopex[...,1:]       #  (ny,nx+1)    
     
-    s   = Hy[1:-2,:] + 0.5*dy*(1.0 - v*dt/dy)*slopey[:-1,:]      #  (ny+1,nx)      
-    n   = Hy[2:-1,:] - 0.5*dy*(1.0 + v*dt/dy)*slopey[1:,:]       #  (ny+1,nx)    
+    s   = Hy[...,1:-2,:] + 0.5*dy*(1.0 - v*dt/dy)*slopey[...,:-1,:]      #  (ny+1,nx)      
+    n   = Hy[...,2:-1,:] - 0.5*dy*(1.0 + v*dt/dy)*slopey[...,1:,:]       #  (ny+1,nx)    
      
     Qx = u * tf.where(u > 0, w, e)  #  (ny,nx+1)   
     Qy = v * tf.where(v > 0, s, n)  #  (ny+1,nx)   
      
-    return (Qx[:, 1:] - Qx[:, :-1]) / dx + (Qy[1:, :] - Qy[:-1, :]) / dy  
+    return (Qx[..., 1:] - Qx[..., :-1]) / dx + (Qy[..., 1:, :] - Qy[..., :-1, :]) / dy  
 
 @tf.function()
 def interp1d_tf(xs, ys, x):
@@ -253,6 +258,30 @@ def interp1d_tf(xs, ys, x):
     return tf.cast(tf.reshape(y, tf.shape(x)), dtype)
 
 
+def field_dtype(params):
+    """
+    This returns the floating point type of the fields given the precision option,
+    with mixed_bfloat16 only the emulator computes in bfloat16, the fields stay in float32
+    """
+    if params.precision == "float64":
+        return tf.float64
+    else:
+        return tf.float32
+
+
+def cast_fields(state, names, dtype):
+    """
+    This casts the fields of the state listed in names (when they exist) to dtype
+    """
+    for name in names:
+        field = getattr(state, name, None)
+        if hasattr(field, "dtype") and not (field.dtype == dtype):
+            if isinstance(field, tf.Variable):
+                vars(state)[name] = tf.Variable(tf.cast(field, dtype), trainable=False)
+            else:
+                vars(state)[name] = tf.cast(field, dtype)
+
+
 def complete_data(state):
     """
     This function adds a postriori import fields such as X, Y, x, dx, ....
@@ -25,7 +25,7 @@ setup(
     url="https://github.com/jouvetg/igm",
     license="gpl-3.0",
     packages=find_packages(),
-    entry_points={"console_scripts": ["igm_run = igm.igm_run:main","igm_help = igm.igm_help:main"]},
+    entry_points={"console_scripts": ["igm_run = igm.igm_run:main","igm_help = igm.igm_help:main","igm_batch = igm.igm_batch:main","igm_bench = igm.igm_bench:main"]},
     package_data={"igm": package_files("igm/emulators")},
     description="IGM - a glacier evolution model",
     long_description=readme,
@@ -0,0 +1,38 @@
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--bench-baseline",
+        action="store",
+        default="",
+        help="igm_bench results file used as baseline by the tests marked perf",
+    )
+    parser.addoption(
+        "--bench-time-tolerance",
+        action="store",
+        type=float,
+        default=0.25,
+        help="Relative increase of the median step time tolerated by the tests marked perf",
+    )
+    parser.addoption(
+        "--bench-memory-tolerance",
+        action="store",
+        type=float,
+        default=0.25,
+        help="Relative increase of the peak memory tolerated by the tests marked perf",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "perf: performance regression test against a stored igm_bench baseline"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--bench-baseline") == "":
+        skip = pytest.mark.skip(reason="needs --bench-baseline")
+        for item in items:
+            if "perf" in item.keywords:
+                item.add_marker(skip)
@@ -0,0 +1,85 @@
+import os
+import json
+import numpy as np
+import pytest
+from netCDF4 import Dataset
+
+from igm.igm_batch import run_batch
+
+def write_input(filename, slope):
+
+    x = np.arange(0, 50) * 100
+    y = np.arange(0, 100) * 100
+
+    X, Y = np.meshgrid(x, y)
+
+    nc = Dataset(filename, "w", format="NETCDF4")
+    nc.createDimension("y", len(y))
+    nc.createVariable("y", np.dtype("float64").char, ("y",))[:] = y
+    nc.createDimension("x", len(x))
+    nc.createVariable("x", np.dtype("float64").char, ("x",))[:] = x
+    nc.createVariable("topg", np.dtype("float32").char, ("y", "x"))[:] = \
+        1000 + slope * Y + ((X - 2500) ** 2) / 50000
+    nc.createVariable("thk", np.dtype("float32").char, ("y", "x"))[:] = 0.0 * X
+    nc.close()
+
+def test_batch(tmp_path):
+
+    jobs = []
+    for i, slope in enumerate([0.15, 0.2]):
+        jobs.append(str(tmp_path / ("glacier%d.nc" % i)))
+        write_input(jobs[-1], slope)
+
+    param_file = str(tmp_path / "params.json")
+    with open(param_file, "w") as f:
+        json.dump({
+            "modules_preproc": ["load_ncdf"],
+            "modules_process": ["smb_simple", "iceflow", "time", "thk"],
+            "modules_postproc": ["write_ts"],
+            "smb_simple_array": [["time", "gradabl", "gradacc", "ela", "accmax"],
+                                 [2000, 0.009, 0.005, 1500, 2.0],
+                                 [2100, 0.009, 0.005, 1500, 2.0]],
+            "time_start": 2000.0,
+            "time_end": 2020.0,
+            "time_save": 10.0,
+            "print_params": False,
+        }, f)
+
+    index_file = str(tmp_path / "batch_index.json")
+
+    records = run_batch(jobs, param_file, workers=2,
+                        output_dir=str(tmp_path / "batch"), index_file=index_file)
+
+    with open(index_file, "r") as f:
+        index = json.load(f)
+
+    assert [r["job"] for r in index] == jobs
+    assert all(r["status"] == "done" for r in index), index[0]["error"]
+    assert set(r["worker"] for r in index) <= {0, 1}
+    assert all(r["summary"]["time_end"] == 2020.0 for r in index)
+    assert all(r["summary"]["vol_end"] > 0 for r in index)
+
+def test_batch_rgi_directories(tmp_path):
+
+    # two glaciers of the same RGI region
+    jobs = ["RGI60-11.01450", "RGI60-11.01238"]
+
+    param_file = str(tmp_path / "params.json")
+    with open(param_file, "w") as f:
+        json.dump({
+            "modules_preproc": [],
+            "modules_process": ["time"],
+            "modules_postproc": [],
+            "time_start": 2000.0,
+            "time_end": 2001.0,
+            "print_params": False,
+        }, f)
+
+    records = run_batch(jobs, param_file, workers=2,
+                        output_dir=str(tmp_path / "batch"),
+                        index_file=str(tmp_path / "batch_index.json"))
+
+    directories = [r["directory"] for r in records]
+
+    assert directories == [str(tmp_path / "batch" / job) for job in jobs]
+    assert all(os.path.isdir(d) for d in directories)
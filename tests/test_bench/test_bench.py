@@ -0,0 +1,26 @@
+import json
+import pytest
+
+from igm.igm_bench import run_bench, KERNELS
+
+def test_bench(tmp_path):
+
+    output = str(tmp_path / "bench_results.json")
+
+    run_bench(sizes=[32, 64], steps=2, warmup=1, solve_nbit=2,
+              isolate=False, output=output)
+
+    with open(output, "r") as f:
+        results = json.load(f)
+
+    assert "tensorflow" in results["machine"]
+
+    records = results["results"]
+
+    assert [(r["size"], r["kernel"]) for r in records] == \
+        [(n, k) for n in [32, 64] for k in KERNELS]
+    assert all(r["status"] == "done" for r in records), \
+        [r["error"] for r in records if r["status"] == "failed"]
+    assert all(r["steps"] == 2 for r in records)
+    assert all(r["cells_steps_per_s"] > 0 for r in records)
+    assert all(r["peak_memory"] + r["peak_rss"] > 0 for r in records)
@@ -0,0 +1,46 @@
+import copy
+import pytest
+
+from igm.igm_bench import compare_to_baseline, run_regression
+
+def make_results(p50, peak_rss, status="done"):
+    return {
+        "machine": {"processor": "x86_64", "cpu_count": 8, "gpus": []},
+        "results": [
+            {"kernel": "thk", "size": 100, "status": status,
+             "p50": p50, "peak_memory": 0, "peak_rss": peak_rss},
+        ],
+    }
+
+def test_compare_to_baseline():
+
+    baseline = make_results(1.0, 1000)
+
+    assert compare_to_baseline(make_results(1.2, 1100), baseline) == []
+
+    regressions = compare_to_baseline(make_results(1.5, 1100), baseline)
+    assert [r["metric"] for r in regressions] == ["p50"]
+    assert regressions[0]["ratio"] == pytest.approx(1.5)
+
+    regressions = compare_to_baseline(make_results(1.0, 2000), baseline, memory_tolerance=0.5)
+    assert [r["metric"] for r in regressions] == ["peak_rss"]
+
+    regressions = compare_to_baseline(make_results(0, 0, "failed"), baseline)
+    assert [r["metric"] for r in regressions] == ["status"]
+
+    other = copy.deepcopy(baseline)
+    other["machine"]["cpu_count"] = 16
+    with pytest.raises(ValueError):
+        compare_to_baseline(make_results(1.0, 1000), other)
+
+@pytest.mark.perf
+def test_no_regression(request, tmp_path):
+
+    regressions = run_regression(
+        request.config.getoption("--bench-baseline"),
+        time_tolerance=request.config.getoption("--bench-time-tolerance"),
+        memory_tolerance=request.config.getoption("--bench-memory-tolerance"),
+        output=str(tmp_path / "bench_results.json"),
+    )
+
+    assert regressions == [], regressions
@@ -0,0 +1,87 @@
+import igm
+import os
+import tensorflow as tf
+import numpy as np
+import pytest
+
+def run_synthetic(time_end, **kwargs):
+
+    param_file = "./test_full_glacier_evolution_synthetic/params.json"
+
+    state = igm.State()
+    parser = igm.params_core()
+
+    modules_dict = igm.get_modules_list(param_file)
+
+    modules = igm.load_modules(modules_dict)
+
+    for module in modules:
+        module.params(parser)
+    params,_ = parser.parse_known_args()
+    params = igm.load_user_defined_params( param_file=param_file, params_dict=vars(params) )
+    parser.set_defaults(**params)
+
+    params, __ = parser.parse_known_args()
+
+    params.time_end = time_end
+    for k, v in kwargs.items():
+        setattr(params, k, v)
+
+    with tf.device(f"/GPU:{params.gpu_id}"):
+        igm.run_intializers(modules, params, state)
+        igm.run_processes(modules, params, state)
+        igm.run_finalizers(modules, params, state)
+
+    return state
+
+def test_checkpoint(tmp_path):
+
+    checkpoint_file = str(tmp_path / "checkpoint.npz")
+
+    # the checkpoint is written once, when t reaches 2025
+    state_ref = run_synthetic(2040.0, checkpoint_freq=25.0, checkpoint_file=checkpoint_file)
+
+    state = run_synthetic(2040.0, restart_from=checkpoint_file, profiling=True,
+                          profiling_output=str(tmp_path / "profiling"))
+
+    # the restarted run only did the iterations after the checkpoint
+    assert state.profiler.stats()["thk:update"]["count"] < state_ref.it
+
+    assert state.tlast_checkpoint >= 2025.0
+
+    assert state.it == state_ref.it
+
+    assert np.array_equal(state.thk.numpy(), state_ref.thk.numpy())
+
+    if os.path.exists('clean.sh'):
+        os.remove('clean.sh')
+
+def test_checkpoint_optimizer(tmp_path):
+
+    from argparse import Namespace
+
+    params = Namespace(checkpoint_file=str(tmp_path / "checkpoint.npz"))
+
+    def make_state():
+        state = igm.State()
+        state.U = tf.Variable(tf.ones((3, 4)))
+        state.V = tf.Variable(tf.ones((3, 4)))
+        # a model with two variables, as many as U and V
+        state.iceflow_model = tf.keras.Sequential([tf.keras.layers.Dense(2, input_shape=(3,))])
+        state.optimizer = tf.keras.optimizers.legacy.Adam(learning_rate=0.1)
+        igm.register_optimizer(state, "optimizer", ["U", "V"])
+        return state
+
+    state = make_state()
+    for i in range(3):
+        state.optimizer.apply_gradients(zip([state.U * 2, state.V * 3], [state.U, state.V]))
+
+    igm.save_checkpoint(params, state, asynchronous=False)
+
+    # the slots are rebuilt on U and V, and not on the model
+    restarted = make_state()
+    igm.load_checkpoint(params.checkpoint_file, restarted)
+
+    for v, w in zip(state.optimizer.variables(), restarted.optimizer.variables()):
+        assert np.array_equal(v.numpy(), w.numpy())
+    assert restarted.optimizer.get_slot(restarted.U, "m") is not None
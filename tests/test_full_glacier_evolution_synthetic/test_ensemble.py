@@ -0,0 +1,26 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+from .test_checkpoint import run_synthetic
+
+def test_ensemble():
+
+    state_ref = run_synthetic(2050.0, iflo_retrain_emulator_freq=0)
+
+    state = run_synthetic(2050.0, iflo_retrain_emulator_freq=0,
+                          iflo_ensemble_size=2,
+                          smb_simple_ensemble_ela_offset=[0.0, 200.0])
+
+    assert state.thk.shape == (2,) + state_ref.thk.shape
+    assert state.U.shape[0] == 2
+
+    # all members share the same time stepping
+    assert state.it == state_ref.it
+
+    # the member without offset reproduces the single run
+    assert np.max(np.abs(state.thk[0] - state_ref.thk)) < 0.1
+
+    # a higher ELA leads to a smaller glacier
+    assert np.sum(state.thk[1]) < np.sum(state.thk[0])
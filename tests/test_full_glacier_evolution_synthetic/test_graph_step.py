@@ -0,0 +1,39 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+def test_graph_step():
+
+    param_file = "./test_full_glacier_evolution_synthetic/params.json"
+
+    state = igm.State()
+    parser = igm.params_core()
+
+    modules_dict = igm.get_modules_list(param_file)
+    modules_dict["modules_process"] = modules_dict["modules_process"] + ["vert_flow"]
+
+    modules = igm.load_modules(modules_dict)
+
+    for module in modules:
+        module.params(parser)
+    params,_ = parser.parse_known_args()
+    params = igm.load_user_defined_params( param_file=param_file, params_dict=vars(params) )
+    parser.set_defaults(**params)
+
+    params, __ = parser.parse_known_args()
+
+    params.graph_step = True
+
+    with tf.device(f"/GPU:{params.gpu_id}"):
+        igm.run_intializers(modules, params, state)
+        igm.run_processes(modules, params, state)
+        igm.run_finalizers(modules, params, state)
+
+    vol = np.sum(state.thk) * (state.dx**2) / 10**9
+
+    assert (vol<11.5)&(vol>11.0)
+
+    assert state.t.numpy() == params.time_end
+
+    assert len(state.tcomp_graph_step) > 0
@@ -0,0 +1,23 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+from .test_checkpoint import run_synthetic
+
+@pytest.mark.parametrize("precision", ["float64", "mixed_bfloat16"])
+def test_precision(precision):
+
+    state_ref = run_synthetic(2050.0)
+
+    state = run_synthetic(2050.0, precision=precision)
+
+    dtype = tf.float64 if precision == "float64" else tf.float32
+
+    assert state.thk.dtype == dtype
+    assert state.U.dtype == dtype
+
+    vol_ref = np.sum(state_ref.thk, dtype="float64")
+    vol = np.sum(state.thk, dtype="float64")
+
+    assert abs(vol - vol_ref) < 0.05 * vol_ref
@@ -0,0 +1,56 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+
+def glacier(Ny, Nx, radius, center=None, base=2000.0):
+    """A dome of 200 m of ice and of the given radius (in cells), on a bed sloping by 5 m per cell"""
+
+    cy, cx = (Ny // 2, Nx // 2) if center is None else center
+
+    y, x = np.meshgrid(np.arange(Ny), np.arange(Nx), indexing="ij")
+
+    thk = (200 * np.maximum(1 - ((y - cy) ** 2 + (x - cx) ** 2) / radius ** 2, 0)).astype("float32")
+    usurf = (base + 5 * y + thk).astype("float32")
+
+    return thk, usurf
+
+
+@pytest.fixture
+def iceflow_setup():
+    """
+    Returns a function initializing the iceflow module on a 100 m grid, with the ice
+    thickness and surface of glacier(Ny, Nx, radius, center, base) unless thk and usurf
+    are given. The other keyword arguments are set to the parameters before the
+    initialization. Returns the module, the parameters and the state.
+    """
+
+    def setup(Ny=60, Nx=50, radius=20, center=None, base=2000.0,
+              thk=None, usurf=None, it=-1, t=None, **kwargs):
+
+        state = igm.State()
+        modules = igm.load_modules({'modules_preproc': [], 'modules_process': ['iceflow'], 'modules_postproc': []})
+
+        parser = igm.params_core()
+        modules[0].params(parser)
+        params, __ = parser.parse_known_args()
+
+        for k, v in kwargs.items():
+            setattr(params, k, v)
+
+        if thk is None:
+            thk, usurf = glacier(Ny, Nx, radius, center, base)
+
+        state.thk   = tf.Variable(thk)
+        state.usurf = tf.Variable(usurf)
+        state.dX    = tf.Variable(tf.ones_like(thk) * 100)
+        state.it    = it
+        if t is not None:
+            state.t = tf.Variable(float(t))
+
+        modules[0].initialize(params, state)
+
+        return modules[0], params, state
+
+    return setup
@@ -0,0 +1,31 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+from igm.modules.process.iceflow.emulate import update_iceflow_emulator
+
+def test_adaptive_retraining(iceflow_setup):
+
+    iceflow, params, state = iceflow_setup(
+        iflo_retrain_emulator_freq=1,
+        iflo_retrain_emulator_adaptive=True,
+        iflo_retrain_emulator_nbit=5,
+    )
+
+    # the first retraining sets the reference residual
+    update_iceflow_emulator(params, state)
+    assert state.emulator_residual_ref > 0
+
+    # an unchanged geometry does not trigger any retraining
+    state.it = 1
+    weights = state.iceflow_model.get_weights()
+    update_iceflow_emulator(params, state)
+    assert all(np.array_equal(w, v) for w, v in zip(weights, state.iceflow_model.get_weights()))
+
+    # while a large change of geometry does
+    state.usurf.assign(state.usurf + state.thk)
+    state.thk.assign(2 * state.thk)
+    state.it = 2
+    update_iceflow_emulator(params, state)
+    assert not all(np.array_equal(w, v) for w, v in zip(weights, state.iceflow_model.get_weights()))
@@ -0,0 +1,30 @@
+import os
+import tensorflow as tf
+import numpy as np
+import pytest
+import importlib_resources
+
+from igm import emulators
+from igm.modules.process.iceflow.artifact import build_emulator_artifact, load_emulator_artifact
+
+def test_emulator_artifact(tmp_path):
+
+    dirpath = importlib_resources.files(emulators).joinpath("pinnbp_10_4_cnn_16_32_2_1")
+
+    path = build_emulator_artifact(dirpath, str(tmp_path))
+
+    # the artifact is built only once
+    assert build_emulator_artifact(dirpath, str(tmp_path)) == path
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+
+    model, manifest = load_emulator_artifact(path)
+
+    assert manifest["fieldin"] == ["thk", "usurf", "arrhenius", "slidingco", "dX"]
+    assert manifest["Nz"] == 10
+
+    # the artifact gives the same outputs as the original model
+    model_ref = tf.keras.models.load_model(os.path.join(dirpath, "model.h5"), compile=False)
+
+    X = tf.random.uniform((1, 32, 24, 5))
+
+    assert np.allclose(model(X).numpy(), model_ref(X).numpy())
@@ -0,0 +1,19 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+def test_compile_emulator(iceflow_setup, tmp_path):
+
+    glacier = dict(Ny=90, Nx=70, radius=20, center=(40, 30), iflo_retrain_emulator_freq=0)
+
+    __, __, state_ref = iceflow_setup(**glacier)
+    __, __, state = iceflow_setup(**glacier, iflo_compile_emulator=True,
+                                  iflo_compile_cache_directory=str(tmp_path / "xla"))
+
+    # one compiled function for the bucket (90 -> 104, 70 -> 72)
+    assert [k[2:4] for k in state.iceflow_forward_cache] == [(104, 72)]
+
+    # the padding only affects the velocity near the bottom and right borders
+    ice = state.thk.numpy() > 0
+    assert np.allclose(state.U.numpy()[:, ice], state_ref.U.numpy()[:, ice], atol=1e-2)
@@ -0,0 +1,31 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+def test_crop_active_region(iceflow_setup):
+
+    Ny, Nx = 200, 240
+
+    y, x = np.meshgrid(np.arange(Ny), np.arange(Nx), indexing="ij")
+
+    # two small glaciers in a large domain, one of them at the border
+    thk = np.zeros((Ny, Nx), dtype="float32")
+    thk += 200 * np.maximum(1 - ((y - 60) ** 2 + (x - 70) ** 2) / 15 ** 2, 0)
+    thk += 150 * np.maximum(1 - ((y - 190) ** 2 + (x - 200) ** 2) / 12 ** 2, 0)
+    usurf = (2000 + 5 * y + thk).astype("float32")
+
+    __, __, state_ref = iceflow_setup(thk=thk, usurf=usurf, iflo_retrain_emulator_freq=0)
+    __, __, state = iceflow_setup(thk=thk, usurf=usurf, iflo_retrain_emulator_freq=0,
+                                  iflo_crop_active_region=True)
+
+    ice = thk > 0
+
+    assert np.max(np.abs(state_ref.U.numpy())) > 1
+
+    # the velocity on the ice does not depend on the cropping
+    assert np.allclose(state.U.numpy()[:, ice], state_ref.U.numpy()[:, ice], atol=1e-3)
+    assert np.allclose(state.V.numpy()[:, ice], state_ref.V.numpy()[:, ice], atol=1e-3)
+
+    # and the velocity is zero far from the ice
+    assert np.all(state.U.numpy()[:, 130, 10] == 0)
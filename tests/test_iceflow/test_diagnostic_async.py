@@ -0,0 +1,29 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+def test_diagnostic_async(iceflow_setup, tmp_path, monkeypatch):
+
+    monkeypatch.chdir(tmp_path)
+
+    iceflow, params, state = iceflow_setup(
+        Ny=40, Nx=30, radius=14, it=0, t=0.0,
+        iflo_type="diagnostic",
+        iflo_diagnostic_async=True,
+        iflo_retrain_emulator_freq=0,
+        iflo_solve_nbitmax=20,
+    )
+
+    for it in range(21):
+        state.it = it
+        state.t.assign(float(it))
+        iceflow.update(params, state)
+
+    iceflow.finalize(params, state)
+
+    # the reference solve of the iteration 0, and of 10 and 20 unless the former one was still running
+    ERR = np.atleast_2d(np.loadtxt(tmp_path / "errors.txt", delimiter=","))
+    assert 1 <= ERR.shape[0] <= 3
+    assert ERR[0, 0] == 0
+    assert np.all(np.isfinite(ERR))
@@ -0,0 +1,35 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+from igm.modules.process.iceflow.emulate import update_iceflow_emulated
+from igm.modules.process.iceflow.distill import distill_emulator
+
+def test_distill(iceflow_setup):
+
+    # the state met in initialize is gathered
+    iceflow, params, state = iceflow_setup(
+        iflo_retrain_emulator_freq=0,
+        iflo_distill=True,
+        iflo_distill_nb_layers=4,
+        iflo_distill_nb_out_filter=8,
+        iflo_distill_nbit=20,
+        # any student is accepted
+        iflo_distill_max_energy_error=np.inf,
+    )
+    assert len(state.distill_buffer) == 1
+
+    teacher = state.iceflow_model
+
+    distill_emulator(params, state)
+
+    assert set(state.distill_report) == {"speedup", "energy_error", "swapped"}
+    assert state.distill_report["swapped"]
+    assert not state.iceflow_model is teacher
+    assert len(state.iceflow_model.layers) < len(teacher.layers)
+
+    # the student is used for inference, and no more states are gathered
+    update_iceflow_emulated(params, state)
+    assert len(state.distill_buffer) == 1
+    assert np.all(np.isfinite(state.U.numpy()))
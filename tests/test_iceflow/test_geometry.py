@@ -0,0 +1,45 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+from igm.modules.process.iceflow.energy_iceflow import (
+    iceflow_energy,
+    iceflow_energy_geometry,
+    iceflow_geometry,
+)
+from igm.modules.process.iceflow.solve import solve_iceflow
+
+@pytest.mark.parametrize("dim_arrhenius, cf_cond", [(2, False), (3, False), (2, True)])
+def test_geometry(iceflow_setup, dim_arrhenius, cf_cond):
+
+    Ny, Nx = 40, 30
+
+    # the ice is partly below sea level, such that there is a calving front
+    iceflow, params, state = iceflow_setup(
+        Ny=Ny, Nx=Nx, radius=14, base=-100.0, it=0,
+        iflo_dim_arrhenius=dim_arrhenius,
+        iflo_cf_cond=cf_cond,
+    )
+
+    fieldin = [tf.expand_dims(vars(state)[f], axis=0) for f in params.iflo_fieldin]
+
+    geometry = iceflow_geometry(params, fieldin)
+
+    # the energy of several velocities on the same precomputed geometry
+    for k in range(3):
+        U = tf.random.normal((1, params.iflo_Nz, Ny, Nx)) * 10
+        V = tf.random.normal((1, params.iflo_Nz, Ny, Nx)) * 10
+
+        for c, cg in zip(iceflow_energy(params, U, V, fieldin), iceflow_energy_geometry(params, U, V, geometry)):
+            assert np.allclose(c.numpy(), cg.numpy(), rtol=1e-5, atol=1e-6)
+
+    # the solver evaluates the energy on the geometry precomputed once
+    U0 = tf.random.normal((params.iflo_Nz, Ny, Nx)) * 10
+    V0 = tf.random.normal((params.iflo_Nz, Ny, Nx)) * 10
+
+    E0 = sum(tf.reduce_mean(c) for c in iceflow_energy(params, U0[None], V0[None], fieldin))
+
+    U, V, Cost_Glen = solve_iceflow(params, state, tf.Variable(U0), tf.Variable(V0), nbitmax=2)
+
+    assert np.isclose(Cost_Glen[0].numpy(), E0.numpy(), rtol=1e-5)
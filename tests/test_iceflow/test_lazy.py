@@ -0,0 +1,29 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+def test_lazy_velocity(iceflow_setup):
+
+    iceflow, params, state = iceflow_setup(
+        t=0.0,
+        iflo_retrain_emulator_freq=0,
+        iflo_lazy_velocity=True,
+        iflo_lazy_velocity_tol=0.001,
+    )
+
+    U = state.U.numpy()
+
+    # a change of a few centimeters, the velocity is reused
+    state.it = 1
+    state.thk.assign(state.thk + 0.01)
+    iceflow.update(params, state)
+    assert state.lazy_velocity_skipped == 1
+    assert np.array_equal(state.U.numpy(), U)
+
+    # a change of several meters, the emulator is evaluated again
+    state.it = 2
+    state.thk.assign(state.thk * 1.1)
+    iceflow.update(params, state)
+    assert state.lazy_velocity_skipped == 1
+    assert not np.array_equal(state.U.numpy(), U)
@@ -0,0 +1,27 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+@pytest.mark.parametrize("backend", ["float16", "int8"])
+def test_quantized_inference(iceflow_setup, backend):
+
+    __, __, state_ref = iceflow_setup(iflo_retrain_emulator_freq=0)
+    __, __, state = iceflow_setup(iflo_retrain_emulator_freq=0, iflo_inference_backend=backend,
+                                  iflo_quantize_max_energy_error=np.inf)
+
+    assert state.quantized_emulator is not None
+
+    # the quantized emulator is close to the keras one
+    scale = np.max(np.abs(state_ref.U.numpy()))
+    assert np.max(np.abs(state.U.numpy() - state_ref.U.numpy())) < 0.1 * scale
+
+def test_quantized_fallback(iceflow_setup):
+
+    # no energy error is tolerated, the keras emulator is kept
+    __, __, state_ref = iceflow_setup(iflo_retrain_emulator_freq=0)
+    __, __, state = iceflow_setup(iflo_retrain_emulator_freq=0, iflo_inference_backend="int8",
+                                  iflo_quantize_max_energy_error=-np.inf)
+
+    assert state.quantized_emulator is None
+    assert np.allclose(state.U.numpy(), state_ref.U.numpy())
@@ -0,0 +1,44 @@
+import tensorflow as tf
+import numpy as np
+import pytest
+
+from igm.modules.process.iceflow.replay import ReplayBuffer
+
+@pytest.mark.parametrize("eviction", ["reservoir", "fifo"])
+def test_replay_buffer(eviction):
+
+    buffer = ReplayBuffer(5, downsample=2, eviction=eviction, seed=0)
+
+    for k in range(4):
+        buffer.add(tf.ones((3, 20, 16, 5)) * k)
+
+    # the buffer is bounded
+    assert len(buffer) == 5
+
+    # with fifo, only the most recent patches are kept
+    if eviction == "fifo":
+        assert all(np.all(p == 3) for p in buffer.patches[-3:])
+
+    # the patches are stored compactly, and replayed in their original shape
+    assert buffer.patches[0].dtype == np.float16
+    assert buffer.patches[0].shape == (10, 8, 5)
+
+    X = buffer.sample(3, (20, 16, 5), tf.float32)
+    assert X.shape == (3, 20, 16, 5)
+    assert X.dtype == tf.float32
+
+    # patches of another shape are not replayed
+    assert buffer.sample(3, (30, 16, 5), tf.float32) is None
+
+def test_replay_buffer_state_dict():
+
+    buffer = ReplayBuffer(4, eviction="reservoir", seed=0)
+    for k in range(6):
+        buffer.add(tf.ones((2, 8, 6, 5)) * k)
+
+    # a buffer restored from its content replays the same patches
+    restored = ReplayBuffer(4, eviction="reservoir", seed=1)
+    restored.load_state_dict(buffer.state_dict())
+
+    assert restored.nb_seen == buffer.nb_seen
+    assert np.array_equal(buffer.sample(3, (8, 6, 5), tf.float32), restored.sample(3, (8, 6, 5), tf.float32))
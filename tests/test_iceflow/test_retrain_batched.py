@@ -0,0 +1,24 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+from igm.modules.process.iceflow.emulate import update_iceflow_emulator
+
+def test_retrain_batched(iceflow_setup):
+
+    iceflow, params, state = iceflow_setup(
+        iflo_retrain_emulator_batched=True,
+        iflo_retrain_emulator_nbit_init=3,
+        # small patches and budget, such that the patches are split in several batches
+        iflo_retrain_emulator_framesizemax=30,
+        iflo_retrain_emulator_memory=5,
+    )
+
+    weights = state.iceflow_model.get_weights()
+
+    update_iceflow_emulator(params, state)
+
+    assert len(state.COST_EMULATOR) == 3
+    assert all(np.isfinite(c.numpy()) for c in state.COST_EMULATOR)
+    assert not all(np.array_equal(w, v) for w, v in zip(weights, state.iceflow_model.get_weights()))
@@ -0,0 +1,34 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+from igm.modules.process.iceflow.solve import solve_iceflow_compiled, update_iceflow_solved
+
+def test_solve_compiled(iceflow_setup):
+
+    iceflow, params, state = iceflow_setup(
+        Ny=40, Nx=30, radius=14, it=0,
+        iflo_type="solved",
+        iflo_solve_compiled=True,
+        iflo_solve_warm_start=True,
+        iflo_solve_stop_if_no_decrease=False,
+        iflo_solve_nbitmax=200,
+        iflo_solve_check_freq=5,
+        iflo_solve_tol=0.001,
+    )
+
+    update_iceflow_solved(params, state)
+
+    # the solver stops on the tolerance, at a check
+    assert 0 < state.solve_nbit < 200
+    assert (state.solve_nbit - 1) % 5 == 0
+
+    # a second solve reuses the compiled loop
+    loop = state.solve_loop
+
+    U, V, Cost_Glen = solve_iceflow_compiled(params, state, state.U, state.V)
+
+    assert state.solve_loop is loop
+    assert len(Cost_Glen) == state.solve_nbit
+    assert np.all(np.isfinite(Cost_Glen.numpy()))
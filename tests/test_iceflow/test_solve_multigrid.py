@@ -0,0 +1,24 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+from igm.modules.process.iceflow.solve import update_iceflow_solved
+
+def test_solve_multigrid(iceflow_setup):
+
+    iceflow, params, state = iceflow_setup(
+        it=0,
+        iflo_type="solved",
+        iflo_solve_nbitmax=50,
+        iflo_solve_multigrid_levels=2,
+    )
+
+    update_iceflow_solved(params, state)
+
+    # the grids are solved from the coarsest to the original one
+    assert [r["shape"] for r in state.solve_report] == [(15, 13), (30, 25), (60, 50)]
+    assert all(0 < r["iterations"] <= 50 for r in state.solve_report)
+
+    assert np.all(np.isfinite(state.U.numpy()))
+    assert np.max(np.abs(state.U.numpy())) > 0
@@ -0,0 +1,36 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+from igm.modules.process.iceflow.solve import solve_iceflow_newton
+from igm.modules.process.iceflow.energy_iceflow import iceflow_geometry, iceflow_hessian_diagonal
+
+def test_solve_newton(iceflow_setup):
+
+    iceflow, params, state = iceflow_setup(
+        Ny=40, Nx=30, radius=14, it=0,
+        iflo_type="solved",
+        iflo_solve_newton=True,
+        iflo_solve_nbitmax=20,
+    )
+
+    thk = state.thk.numpy()
+
+    U, V, Cost_Glen = solve_iceflow_newton(params, state, state.U, state.V)
+
+    # the line search ensures the decrease of the energy, the last cost being the one of the returned velocity
+    costs = np.array([c.numpy() for c in Cost_Glen])
+    assert np.all(costs[1:] <= costs[:-1])
+    assert len(costs) <= 21
+
+    assert np.all(np.isfinite(U.numpy()))
+    assert np.max(np.abs(U.numpy())) > 0
+    assert np.all(U.numpy()[:, thk == 0] == 0)
+
+    # the preconditioner is positive at the base of the ice, without Hessian-vector product
+    geometry = iceflow_geometry(params, [tf.expand_dims(vars(state)[f], axis=0) for f in params.iflo_fieldin])
+    D = iceflow_hessian_diagonal(params, U[None], V[None], geometry)
+
+    assert D.shape == (1,) + tuple(U.shape)
+    assert np.all(D.numpy()[0, 0][thk > 0] > 0)
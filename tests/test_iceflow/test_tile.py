@@ -0,0 +1,25 @@
+import igm
+import tensorflow as tf
+import numpy as np
+import pytest
+
+def test_tile_inference(iceflow_setup):
+
+    Ny, Nx = 150, 130
+
+    y, x = np.meshgrid(np.arange(Ny), np.arange(Nx), indexing="ij")
+
+    thk = (300 * np.maximum(1 - ((y - 75) ** 2 + (x - 65) ** 2) / 60 ** 2, 0)).astype("float32")
+    usurf = (2000 + 5 * y + thk).astype("float32")
+
+    __, __, state_ref = iceflow_setup(thk=thk, usurf=usurf, iflo_retrain_emulator_freq=0)
+
+    # a small memory budget, such that the domain is split in several tiles
+    __, __, state = iceflow_setup(thk=thk, usurf=usurf, iflo_retrain_emulator_freq=0,
+                                  iflo_tile_inference=True, iflo_tile_memory=2)
+
+    assert np.max(np.abs(state_ref.U.numpy())) > 1
+
+    # the stitched velocity does not depend on the tiling
+    assert np.allclose(state.U.numpy(), state_ref.U.numpy(), atol=1e-3)
+    assert np.allclose(state.V.numpy(), state_ref.V.numpy(), atol=1e-3)
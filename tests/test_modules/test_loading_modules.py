@@ -1,6 +1,8 @@
 import igm
 import pytest
 import os
+import sys
+import subprocess
 
 def test_load_valid_custom_module():
     print('s', os.getcwd())
@@ -22,3 +24,9 @@ def test_load_custom_module_folder_missing_function():
     
     with pytest.raises(AttributeError):
         __ = igm.load_modules(modules_dict)
+
+def test_lazy_loading_modules():
+    # importing igm and the core process modules should not pull in plotting or I/O packages
+    code = "import sys, igm; igm.load_modules({'modules_preproc': [], 'modules_process': ['iceflow', 'time', 'thk'], 'modules_postproc': []}); print(any(m in sys.modules for m in ['matplotlib', 'xarray', 'netCDF4']))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    assert out.stdout.strip().splitlines()[-1] == "False"
@@ -101,6 +101,17 @@ def test_params_core():
         "saved_params_filename": "params_saved",
         "url_data": "",
         "folder_data": "data",
+        "checkpoint_freq": 0,
+        "checkpoint_file": "checkpoint.npz",
+        "restart_from": "",
+        "startup_profile": False,
+        "precision": "float32",
+        "graph_step": False,
+        "graph_step_jit": False,
+        "profiling": False,
+        "profiling_sync": False,
+        "profiling_output": "profiling",
+        "profiling_tf_trace_steps": [],
     }
 
 # def test_params_core_overwrite():
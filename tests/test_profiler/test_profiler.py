@@ -0,0 +1,39 @@
+import igm
+import json
+import pytest
+
+def test_profiler(tmp_path):
+
+    state = igm.State()
+    state.profiler = igm.Profiler()
+
+    for i in range(5):
+        with igm.profile(state, "iceflow", "update"):
+            with igm.profile(state, "retrain", "update"):
+                pass
+
+    stats = state.profiler.stats()
+
+    assert stats["iceflow:update"]["count"] == 5
+    assert stats["retrain:update"]["count"] == 5
+    assert stats["iceflow:update"]["total"] >= stats["retrain:update"]["total"]
+    assert stats["iceflow:update"]["p95"] >= stats["iceflow:update"]["p50"]
+
+    prefix = str(tmp_path / "profiling")
+    state.profiler.to_json(prefix + ".json")
+    state.profiler.to_csv(prefix + ".csv")
+    state.profiler.to_chrome_trace(prefix + "-trace.json")
+
+    with open(prefix + "-trace.json") as f:
+        trace = json.load(f)
+
+    assert len(trace["traceEvents"]) == 10
+
+def test_profile_inactive():
+
+    state = igm.State()
+
+    with igm.profile(state, "iceflow"):
+        pass
+
+    assert not hasattr(state, "profiler")
@@ -0,0 +1,73 @@
+import igm
+import tensorflow as tf
+import pytest
+
+def test_scheduler():
+
+    state = igm.State()
+    state.t = tf.Variable(2000.0)
+    state.it = 0
+
+    igm.schedule(state, "clim", 2.0)
+    igm.schedule(state, "smb", 5.0, depends_on=["clim"])
+    igm.schedule(state, "erosion", 3.0, phase=2000.0)
+    igm.schedule(state, "retrain", 4, unit="it")
+
+    fired = {name: [] for name in ["clim", "smb", "erosion", "retrain", "other"]}
+
+    for it in range(10):
+        state.it = it
+        state.t.assign(2000.0 + it)
+        for name in fired.keys():
+            if state.scheduler.due(name, state):
+                fired[name].append(it)
+
+    assert fired["clim"] == [0, 2, 4, 6, 8]
+    assert fired["smb"] == fired["clim"]
+    assert fired["erosion"] == [3, 6, 9]
+    assert fired["retrain"] == [0, 4, 8]
+    assert fired["other"] == list(range(10))
+
+    assert state.scheduler.elapsed("erosion") == 3.0
+
+    # the last updates are restored from a saved state
+    scheduler = igm.Scheduler()
+    scheduler.register("clim", 2.0)
+    scheduler.load_state_dict(state.scheduler.state_dict())
+    assert not scheduler.due("clim", state)
+
+def test_scheduler_direct_update():
+
+    # a module called directly (not through run_processes) respects its frequency
+    modules = igm.load_modules({'modules_preproc': [], 'modules_process': ['glerosion'], 'modules_postproc': []})
+    glerosion = modules[0]
+
+    parser = igm.params_core()
+    for module in modules:
+        module.params(parser)
+    params, __ = parser.parse_known_args()
+    params.time_start = 2000.0
+    params.glerosion_update_freq = 2.0
+
+    state = igm.State()
+    state.t = tf.Variable(2000.0)
+    state.dt = tf.Variable(1.0)
+    state.it = 0
+    state.thk = tf.ones((4, 4))
+    state.topg = tf.zeros((4, 4))
+    state.U = tf.ones((2, 4, 4))
+    state.V = tf.zeros((2, 4, 4))
+
+    glerosion.initialize(params, state)
+
+    topg = []
+    for it in range(1, 5):
+        state.it = it
+        state.t.assign(2000.0 + it)
+        glerosion.update(params, state)
+        topg.append(float(state.topg[0, 0]))
+
+    # eroded at t=2002 and t=2004 only, each time over the 2 elapsed years
+    assert topg[0] == 0.0
+    assert topg[1] == topg[2] == pytest.approx(-2 * params.glerosion_cst)
+    assert topg[3] == pytest.approx(-4 * params.glerosion_cst)